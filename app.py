@@ -3,10 +3,20 @@
 Web 管理界面主程序
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, make_response
-from models import db, Admin, Subscription, Node, User, UserNode, UserXuiClient, Template, XuiConfig
-from parsers import ProxyParser
-from generator import ClashConfigGenerator
+from flask import (
+    Flask, render_template, request, jsonify, session, redirect, url_for, send_file, make_response, g,
+    has_request_context, has_app_context, current_app
+)
+from models import (
+    db, Admin, Subscription, Node, Sequence, User, UserNode, UserStats, UserXuiClient, Template, XuiConfig, UpstreamSource,
+    subscription_node, user_subscription as user_subscription_table
+)
+from fetcher import create_session, fetch_and_parse_many, fetch_upstream
+from db_config import configure_database, install_sqlite_pragmas
+from migrations import upgrade as upgrade_schema
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, parse_positive_int
+from parsers import ParseReport, ProxyParser
+from generator import ClashConfigGenerator, SingBoxConfigGenerator
 import os
 import secrets
 import copy
@@ -14,13 +24,18 @@ from datetime import datetime, timedelta
 from functools import wraps
 import requests as req
 import io
+import base64
 import hashlib
 import json
 import re
+import threading
 import time
 import uuid
 from urllib.parse import quote, quote_plus, urlsplit
 import yaml
+from sqlalchemy import and_, event, insert, inspect as sa_inspect, or_, select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import defer, joinedload, selectinload
 
 try:
     from yaml import CDumper as YamlDumper
@@ -29,15 +44,60 @@ except ImportError:
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///clash_manager.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)  # Session 保持 7 天
+configure_database(app)  # 数据库地址和连接池参数可由环境变量覆盖
 
 db.init_app(app)
 
+
+def _count_db_query(conn, cursor, statement, parameters, context, executemany):
+    """统计当前请求执行的 SQL 条数，写入订阅耗时日志"""
+    if has_request_context():
+        g.db_query_count = g.get('db_query_count', 0) + 1
+
+
+with app.app_context():
+    # SQLite 每个连接启用 WAL 等 PRAGMA，订阅读取不再被同步写入阻塞
+    install_sqlite_pragmas(db.engine)
+    event.listen(db.engine, 'before_cursor_execute', _count_db_query)
+
 SUBSCRIPTION_CACHE_MAX_SIZE = int(os.environ.get('SUBSCRIPTION_CACHE_MAX_SIZE', '256'))
 _subscription_cache = {}
 _subscription_cache_version = 0
+# 多实例共用数据库时，各实例通过 sequences 表中的这一行同步缓存失效
+SUBSCRIPTION_CACHE_SEQUENCE = 'subscription_cache'
+_subscription_cache_generation = None
+
+# 中间结果（规范化后的节点列表）在缓存中的 target 键，各输出格式共用。
+SUBSCRIPTION_IR_TARGET = 'proxies'
+SUBSCRIPTION_TARGETS = {
+    'clash': {'content_type': 'text/yaml; charset=utf-8', 'filename': 'clash_{name}.yaml'},
+    'base64': {'content_type': 'text/plain; charset=utf-8', 'filename': 'v2ray_{name}.txt'},
+    'singbox': {'content_type': 'application/json; charset=utf-8', 'filename': 'sing-box_{name}.json'},
+}
+OUTPUT_STYLES = ('block', 'json')
+SUBSCRIPTION_TARGET_ALIASES = {
+    'clash-meta': 'clash',
+    'mihomo': 'clash',
+    'v2ray': 'base64',
+    'sing-box': 'singbox',
+}
+
+# 批量导入时每批按指纹查询已有节点的数量，避免 IN 子句过长
+IMPORT_UPSERT_BATCH_SIZE = 500
+
+# 上游订阅源定时刷新
+UPSTREAM_REFRESH_DEFAULT_INTERVAL = 3600
+UPSTREAM_REFRESH_MIN_INTERVAL = 60
+UPSTREAM_REFRESH_POLL_SECONDS = int(os.environ.get('UPSTREAM_REFRESH_POLL_SECONDS', '60'))
+UPSTREAM_FETCH_TIMEOUT = 30
+# 批量导入一次最多接受的订阅链接数，以及并发拉取的线程数（同时也是连接池大小）
+IMPORT_MAX_URLS = 100
+IMPORT_FETCH_WORKERS = int(os.environ.get('IMPORT_FETCH_WORKERS', '8'))
+_http_session = create_session(IMPORT_FETCH_WORKERS)
+_upstream_refresher = None
+_upstream_refresher_stop = threading.Event()
 
 
 def _dump_yaml_bytes(config):
@@ -52,17 +112,168 @@ def _dump_yaml_bytes(config):
     return yaml_content.encode('utf-8')
 
 
-def _invalidate_subscription_cache(reason='api-write'):
-    """清空订阅缓存。"""
+def _dump_json_yaml_bytes(config):
+    """
+    输出 JSON 兼容的 YAML（JSON 是 YAML 的子集，Clash Meta 可直接解析）。
+
+    键顺序沿用配置字典的插入顺序，相同配置得到相同字节，ETag 保持稳定。
+    模板中 YAML 特有的标量（如日期）按字符串输出。
+    """
+    return json.dumps(
+        config,
+        ensure_ascii=False,
+        separators=(',', ':'),
+        default=str
+    ).encode('utf-8')
+
+
+def _dump_config_key(key, value, output_style='block'):
+    """序列化单个顶层键；json 风格不含外层花括号，便于拼接。"""
+    if output_style == 'json':
+        return _dump_json_yaml_bytes({key: value})[1:-1]
+    return _dump_yaml_bytes({key: value})
+
+
+def _dump_proxy_segments(proxies, output_style='block'):
+    """
+    逐节点序列化 proxies 列表项。
+
+    block 风格先整体序列化再按顶层列表项（行首 '- '）切分，避免为每个节点创建 Dumper；
+    切分数量不符时退回逐项序列化。
+    """
+    if output_style == 'json':
+        return [_dump_json_yaml_bytes(proxy) for proxy in proxies]
+
+    body = _dump_yaml_bytes(proxies)
+    starts = [0]
+    index = body.find(b'\n- ')
+    while index != -1:
+        starts.append(index + 1)
+        index = body.find(b'\n- ', index + 1)
+    if len(starts) != len(proxies):
+        return [_dump_yaml_bytes([proxy]) for proxy in proxies]
+
+    starts.append(len(body))
+    return [body[starts[index]:starts[index + 1]] for index in range(len(proxies))]
+
+
+def _render_clash_layout(generator, config, output_style='block'):
+    """
+    将 Clash 配置渲染为可局部替换的分段结构。
+
+    parts 为各顶层键序列化后的字节，proxies 段为 None 占位，由逐节点的 segments 拼接。
+    默认配置的静态前缀（基础设置和 DNS）和规则后缀按输出风格缓存字节。
+    """
+    keys = list(config)
+    static_parts = generator.split_static_sections(config)
+    if static_parts is not None:
+        head, _, tail = static_parts
+        serialized = generator.static_sections['serialized']
+        cached = serialized.get(output_style)
+        if cached is None:
+            cached = (
+                b','.join(_dump_config_key(key, value, output_style) for key, value in head.items())
+                if output_style == 'json' else _dump_yaml_bytes(head),
+                _dump_config_key('rules', tail['rules'], output_style),
+            )
+            serialized[output_style] = cached
+        keys = [cached[0], 'proxies', 'proxy-groups', cached[1]]
+
+    parts = []
+    proxies_part = None
+    groups_part = None
+    for key in keys:
+        if isinstance(key, bytes):
+            parts.append(key)
+            continue
+        if key == 'proxies':
+            proxies_part = len(parts)
+            parts.append(None)
+            continue
+        if key == 'proxy-groups':
+            groups_part = len(parts)
+        parts.append(_dump_config_key(key, config[key], output_style))
+
+    proxies = config.get('proxies') or []
+    return {
+        'style': output_style,
+        'parts': parts,
+        'proxies_part': proxies_part,
+        'groups_part': groups_part,
+        'segments': _dump_proxy_segments(proxies, output_style),
+        'positions': {proxy['name']: index for index, proxy in enumerate(proxies)},
+    }
+
+
+def _join_clash_layout(layout):
+    """按分段结构拼出完整响应体，结果与整体序列化逐字节一致。"""
+    parts = list(layout['parts'])
+    if layout['style'] == 'json':
+        parts[layout['proxies_part']] = b'"proxies":[' + b','.join(layout['segments']) + b']'
+        return b'{' + b','.join(parts) + b'}'
+
+    parts[layout['proxies_part']] = b'proxies:\n' + b''.join(layout['segments'])
+    return b''.join(parts)
+
+
+def _dump_clash_config(generator, config, output_style='block'):
+    """序列化 Clash 配置。"""
+    return _join_clash_layout(_render_clash_layout(generator, config, output_style))
+
+
+def _invalidate_subscription_cache(reason='api-write', publish=True):
+    """清空订阅缓存；publish 时同时通知共用数据库的其他实例。"""
     global _subscription_cache_version
     _subscription_cache_version += 1
     if _subscription_cache:
         _subscription_cache.clear()
     app.logger.debug("subscription cache invalidated: reason=%s version=%s", reason, _subscription_cache_version)
+    if publish:
+        _publish_subscription_cache_change()
+
+
+def _publish_subscription_cache_change(keep_local=False):
+    """
+    递增数据库中的共享缓存代数，其他实例下次读缓存时发现代数变化会清空本地缓存。
+
+    keep_local 表示本实例的缓存已就地更新：期间没有其他实例写入（代数正好加一）时继续使用，
+    否则同样清空。
+    """
+    global _subscription_cache_generation
+    if not has_app_context():
+        # 没有活动的应用上下文时不知道该通知哪个数据库，只清本地缓存
+        return
+    try:
+        with db.engine.begin() as conn:
+            generation = _advance_sequence(SUBSCRIPTION_CACHE_SEQUENCE, 1, executor=conn)
+    except DBAPIError as e:
+        current_app.logger.warning("subscription cache generation not published: %s", e)
+        return
+    if keep_local and generation != (_subscription_cache_generation or 0) + 1:
+        _invalidate_subscription_cache('shared-generation', publish=False)
+    _subscription_cache_generation = generation
 
 
-def _get_subscription_cache(cache_type, entity_id):
-    cache_key = (cache_type, entity_id)
+def _sync_subscription_cache_generation():
+    """读缓存前对齐共享缓存代数，每个请求只查询一次。"""
+    global _subscription_cache_generation
+    if has_request_context():
+        if g.get('subscription_cache_synced'):
+            return
+        g.subscription_cache_synced = True
+    table = Sequence.__table__
+    generation = db.session.execute(
+        select(table.c.value).where(table.c.name == SUBSCRIPTION_CACHE_SEQUENCE)
+    ).scalar() or 0
+    if generation != _subscription_cache_generation:
+        if _subscription_cache_generation is not None:
+            _invalidate_subscription_cache('shared-generation', publish=False)
+        _subscription_cache_generation = generation
+
+
+def _get_subscription_cache(cache_type, entity_id, target='clash'):
+    _sync_subscription_cache_generation()
+    cache_key = (cache_type, entity_id, target)
     cache_entry = _subscription_cache.get(cache_key)
     if not cache_entry:
         return None
@@ -74,7 +285,7 @@ def _get_subscription_cache(cache_type, entity_id):
     return cache_entry
 
 
-def _store_subscription_cache(cache_type, entity_id, cache_entry):
+def _store_subscription_cache(cache_type, entity_id, cache_entry, target='clash'):
     cache_entry['version'] = _subscription_cache_version
 
     if SUBSCRIPTION_CACHE_MAX_SIZE <= 0:
@@ -84,10 +295,16 @@ def _store_subscription_cache(cache_type, entity_id, cache_entry):
         oldest_key = next(iter(_subscription_cache))
         _subscription_cache.pop(oldest_key, None)
 
-    _subscription_cache[(cache_type, entity_id)] = cache_entry
+    _subscription_cache[(cache_type, entity_id, target)] = cache_entry
     return cache_entry
 
 
+def _drop_subscription_cache(cache_type, entity_id):
+    """移除某个实体的中间结果及所有格式的渲染结果。"""
+    for cache_key in [key for key in _subscription_cache if key[:2] == (cache_type, entity_id)]:
+        _subscription_cache.pop(cache_key, None)
+
+
 class XuiApiError(Exception):
     """3x-ui 远程调用错误。"""
 
@@ -391,6 +608,15 @@ def _gb_to_bytes(value, default=0):
     return int(numeric_value * 1024 * 1024 * 1024)
 
 
+def _normalize_output_style(value, allow_empty=False):
+    if value in (None, ''):
+        return None if allow_empty else 'block'
+    style = str(value).strip().lower()
+    if style not in OUTPUT_STYLES:
+        raise ValueError('输出风格只能是 block 或 json')
+    return style
+
+
 def _bytes_to_gb(value):
     try:
         bytes_value = int(value or 0)
@@ -1339,20 +1565,25 @@ def _sync_user_xui_clients_if_stale(user, max_age_seconds=60):
         app.logger.warning("best-effort 3x-ui user sync failed: %s", e)
 
 
+def _user_xui_client_active_state(mapping):
+    """客户端有效时返回入站状态，已禁用、过期或流量耗尽时返回 None"""
+    if not mapping.enabled:
+        return None
+    inbound_state = _user_xui_inbound_state(mapping)
+    if not inbound_state['enable']:
+        return None
+    if inbound_state['expired']:
+        return None
+    if inbound_state['exhausted']:
+        return None
+    return inbound_state
+
+
 def _active_user_xui_clients(user):
-    result = []
-    for mapping in getattr(user, 'xui_clients', []) or []:
-        if not mapping.enabled:
-            continue
-        inbound_state = _user_xui_inbound_state(mapping)
-        if not inbound_state['enable']:
-            continue
-        if inbound_state['expired']:
-            continue
-        if inbound_state['exhausted']:
-            continue
-        result.append(mapping)
-    return result
+    return [
+        mapping for mapping in getattr(user, 'xui_clients', []) or []
+        if _user_xui_client_active_state(mapping) is not None
+    ]
 
 
 def _serialize_user_xui_client(mapping):
@@ -1729,9 +1960,16 @@ def _request_etag_matches(etag):
     return False
 
 
+def _resolve_subscription_target():
+    """解析 ?target= 参数，未知格式返回 None。"""
+    target = (request.args.get('target') or 'clash').strip().lower()
+    target = SUBSCRIPTION_TARGET_ALIASES.get(target, target)
+    return target if target in SUBSCRIPTION_TARGETS else None
+
+
 def _apply_subscription_headers(response, cache_entry, cache_status):
     encoded_filename = quote(cache_entry['filename'])
-    response.headers['Content-Type'] = 'text/yaml; charset=utf-8'
+    response.headers['Content-Type'] = cache_entry.get('content_type') or SUBSCRIPTION_TARGETS['clash']['content_type']
     response.headers['Content-Disposition'] = (
         f"attachment; filename={encoded_filename}; filename*=UTF-8''{encoded_filename}"
     )
@@ -1756,7 +1994,7 @@ def _make_subscription_response(cache_entry, cache_status):
 def _log_subscription_timing(cache_type, name, cache_status, stats, started_at):
     total_ms = (time.perf_counter() - started_at) * 1000
     app.logger.info(
-        "subscription cache=%s type=%s name=%s nodes=%s proxies=%s bytes=%s "
+        "subscription cache=%s type=%s name=%s nodes=%s proxies=%s bytes=%s queries=%s "
         "collect_ms=%.2f deps_ms=%.2f generate_ms=%.2f yaml_ms=%.2f total_ms=%.2f",
         cache_status,
         cache_type,
@@ -1764,6 +2002,7 @@ def _log_subscription_timing(cache_type, name, cache_status, stats, started_at):
         stats.get('node_count', 0),
         stats.get('proxy_count', 0),
         stats.get('yaml_bytes', 0),
+        g.get('db_query_count', 0),
         stats.get('collect_ms', 0),
         stats.get('deps_ms', 0),
         stats.get('generate_ms', 0),
@@ -1772,55 +2011,294 @@ def _log_subscription_timing(cache_type, name, cache_status, stats, started_at):
     )
 
 
-def _build_subscription_cache_entry(
+def _build_subscription_ir(
     cache_type,
     entity_id,
-    name,
-    filename,
     nodes,
     proxy_group_name,
     template_content,
-    subscription_userinfo=None,
     extra_proxies=None,
-    store=True
+    store=True,
+    output_style='block'
 ):
-    stats = {}
+    """
+    构建与输出格式无关的中间结果。
 
+    包含链式依赖展开后的节点列表和生成参数，缓存后各输出格式直接复用，
+    新增格式不会重复查询数据库和解析节点配置。
+    """
     deps_start = time.perf_counter()
-    proxies = _build_proxy_configs_with_chain_dependencies(nodes)
+    proxy_entries = _build_proxy_entries_with_chain_dependencies(nodes)
     if extra_proxies:
-        proxies.extend(copy.deepcopy(extra_proxies))
-    stats['deps_ms'] = (time.perf_counter() - deps_start) * 1000
+        proxy_entries.extend((None, proxy) for proxy in copy.deepcopy(extra_proxies))
+
+    proxies = []
+    node_positions = {}
+    name_owners = {}
+    dependency_names = set()
+    for position, (node_id, proxy) in enumerate(proxy_entries):
+        proxies.append(proxy)
+        if node_id is not None:
+            node_positions[node_id] = position
+        proxy_name = proxy.get('name')
+        if proxy_name and proxy_name not in name_owners:
+            name_owners[proxy_name] = node_id
+        dependency_names.update(_get_chain_dependency_names(proxy))
+
+    ir_entry = {
+        'proxies': proxies,
+        # 以下索引供单节点变更时就地更新缓存使用
+        'node_positions': node_positions,
+        'name_owners': name_owners,
+        'dependency_names': dependency_names,
+        'proxy_group_name': proxy_group_name,
+        'template_content': template_content,
+        'output_style': output_style,
+        'stats': {
+            'deps_ms': (time.perf_counter() - deps_start) * 1000,
+            'node_count': len(nodes),
+            'extra_proxy_count': len(extra_proxies or []),
+        },
+    }
+
+    if not store:
+        ir_entry['version'] = _subscription_cache_version
+        return ir_entry
+
+    return _store_subscription_cache(cache_type, entity_id, ir_entry, SUBSCRIPTION_IR_TARGET)
+
+
+def _render_share_links(proxies):
+    """渲染 base64 分享链接列表；隐藏依赖节点和链式节点无法用分享链接表达，直接跳过。"""
+    links = []
+    for proxy in proxies:
+        if proxy.get('__hidden') is True or proxy.get('dialer-proxy'):
+            continue
+        try:
+            links.append(ProxyParser.to_share_url(proxy))
+        except ValueError:
+            continue
+    return base64.b64encode('\n'.join(links).encode('utf-8')), len(links)
+
+
+def _render_subscription_entry(
+    cache_type,
+    entity_id,
+    name,
+    ir_entry,
+    target='clash',
+    subscription_userinfo=None,
+    store=True
+):
+    """按指定格式渲染中间结果并缓存渲染后的响应体。"""
+    proxies = ir_entry['proxies']
+    proxy_group_name = ir_entry['proxy_group_name']
+    stats = {
+        'node_count': ir_entry['stats'].get('node_count', 0),
+        'extra_proxy_count': ir_entry['stats'].get('extra_proxy_count', 0),
+    }
 
     generate_start = time.perf_counter()
-    generator = ClashConfigGenerator()
-    config = generator.generate(proxies, proxy_group_name, template_content)
+    config = None
+    if target == 'clash':
+        generator = ClashConfigGenerator()
+        config = generator.generate(proxies, proxy_group_name, ir_entry['template_content'])
+    elif target == 'singbox':
+        config = SingBoxConfigGenerator().generate(proxies, proxy_group_name)
     stats['generate_ms'] = (time.perf_counter() - generate_start) * 1000
 
     yaml_start = time.perf_counter()
-    yaml_body = _dump_yaml_bytes(config)
+    layout = None
+    if target == 'clash':
+        layout = _render_clash_layout(generator, config, ir_entry.get('output_style') or 'block')
+        body = _join_clash_layout(layout)
+        proxy_count = len(config.get('proxies', []))
+    elif target == 'singbox':
+        body = json.dumps(config, ensure_ascii=False, indent=2).encode('utf-8')
+        proxy_count = sum(1 for outbound in config['outbounds'] if 'server' in outbound)
+    else:
+        body, proxy_count = _render_share_links(proxies)
     stats['yaml_ms'] = (time.perf_counter() - yaml_start) * 1000
 
-    stats['node_count'] = len(nodes)
-    stats['extra_proxy_count'] = len(extra_proxies or [])
-    stats['proxy_count'] = len(config.get('proxies', []))
-    stats['yaml_bytes'] = len(yaml_body)
+    stats['proxy_count'] = proxy_count
+    stats['yaml_bytes'] = len(body)
 
+    target_spec = SUBSCRIPTION_TARGETS[target]
     cache_entry = {
-        'body': yaml_body,
-        'etag': hashlib.sha256(yaml_body).hexdigest(),
-        'filename': filename,
+        'body': body,
+        'etag': hashlib.sha256(body).hexdigest(),
+        'filename': target_spec['filename'].format(name=name),
+        'content_type': target_spec['content_type'],
         'name': name,
-        'yaml_bytes': len(yaml_body),
+        'target': target,
+        'yaml_bytes': len(body),
         'stats': stats,
         'subscription_userinfo': subscription_userinfo or 'upload=0; download=0; total=0; expire=0',
     }
+    if layout is not None:
+        cache_entry['layout'] = layout
 
     if not store:
         cache_entry['version'] = _subscription_cache_version
         return cache_entry
 
-    return _store_subscription_cache(cache_type, entity_id, cache_entry)
+    return _store_subscription_cache(cache_type, entity_id, cache_entry, target)
+
+
+def _build_subscription_cache_entry(
+    cache_type,
+    entity_id,
+    name,
+    nodes,
+    proxy_group_name,
+    template_content,
+    subscription_userinfo=None,
+    extra_proxies=None,
+    store=True,
+    target='clash',
+    output_style='block'
+):
+    ir_entry = _build_subscription_ir(
+        cache_type,
+        entity_id,
+        nodes,
+        proxy_group_name,
+        template_content,
+        extra_proxies=extra_proxies,
+        store=store,
+        output_style=output_style
+    )
+    cache_entry = _render_subscription_entry(
+        cache_type,
+        entity_id,
+        name,
+        ir_entry,
+        target=target,
+        subscription_userinfo=subscription_userinfo,
+        store=store
+    )
+    cache_entry['stats']['deps_ms'] = ir_entry['stats']['deps_ms']
+    return cache_entry
+
+
+def _patch_clash_entry(entry, ir_entry, previous_name, proxy):
+    """替换 Clash 渲染结果中单个节点的分段，改名时重建代理组分段；返回新的缓存条目。"""
+    layout = entry['layout']
+    segment_index = layout['positions'].get(previous_name)
+    if segment_index is None:
+        return None
+
+    generator = ClashConfigGenerator()
+    segments = list(layout['segments'])
+    segments[segment_index] = _dump_proxy_segments(
+        [generator._strip_internal_fields(proxy)],
+        layout['style']
+    )[0]
+    new_layout = dict(layout, segments=segments)
+
+    if proxy['name'] != previous_name:
+        # 模板可能在代理组以外的位置引用节点名称，改名时整体重新渲染。
+        if ir_entry['template_content'] or layout['groups_part'] is None:
+            return None
+        positions = dict(layout['positions'])
+        positions[proxy['name']] = positions.pop(previous_name)
+        new_layout['positions'] = positions
+        config = generator.generate(ir_entry['proxies'], ir_entry['proxy_group_name'])
+        parts = list(layout['parts'])
+        parts[layout['groups_part']] = _dump_config_key('proxy-groups', config['proxy-groups'], layout['style'])
+        new_layout['parts'] = parts
+
+    body = _join_clash_layout(new_layout)
+    stats = dict(entry.get('stats') or {}, yaml_bytes=len(body))
+    return dict(
+        entry,
+        body=body,
+        etag=hashlib.sha256(body).hexdigest(),
+        yaml_bytes=len(body),
+        stats=stats,
+        layout=new_layout
+    )
+
+
+def _patch_subscription_cache_for_node(node, previous_config, previous_node_name):
+    """
+    节点配置或名称变更后，就地更新包含该节点的缓存订阅。
+
+    只重新序列化该节点对应的 proxies 分段，改名时另外重建代理组分段；
+    其他格式的渲染结果会被移除，下次请求时从已更新的中间结果重新渲染。
+    链式依赖可能变化（依赖列表改变、被其他节点按名称引用、改名后重名）的实体
+    直接移除，下次请求时完整重建。调用后本次请求不再全量清空订阅缓存。
+    """
+    new_config = node.get_config()
+    previous_name = previous_config.get('name')
+    new_name = new_config.get('name')
+    touched_names = {previous_name, previous_node_name, new_name, node.name} - {None, ''}
+    renamed = (previous_name, previous_node_name) != (new_name, node.name)
+    dependencies_changed = _get_chain_dependency_names(previous_config) != _get_chain_dependency_names(new_config)
+
+    ir_keys = [
+        key for key, entry in _subscription_cache.items()
+        if key[2] == SUBSCRIPTION_IR_TARGET and entry.get('version') == _subscription_cache_version
+    ]
+    entities_with_ir = {key[:2] for key in ir_keys}
+    # 中间结果已被淘汰的渲染结果无法判断是否包含该节点，直接移除。
+    for key in [key for key in _subscription_cache if key[:2] not in entities_with_ir]:
+        _subscription_cache.pop(key, None)
+
+    patched = 0
+    for ir_key in ir_keys:
+        entity = ir_key[:2]
+        ir_entry = _subscription_cache.get(ir_key)
+        if not ir_entry:
+            continue
+
+        dependency_names = ir_entry['dependency_names']
+        references_node = renamed and bool(touched_names & dependency_names)
+        position = ir_entry['node_positions'].get(node.id)
+        if position is None:
+            if references_node:
+                _drop_subscription_cache(*entity)
+            continue
+
+        name_owners = ir_entry['name_owners']
+        if (
+            not new_name
+            or dependencies_changed
+            or references_node
+            or name_owners.get(previous_name, False) != node.id
+            or (new_name != previous_name and new_name in name_owners)
+        ):
+            _drop_subscription_cache(*entity)
+            continue
+
+        proxy = node.get_config()
+        if ir_entry['proxies'][position].get('__hidden') is True:
+            proxy['__hidden'] = True
+        proxies = list(ir_entry['proxies'])
+        proxies[position] = proxy
+        if new_name != previous_name:
+            name_owners = dict(name_owners)
+            name_owners.pop(previous_name, None)
+            name_owners[new_name] = node.id
+        new_ir_entry = dict(ir_entry, proxies=proxies, name_owners=name_owners)
+        _subscription_cache[ir_key] = new_ir_entry
+
+        for target in SUBSCRIPTION_TARGETS:
+            cache_key = (entity[0], entity[1], target)
+            entry = _subscription_cache.get(cache_key)
+            if not entry:
+                continue
+            new_entry = None
+            if 'layout' in entry:
+                new_entry = _patch_clash_entry(entry, new_ir_entry, previous_name, proxy)
+            if new_entry is None:
+                _subscription_cache.pop(cache_key, None)
+            else:
+                _subscription_cache[cache_key] = new_entry
+        patched += 1
+
+    g.subscription_cache_patched = True
+    app.logger.debug("subscription cache patched: node=%s entities=%s", node.id, patched)
 
 
 @app.after_request
@@ -1830,7 +2308,10 @@ def clear_subscription_cache_after_api_write(response):
         and request.method in {'POST', 'PUT', 'DELETE'}
         and response.status_code < 400
     ):
-        _invalidate_subscription_cache(f'{request.method} {request.path}')
+        if g.get('subscription_cache_patched'):
+            _publish_subscription_cache_change(keep_local=True)
+        else:
+            _invalidate_subscription_cache(f'{request.method} {request.path}')
 
     return response
 
@@ -1848,33 +2329,7 @@ def _dedupe_preserve_order(items):
 
 def _get_chain_dependency_names(config):
     """提取链式节点依赖的前置/后置节点名称。"""
-    if not isinstance(config, dict):
-        return []
-
-    dependency_names = []
-
-    # 旧 relay 方式通过 proxies 数组引用前置和后置节点。
-    relay_proxies = config.get('proxies') if config.get('type') == 'relay' else None
-    if isinstance(relay_proxies, list):
-        dependency_names.extend([
-            proxy for proxy in relay_proxies
-            if isinstance(proxy, str) and proxy
-        ])
-
-    # 新 dialer-proxy 方式至少需要前置节点存在于 proxies 中。
-    dialer_proxy = config.get('dialer-proxy')
-    if isinstance(dialer_proxy, str) and dialer_proxy:
-        dependency_names.append(dialer_proxy)
-
-    # 新创建的链式节点会记录原始前置/后置节点，供订阅生成时隐藏写入。
-    explicit_dependencies = config.get('__chain_dependencies')
-    if isinstance(explicit_dependencies, list):
-        dependency_names.extend([
-            proxy for proxy in explicit_dependencies
-            if isinstance(proxy, str) and proxy
-        ])
-
-    return _dedupe_preserve_order(dependency_names)
+    return Node.extract_chain_dependencies(config)
 
 
 def _dedupe_nodes(nodes):
@@ -1915,9 +2370,14 @@ def _build_proxy_configs_with_chain_dependencies(nodes):
     传入的节点会作为可展示节点进入代理组；链式节点依赖的前置/后置节点
     会以隐藏节点追加到 proxies 中，只用于满足客户端解析依赖。
     """
+    return [config for _, config in _build_proxy_entries_with_chain_dependencies(nodes)]
+
+
+def _build_proxy_entries_with_chain_dependencies(nodes):
+    """与 _build_proxy_configs_with_chain_dependencies 相同，但返回 (节点 ID, 配置) 列表。"""
     visible_nodes = _dedupe_nodes(nodes)
     visible_entries = []
-    proxy_configs = []
+    proxy_entries = []
     included_names = set()
     pending_dependency_names = []
 
@@ -1925,13 +2385,13 @@ def _build_proxy_configs_with_chain_dependencies(nodes):
         config = node.get_config()
         config_name = config.get('name') or node.name
 
-        visible_entries.append((config_name, config))
+        visible_entries.append((node.id, config_name, config))
         pending_dependency_names.extend(_get_chain_dependency_names(config))
 
-    for config_name, config in visible_entries:
+    for node_id, config_name, config in visible_entries:
         # Nodes passed in here are explicitly assigned to this output and must
         # remain selectable, even when another chain node depends on them.
-        proxy_configs.append(config)
+        proxy_entries.append((node_id, config))
 
         if config_name:
             included_names.add(config_name)
@@ -1959,12 +2419,12 @@ def _build_proxy_configs_with_chain_dependencies(nodes):
                 continue
 
             dependency_config['__hidden'] = True
-            proxy_configs.append(dependency_config)
+            proxy_entries.append((dependency_node.id, dependency_config))
             included_names.add(dependency_name)
 
             pending_dependency_names.extend(_get_chain_dependency_names(dependency_config))
 
-    return proxy_configs
+    return proxy_entries
 
 
 def login_required(f):
@@ -2204,13 +2664,12 @@ def _create_node_from_proxy(proxy, custom_name=None, subscription_id=None):
     if custom_name:
         proxy['name'] = custom_name
 
-    max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
     node = Node(
         name=node_name,
         original_name=original_name,
         protocol=proxy['type'],
         subscription_id=subscription_id,
-        order=max_order + 1
+        order=_allocate_node_orders(1)
     )
     node.set_config(proxy)
     db.session.add(node)
@@ -2239,34 +2698,183 @@ def _recalculate_user_traffic_used(user):
     return user.traffic_used
 
 
+# 节点列表可排序字段，id 作为同值时的稳定次序
+NODE_LIST_SORT_COLUMNS = {
+    'order': db.func.coalesce(Node.order, 0),
+    'name': Node.name,
+    'protocol': Node.protocol,
+    'created_at': Node.created_at,
+}
+
+
+def _list_sort_arg(args, columns, default):
+    """解析 sort / direction 参数，返回 (排序列, 是否倒序)"""
+    sort = args.get('sort') or default
+    if sort not in columns:
+        raise ValueError(f'sort 只能是 {", ".join(columns)}')
+    return columns[sort], (args.get('direction') or 'asc').lower() == 'desc'
+
+
+def _order_list_query(query, sort_column, id_column, descending):
+    if descending:
+        return query.order_by(sort_column.desc(), id_column.desc())
+    return query.order_by(sort_column.asc(), id_column.asc())
+
+
+def _list_page_response(query, args, sort_columns, default_sort, id_column, serialize):
+    """
+    按请求参数分页返回列表
+
+    传 cursor 或 limit 时使用游标分页，返回 items 和 next_cursor；
+    传 page 或 per_page 时使用页码分页并返回总数；都不传时返回 None，由调用方返回完整数组（旧接口）。
+    参数错误时抛出 ValueError。
+    """
+    sort_column, descending = _list_sort_arg(args, sort_columns, default_sort)
+
+    if 'cursor' in args or 'limit' in args:
+        limit = parse_positive_int(args.get('limit'), DEFAULT_PAGE_SIZE, 'limit', MAX_PAGE_SIZE)
+        rows, next_cursor = keyset_page(query, sort_column, id_column, args.get('cursor'), limit, descending)
+        return {'items': serialize(rows), 'next_cursor': next_cursor, 'limit': limit}
+
+    if 'page' in args or 'per_page' in args:
+        page = parse_positive_int(args.get('page'), 1, 'page')
+        per_page = parse_positive_int(args.get('per_page'), DEFAULT_PAGE_SIZE, 'per_page', MAX_PAGE_SIZE)
+        total = query.count()
+        rows = _order_list_query(query, sort_column, id_column, descending).limit(per_page).offset((page - 1) * per_page).all()
+        return {
+            'items': serialize(rows),
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page
+        }
+
+    return None
+
+
+def _filter_node_listing(query, args):
+    """按名称关键字、协议、订阅分组、服务器地址和链式节点筛选节点列表"""
+    keyword = (args.get('q') or '').strip().lower()
+    if keyword:
+        query = query.filter(or_(
+            db.func.lower(Node.name).contains(keyword, autoescape=True),
+            db.func.lower(Node.original_name).contains(keyword, autoescape=True)
+        ))
+
+    protocol = (args.get('protocol') or '').strip().lower()
+    if protocol:
+        query = query.filter(Node.protocol == protocol)
+
+    subscription_id = (args.get('subscription_id') or '').strip()
+    if subscription_id == 'none':
+        query = query.filter(~Node.subscriptions.any())
+    elif subscription_id:
+        try:
+            query = query.filter(Node.subscriptions.any(Subscription.id == int(subscription_id)))
+        except ValueError:
+            raise ValueError('subscription_id 必须是整数或 none')
+
+    server = (args.get('server') or '').strip()
+    if server:
+        query = query.filter(Node.server == server)
+
+    if args.get('chain') in ('1', 'true'):
+        query = query.filter(or_(Node.protocol == 'relay', Node.dialer_proxy.isnot(None)))
+    dialer_proxy = (args.get('dialer_proxy') or '').strip()
+    if dialer_proxy:
+        query = query.filter(Node.dialer_proxy == dialer_proxy)
+    return query
+
+
+def _serialize_node_listing(nodes, scoped=True):
+    """
+    用三条聚合查询补齐节点所属订阅和用户，避免逐个节点访问关联关系
+
+    Args:
+        nodes: 当前页的节点
+        scoped: 为 False 时表示 nodes 是全部节点，关联查询不再按节点 ID 过滤
+    """
+    node_ids = [node.id for node in nodes]
+    if not node_ids:
+        return []
+
+    memberships = db.session.query(
+        subscription_node.c.node_id, Subscription.id, Subscription.name
+    ).join(Subscription, Subscription.id == subscription_node.c.subscription_id)
+    if scoped:
+        memberships = memberships.filter(subscription_node.c.node_id.in_(node_ids))
+    subscriptions_by_node = {}
+    subscription_ids = set()
+    for node_id, subscription_id, subscription_name in memberships.order_by(Subscription.id):
+        subscriptions_by_node.setdefault(node_id, []).append((subscription_id, subscription_name))
+        subscription_ids.add(subscription_id)
+
+    users_by_subscription = {}
+    if subscription_ids:
+        subscription_users = db.session.query(
+            user_subscription_table.c.subscription_id, User.username
+        ).join(User, User.id == user_subscription_table.c.user_id)
+        if scoped:
+            subscription_users = subscription_users.filter(
+                user_subscription_table.c.subscription_id.in_(subscription_ids)
+            )
+        for subscription_id, username in subscription_users:
+            users_by_subscription.setdefault(subscription_id, []).append(username)
+
+    direct_users = db.session.query(UserNode.node_id, User.username).join(User, User.id == UserNode.user_id)
+    if scoped:
+        direct_users = direct_users.filter(UserNode.node_id.in_(node_ids))
+    direct_users_by_node = {}
+    for node_id, username in direct_users:
+        direct_users_by_node.setdefault(node_id, []).append(username)
+
+    result = []
+    for n in nodes:
+        node_subscriptions = subscriptions_by_node.get(n.id, [])
+        user_names = set(direct_users_by_node.get(n.id, []))
+        for subscription_id, _ in node_subscriptions:
+            user_names.update(users_by_subscription.get(subscription_id, []))
+        result.append({
+            'id': n.id,
+            'name': n.name,
+            'original_name': n.original_name,
+            'protocol': n.protocol,
+            'subscription_id': n.subscription_id,  # 保留用于兼容性
+            'subscription_name': ', '.join(name for _, name in node_subscriptions) if node_subscriptions else '手动添加',
+            'subscription_names': [name for _, name in node_subscriptions],  # 所有订阅名称列表
+            'subscription_ids': [subscription_id for subscription_id, _ in node_subscriptions],  # 所有订阅ID列表
+            'user_names': sorted(user_names),
+            'order': n.order or 0,
+            'dialer_proxy': n.dialer_proxy,  # dialer-proxy 前置节点名称
+            'created_at': n.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return result
+
+
 @app.route('/api/nodes', methods=['GET', 'POST'])
 @login_required
 def manage_nodes():
     """获取或添加节点"""
     if request.method == 'GET':
-        # 按排序字段排序
-        nodes = Node.query.order_by(Node.order.asc(), Node.id.asc()).all()
-        result = []
-        for n in nodes:
-            config = n.get_config()
-            dialer_proxy = config.get('dialer-proxy') if config else None
-            subscription_user_names = [u.username for s in n.subscriptions for u in s.users] if n.subscriptions else []
-            direct_user_names = [assignment.user.username for assignment in n.user_assignments if assignment.user]
-            result.append({
-                'id': n.id,
-                'name': n.name,
-                'original_name': n.original_name,
-                'protocol': n.protocol,
-                'subscription_id': n.subscription_id,  # 保留用于兼容性
-                'subscription_name': ', '.join([s.name for s in n.subscriptions]) if n.subscriptions else '手动添加',
-                'subscription_names': [s.name for s in n.subscriptions],  # 新增：所有订阅名称列表
-                'subscription_ids': [s.id for s in n.subscriptions],  # 新增：所有订阅ID列表
-                'user_names': sorted(set(subscription_user_names + direct_user_names)),
-                'order': n.order if hasattr(n, 'order') else 0,
-                'dialer_proxy': dialer_proxy,  # 新增：dialer-proxy 前置节点名称
-                'created_at': n.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            })
-        return jsonify(result)
+        # 列表只读取展示字段，不加载节点配置
+        query = Node.query.options(defer(Node.config))
+        try:
+            query = _filter_node_listing(query, request.args)
+            page = _list_page_response(
+                query, request.args, NODE_LIST_SORT_COLUMNS, 'order', Node.id, _serialize_node_listing
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        if page is not None:
+            return jsonify(page)
+
+        # 未传分页参数时保持旧接口：返回全部节点数组
+        filtered = any(
+            request.args.get(key) for key in ('q', 'protocol', 'subscription_id', 'server', 'chain', 'dialer_proxy')
+        )
+        sort_column, descending = _list_sort_arg(request.args, NODE_LIST_SORT_COLUMNS, 'order')
+        query = _order_list_query(query, sort_column, Node.id, descending)
+        return jsonify(_serialize_node_listing(query.all(), scoped=filtered))
     
     # POST - 添加单个节点
     data = request.get_json()
@@ -2335,15 +2943,15 @@ def manage_nodes():
     if custom_name:
         proxy['name'] = custom_name
     
-    # 获取当前最大排序值，新节点排在最后，从1开始
-    max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
+    # 新节点排在最后
+    order = _allocate_node_orders(1)
     
     node = Node(
         name=node_name,
         original_name=original_name,
         protocol=proxy['type'],
         subscription_id=subscription_id,
-        order=max_order + 1
+        order=order
     )
     node.set_config(proxy)
     
@@ -2363,64 +2971,561 @@ def manage_nodes():
 @app.route('/api/nodes/batch-import', methods=['POST'])
 @login_required
 def batch_import_nodes():
-    """批量导入节点（从机场订阅URL）"""
+    """批量导入节点（从一个或多个机场订阅URL并发拉取），按节点身份指纹去重：新增、更新、跳过，可选清理已消失的节点"""
     data = request.get_json()
-    url = data.get('url')
+    urls = data.get('urls') or []
+    if isinstance(urls, str):
+        urls = urls.splitlines()
+    if data.get('url'):
+        urls = [data['url']] + list(urls)
+    urls = _dedupe_preserve_order(url.strip() for url in urls if isinstance(url, str))
     subscription_id = data.get('subscription_id')  # 可选：归属到某个订阅分组
+    prune = bool(data.get('prune'))  # 可选：删除该分组中本次订阅已不存在的节点
     
-    if not url:
+    if not urls:
         return jsonify({'success': False, 'message': '订阅链接不能为空'}), 400
+    if len(urls) > IMPORT_MAX_URLS:
+        return jsonify({'success': False, 'message': f'一次最多导入 {IMPORT_MAX_URLS} 个订阅链接'}), 400
     
+    # 如果指定了订阅分组，先获取订阅对象
+    subscription = None
+    if subscription_id:
+        subscription = Subscription.query.get(subscription_id)
+    if prune and not subscription:
+        return jsonify({'success': False, 'message': '清理失效节点需要指定订阅分组'}), 400
+    
+    # 可选：保存为上游订阅源，由后台定时刷新
+    save_source = bool(data.get('save_source'))
     try:
-        # 获取订阅内容
-        response = req.get(url, timeout=30)
-        response.raise_for_status()
-        content = response.text
-        
-        # 解析节点
-        proxies = ProxyParser.parse_subscription(content)
-        
-        if not proxies:
-            return jsonify({'success': False, 'message': '未能解析到任何节点'}), 400
-        
-        # 获取当前最大排序值，从1开始
-        max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
-        
-        # 如果指定了订阅分组，先获取订阅对象
-        subscription = None
-        if subscription_id:
-            subscription = Subscription.query.get(subscription_id)
+        refresh_interval = _parse_refresh_interval(data.get('refresh_interval'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        # 并发拉取所有订阅（流式读取，边下载边解析），再按链接顺序依次合并，结果与完成先后无关
+        results = fetch_and_parse_many(
+            urls,
+            session=_http_session,
+            timeout=UPSTREAM_FETCH_TIMEOUT,
+            max_workers=IMPORT_FETCH_WORKERS
+        )
         
-        # 添加节点
-        added_count = 0
-        for proxy in proxies:
-            node = Node(
-                name=proxy['name'],
-                original_name=proxy['name'],
-                protocol=proxy['type'],
-                subscription_id=subscription_id,
-                order=max_order + added_count + 1
-            )
-            node.set_config(proxy)
-            db.session.add(node)
+        stats = {'added': 0, 'updated': 0, 'skipped': 0, 'pruned': 0}
+        seen_node_ids = set()
+        sources = []
+        for result in results:
+            source_summary = {'url': result.url, 'count': len(result.proxies), 'error': result.error}
+            if result.report:
+                source_summary['report'] = result.report.to_dict()
+            sources.append(source_summary)
+            if not result.ok or not result.proxies:
+                continue
             
-            # 添加到多对多关系
-            if subscription:
-                node.subscriptions.append(subscription)
+            source = None
+            if save_source:
+                source = UpstreamSource(
+                    name=subscription.name if subscription and len(urls) == 1 else urlsplit(result.url).netloc or result.url,
+                    url=result.url,
+                    subscription_id=subscription.id if subscription else None,
+                    refresh_interval=refresh_interval
+                )
+                db.session.add(source)
             
-            added_count += 1
+            source_stats, source_node_ids = _sync_imported_proxies(result.proxies, subscription, source)
+            for key, value in source_stats.items():
+                stats[key] += value
+            seen_node_ids |= source_node_ids
+            if source:
+                db.session.flush()
+                source_summary['source_id'] = source.id
+        
+        failed = [source for source in sources if source['error']]
+        if not seen_node_ids:
+            db.session.rollback()
+            message = '未能解析到任何节点'
+            if failed:
+                message += '：' + '；'.join(source['error'] for source in failed)
+            return jsonify({
+                'success': False,
+                'message': message,
+                'sources': sources,
+                'report': sources[0].get('report') if len(sources) == 1 else None
+            }), 400
+        
+        prune_skipped = bool(prune and failed)
+        if prune and not failed:
+            # 只清理由该分组导入的节点，手动加入分组的节点不受影响；有订阅拉取失败时不清理，避免误删
+            for node in list(subscription.nodes):
+                if node.id not in seen_node_ids and node.fingerprint and node.subscription_id == subscription.id:
+                    db.session.delete(node)
+                    stats['pruned'] += 1
         
         db.session.commit()
         
         return jsonify({
             'success': True,
-            'count': added_count
+            'count': stats['added'],
+            **stats,
+            'prune_skipped': prune_skipped,
+            'source_id': sources[0].get('source_id') if len(sources) == 1 else None,
+            'sources': sources,
+            'report': sources[0].get('report') if len(sources) == 1 else None
         })
     
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+# 批量插入节点时每条 INSERT 语句携带的行数
+NODE_BULK_INSERT_BATCH_SIZE = 1000
+
+
+# 新节点排序值之间的间隔，调整顺序时在相邻两个值之间取中间值，只改被移动的一行
+NODE_ORDER_STEP = 1024
+NODE_ORDER_SEQUENCE = 'node_order'
+
+
+def _advance_sequence(name, count, initial=None, executor=None):
+    """
+    把命名序列加 count 并返回加后的值，本事务分到 (返回值 - count, 返回值]
+
+    先 UPDATE 再读回：UPDATE 持有的行锁（SQLite 为写锁）到事务结束才释放，
+    并发事务会等待而不是读到同一个值。序列不存在时用 initial() 的返回值初始化。
+    executor 默认为当前会话，也可以传入独立的连接。
+    """
+    executor = executor or db.session
+    table = Sequence.__table__
+    update = table.update().where(table.c.name == name).values(value=table.c.value + count)
+    if executor.execute(update).rowcount == 0:
+        try:
+            with executor.begin_nested():
+                executor.execute(table.insert().values(name=name, value=initial() if initial else 0))
+        except IntegrityError:
+            # 另一个事务已经初始化了同名序列
+            pass
+        executor.execute(update)
+    return executor.execute(select(table.c.value).where(table.c.name == name)).scalar_one()
+
+
+def _node_order_sequence_start():
+    # 仅序列首次使用时执行一次，新节点排在已有节点之后
+    max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
+    return max(max_order, 0) // NODE_ORDER_STEP
+
+
+def _allocate_node_orders(count):
+    """为 count 个新节点分配排序值，返回第一个值，之后每个节点递增 NODE_ORDER_STEP"""
+    last = _advance_sequence(NODE_ORDER_SEQUENCE, count, _node_order_sequence_start)
+    return (last - count + 1) * NODE_ORDER_STEP
+
+
+def _previous_node(anchor, excluded_id):
+    """排序上紧挨在 anchor 之前的节点，跳过 excluded_id"""
+    sort_key = db.func.coalesce(Node.order, 0)
+    anchor_order = anchor.order or 0
+    return Node.query.filter(Node.id != excluded_id, or_(
+        sort_key < anchor_order,
+        and_(sort_key == anchor_order, Node.id < anchor.id)
+    )).order_by(sort_key.desc(), Node.id.desc()).first()
+
+
+def _move_node_after(node, anchor):
+    """
+    把节点移到 anchor 之后（anchor 为 None 时移到最前），返回新的排序值
+
+    相邻两个值之间还有空位时只改被移动的节点；没有空位时把紧挨着的一段节点依次后推一位，
+    遇到空位即停止，不会重排整张表。
+    """
+    sort_key = db.func.coalesce(Node.order, 0)
+    others = Node.query.filter(Node.id != node.id)
+    if anchor is None:
+        first = others.order_by(sort_key, Node.id).first()
+        node.order = (first.order or 0) - NODE_ORDER_STEP if first else 0
+        return node.order
+
+    anchor_order = anchor.order or 0
+    following = others.filter(Node.id != anchor.id, or_(
+        sort_key > anchor_order,
+        and_(sort_key == anchor_order, Node.id > anchor.id)
+    )).order_by(sort_key, Node.id)
+    next_node = following.first()
+    if next_node is None:
+        # 移到末尾与新建节点一样从序列取值，不会和并发导入分到的排序值重复
+        node.order = max(_allocate_node_orders(1), anchor_order + 1)
+        return node.order
+
+    next_order = next_node.order or 0
+    if next_order - anchor_order >= 2:
+        node.order = (anchor_order + next_order) // 2
+        return node.order
+
+    node.order = current = anchor_order + 1
+    offset = 0
+    while True:
+        batch = following.offset(offset).limit(NODE_BULK_INSERT_BATCH_SIZE).all()
+        for neighbour in batch:
+            if (neighbour.order or 0) > current:
+                return node.order
+            current += 1
+            neighbour.order = current
+        if len(batch) < NODE_BULK_INSERT_BATCH_SIZE:
+            return node.order
+        offset += len(batch)
+
+
+def _link_nodes_to_subscription(subscription, node_ids):
+    """批量写入订阅分组与节点的关联，已存在的关联跳过"""
+    node_ids = list(dict.fromkeys(node_ids))
+    if not node_ids:
+        return 0
+    linked = set()
+    for start in range(0, len(node_ids), NODE_BULK_INSERT_BATCH_SIZE):
+        chunk = node_ids[start:start + NODE_BULK_INSERT_BATCH_SIZE]
+        linked.update(node_id for node_id, in db.session.query(subscription_node.c.node_id).filter(
+            subscription_node.c.subscription_id == subscription.id,
+            subscription_node.c.node_id.in_(chunk)
+        ))
+    rows = [
+        {'subscription_id': subscription.id, 'node_id': node_id}
+        for node_id in node_ids if node_id not in linked
+    ]
+    if rows:
+        db.session.execute(subscription_node.insert(), rows)
+        # 绕过了 ORM 关系，已加载的集合和分组内用户的统计需要刷新
+        db.session.expire(subscription, ['nodes'])
+        _mark_user_stats_dirty(*_user_ids_linked_to(subscription_ids=[subscription.id]))
+    return len(rows)
+
+
+def _bulk_insert_nodes(entries, subscription=None, source=None):
+    """
+    用 executemany 批量插入节点及其订阅分组关联，排序值一次分配，随当前事务提交
+
+    Args:
+        entries: [(名称, 协议, 配置字典), ...]
+        subscription: 要加入的订阅分组
+        source: 来源上游订阅
+
+    Returns:
+        新节点 ID 列表，与 entries 顺序一致
+    """
+    if not entries:
+        return []
+
+    if source is not None and source.id is None:
+        # 新建的上游来源需要先拿到 ID
+        db.session.flush()
+    first_order = _allocate_node_orders(len(entries))
+    rows = []
+    for offset, (name, protocol, config) in enumerate(entries):
+        row = Node.config_columns(config)
+        row.update(
+            name=name,
+            original_name=name,
+            protocol=protocol,
+            order=first_order + offset * NODE_ORDER_STEP,
+            config_version=1,
+            subscription_id=subscription.id if subscription else None,
+            upstream_source_id=source.id if source else None
+        )
+        rows.append(row)
+
+    if db.engine.dialect.insert_executemany_returning:
+        # RETURNING 同时取回排序值，按返回行本身对应 ID，不依赖返回顺序；
+        # 不要求按参数顺序返回，SQLite 才能合并成多行 VALUES 批量插入
+        statement = insert(Node).returning(Node.id, Node.order)
+        ids_by_order = {}
+        for start in range(0, len(rows), NODE_BULK_INSERT_BATCH_SIZE):
+            result = db.session.execute(statement, rows[start:start + NODE_BULK_INSERT_BATCH_SIZE])
+            ids_by_order.update((order, node_id) for node_id, order in result)
+        node_ids = [ids_by_order[row['order']] for row in rows]
+    else:
+        # 不支持批量 RETURNING 的数据库（如 MySQL）逐个 flush 取得自增 ID
+        nodes = [Node(**row) for row in rows]
+        db.session.add_all(nodes)
+        db.session.flush()
+        node_ids = [node.id for node in nodes]
+
+    if source is not None:
+        db.session.expire(source, ['nodes'])
+    if subscription is not None:
+        _link_nodes_to_subscription(subscription, node_ids)
+    return node_ids
+
+
+def _sync_imported_proxies(proxies, subscription=None, source=None):
+    """分批把解析出的节点合并进节点表，返回 (统计, 本次出现的节点 ID 集合)"""
+    stats = {'added': 0, 'updated': 0, 'skipped': 0, 'pruned': 0}
+    seen_node_ids = set()
+    seen_fingerprints = set()
+    batch = []
+    for proxy in proxies:
+        batch.append(proxy)
+        if len(batch) >= IMPORT_UPSERT_BATCH_SIZE:
+            _upsert_imported_nodes(batch, subscription, stats, seen_node_ids, seen_fingerprints, source)
+            batch = []
+    if batch:
+        _upsert_imported_nodes(batch, subscription, stats, seen_node_ids, seen_fingerprints, source)
+    return stats, seen_node_ids
+
+
+def _upsert_imported_nodes(proxies, subscription, stats, seen_node_ids, seen_fingerprints, source=None):
+    """按指纹合并一批导入节点：新节点批量插入，变化的节点逐个更新"""
+    fingerprints = {Node.compute_fingerprint(proxy) for proxy in proxies} - {None}
+    existing = {}
+    if fingerprints:
+        for node in Node.query.filter(Node.fingerprint.in_(fingerprints)).order_by(Node.id):
+            current = existing.get(node.fingerprint)
+            # 同指纹有多个节点时优先匹配同一上游来源的节点
+            if current is None or (
+                source and node.upstream_source_id == source.id and current.upstream_source_id != source.id
+            ):
+                existing[node.fingerprint] = node
+    
+    new_entries = []
+    existing_node_ids = []
+    for proxy in proxies:
+        fingerprint = Node.compute_fingerprint(proxy)
+        if fingerprint and fingerprint in seen_fingerprints:
+            # 同一订阅内的重复节点只保留第一条
+            stats['skipped'] += 1
+            continue
+        if fingerprint:
+            seen_fingerprints.add(fingerprint)
+        
+        node = existing.get(fingerprint) if fingerprint else None
+        if node is None:
+            new_entries.append((proxy['name'], proxy['type'], proxy))
+            continue
+        upstream_name = proxy['name']
+        if node.name != node.original_name:
+            # 管理员手动改过的名称保留，订阅按配置中的名称输出，需一并写回
+            proxy = dict(proxy, name=node.name)
+        if node.get_config() == proxy and node.original_name == upstream_name:
+            stats['skipped'] += 1
+        else:
+            if node.name == node.original_name:
+                node.name = upstream_name
+            node.original_name = upstream_name
+            node.protocol = proxy['type']
+            node.set_config(proxy)
+            stats['updated'] += 1
+        
+        if source and node.upstream_source_id is None:
+            node.upstream_source = source
+        seen_node_ids.add(node.id)
+        existing_node_ids.append(node.id)
+    
+    new_node_ids = _bulk_insert_nodes(new_entries, subscription, source)
+    stats['added'] += len(new_node_ids)
+    seen_node_ids.update(new_node_ids)
+    if subscription and existing_node_ids:
+        _link_nodes_to_subscription(subscription, existing_node_ids)
+
+
+def _parse_refresh_interval(value):
+    """校验上游订阅刷新间隔（秒），未提供时使用默认值"""
+    if value in (None, ''):
+        return UPSTREAM_REFRESH_DEFAULT_INTERVAL
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('刷新间隔必须是整数秒')
+    if interval < UPSTREAM_REFRESH_MIN_INTERVAL:
+        raise ValueError(f'刷新间隔不能小于 {UPSTREAM_REFRESH_MIN_INTERVAL} 秒')
+    return interval
+
+
+def _refresh_upstream_source(source, force=False):
+    """条件拉取一个上游订阅源，内容变化时只把差异同步到它的节点"""
+    now = datetime.utcnow()
+    source.last_checked_at = now
+    try:
+        result = fetch_upstream(
+            source.url,
+            etag=None if force else source.etag,
+            last_modified=None if force else source.last_modified,
+            content_hash=None if force else source.content_hash,
+            session=_http_session,
+            timeout=UPSTREAM_FETCH_TIMEOUT
+        )
+    except req.RequestException as e:
+        source.last_status = 'error'
+        source.last_error = str(e)
+        db.session.commit()
+        return {'status': 'error', 'message': str(e)}
+    
+    summary = {'status': result.status}
+    if result.changed:
+        parse_report = ParseReport()
+        proxies = ProxyParser.iter_subscription([result.body], report=parse_report)
+        stats, seen_node_ids = _sync_imported_proxies(proxies, source.subscription, source)
+        summary.update(stats, report=parse_report.to_dict())
+        if not seen_node_ids:
+            # 上游临时返回空内容或错误页时不清理节点，也不保存校验值，下次重新解析
+            source.etag = source.last_modified = source.content_hash = None
+            source.last_status = 'error'
+            source.last_error = '未能解析到任何节点'
+            db.session.commit()
+            summary.update(status='error', message=source.last_error)
+            return summary
+        
+        for node in list(source.nodes):
+            if node.id not in seen_node_ids:
+                db.session.delete(node)
+                summary['pruned'] += 1
+        source.last_changed_at = now
+    
+    source.etag = result.etag
+    source.last_modified = result.last_modified
+    source.content_hash = result.content_hash
+    source.last_status = result.status
+    source.last_error = None
+    db.session.commit()
+    
+    if result.changed and (summary['added'] or summary['updated'] or summary['pruned']):
+        _invalidate_subscription_cache(f'upstream-refresh {source.id}')
+    return summary
+
+
+def refresh_due_upstream_sources(now=None):
+    """刷新所有到期的上游订阅源，单个源失败不影响其他源"""
+    results = {}
+    sources = [source for source in UpstreamSource.query.filter_by(enabled=True).all() if source.is_due(now)]
+    for source in sources:
+        source_id = source.id
+        try:
+            results[source_id] = _refresh_upstream_source(source)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning("upstream refresh failed: source=%s error=%s", source_id, e)
+            results[source_id] = {'status': 'error', 'message': str(e)}
+    return results
+
+
+def _run_upstream_refresher(poll_seconds):
+    while not _upstream_refresher_stop.is_set():
+        with app.app_context():
+            try:
+                refresh_due_upstream_sources()
+                # 直分节点或 3x-ui 客户端到期后统计过期，在后台写回
+                backfill_user_stats()
+            except Exception:
+                app.logger.exception("upstream refresher iteration failed")
+            finally:
+                db.session.remove()
+        _upstream_refresher_stop.wait(poll_seconds)
+
+
+def start_upstream_refresher(poll_seconds=None):
+    """启动后台上游订阅刷新线程，进程内只启动一个"""
+    global _upstream_refresher
+    if _upstream_refresher and _upstream_refresher.is_alive():
+        return _upstream_refresher
+    _upstream_refresher_stop.clear()
+    _upstream_refresher = threading.Thread(
+        target=_run_upstream_refresher,
+        args=(poll_seconds or UPSTREAM_REFRESH_POLL_SECONDS,),
+        name='upstream-refresher',
+        daemon=True
+    )
+    _upstream_refresher.start()
+    return _upstream_refresher
+
+
+def stop_upstream_refresher():
+    """停止后台上游订阅刷新线程"""
+    _upstream_refresher_stop.set()
+
+
+@app.route('/api/upstream-sources', methods=['GET', 'POST'])
+@login_required
+def manage_upstream_sources():
+    """获取或添加上游订阅源"""
+    if request.method == 'GET':
+        return jsonify([source.to_dict() for source in UpstreamSource.query.order_by(UpstreamSource.id).all()])
+    
+    # POST - 添加上游订阅源
+    data = request.get_json()
+    url = (data.get('url') or '').strip()
+    subscription_id = data.get('subscription_id')
+    
+    if not url:
+        return jsonify({'success': False, 'message': '订阅链接不能为空'}), 400
+    if subscription_id and not Subscription.query.get(subscription_id):
+        return jsonify({'success': False, 'message': '订阅分组不存在'}), 400
+    try:
+        refresh_interval = _parse_refresh_interval(data.get('refresh_interval'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    source = UpstreamSource(
+        name=data.get('name') or urlsplit(url).netloc or url,
+        url=url,
+        subscription_id=subscription_id or None,
+        refresh_interval=refresh_interval,
+        enabled=bool(data.get('enabled', True))
+    )
+    db.session.add(source)
+    db.session.commit()
+    
+    return jsonify({'success': True, 'id': source.id})
+
+
+@app.route('/api/upstream-sources/<int:source_id>', methods=['PUT', 'DELETE'])
+@login_required
+def update_upstream_source(source_id):
+    """更新或删除上游订阅源"""
+    source = UpstreamSource.query.get_or_404(source_id)
+    
+    if request.method == 'DELETE':
+        # 删除来源不删除节点，节点转为普通节点保留
+        for node in source.nodes:
+            node.upstream_source_id = None
+        db.session.delete(source)
+        db.session.commit()
+        return jsonify({'success': True})
+    
+    # PUT - 更新上游订阅源
+    data = request.get_json()
+    if 'name' in data:
+        source.name = data['name']
+    if 'url' in data:
+        url = (data['url'] or '').strip()
+        if not url:
+            return jsonify({'success': False, 'message': '订阅链接不能为空'}), 400
+        if url != source.url:
+            source.url = url
+            source.etag = source.last_modified = source.content_hash = None
+    if 'subscription_id' in data:
+        if data['subscription_id'] and not Subscription.query.get(data['subscription_id']):
+            return jsonify({'success': False, 'message': '订阅分组不存在'}), 400
+        source.subscription_id = data['subscription_id'] or None
+    if 'refresh_interval' in data:
+        try:
+            source.refresh_interval = _parse_refresh_interval(data['refresh_interval'])
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    if 'enabled' in data:
+        source.enabled = bool(data['enabled'])
+    
+    db.session.commit()
+    return jsonify({'success': True})
+
+
+@app.route('/api/upstream-sources/<int:source_id>/refresh', methods=['POST'])
+@login_required
+def refresh_upstream_source(source_id):
+    """立即刷新上游订阅源，force 为真时忽略缓存校验值"""
+    source = UpstreamSource.query.get_or_404(source_id)
+    data = request.get_json(silent=True) or {}
+    result = _refresh_upstream_source(source, force=bool(data.get('force')))
+    if result['status'] == 'error':
+        return jsonify({'success': False, **result}), 400
+    return jsonify({'success': True, **result})
+
+
 @app.route('/api/nodes/<int:node_id>', methods=['PUT', 'DELETE'])
 @login_required
 def update_node(node_id):
@@ -2434,6 +3539,8 @@ def update_node(node_id):
     
     # PUT - 更新节点（重命名、更改订阅分组或排序）
     data = request.get_json()
+    previous_config = node.get_config()
+    previous_node_name = node.name
     if 'name' in data:
         node.name = data['name']
         # 同时更新配置中的名称
@@ -2443,10 +3550,26 @@ def update_node(node_id):
     if 'subscription_id' in data:
         node.subscription_id = data['subscription_id']
     if 'order' in data:
-        node.order = data['order']
+        # 排序值由序列稀疏分配，直接写入会与其他节点重复
+        return jsonify({'success': False, 'message': '请使用 after_id / before_id 调整节点顺序'}), 400
+    if 'after_id' in data or 'before_id' in data:
+        # 拖动排序：移到某个节点之后或之前，after_id 为 null 表示移到最前
+        move_after = 'after_id' in data
+        anchor_id = data['after_id'] if move_after else data['before_id']
+        anchor = None
+        if anchor_id is not None or not move_after:
+            anchor = db.session.get(Node, anchor_id) if isinstance(anchor_id, int) else None
+            if anchor is None or anchor.id == node.id:
+                return jsonify({'success': False, 'message': '目标节点不存在'}), 400
+        if not move_after:
+            anchor = _previous_node(anchor, node.id)
+        _move_node_after(node, anchor)
     
     db.session.commit()
-    return jsonify({'success': True})
+    # 仅改名时就地更新缓存；分组和排序变化会影响节点归属和顺序，仍全量失效。
+    if set(data) == {'name'}:
+        _patch_subscription_cache_for_node(node, previous_config, previous_node_name)
+    return jsonify({'success': True, 'order': node.order})
 
 
 @app.route('/api/nodes/batch-delete', methods=['POST'])
@@ -2535,12 +3658,16 @@ def update_node_config(node_id):
     if 'name' not in new_config or 'type' not in new_config:
         return jsonify({'success': False, 'message': '配置缺少必要字段'}), 400
     
+    previous_config = node.get_config()
+    previous_node_name = node.name
+
     # 更新节点信息
     node.name = new_config['name']
     node.protocol = new_config['type']
     node.set_config(new_config)
     
     db.session.commit()
+    _patch_subscription_cache_for_node(node, previous_config, previous_node_name)
     
     return jsonify({'success': True})
 
@@ -2581,8 +3708,8 @@ def manual_create_node():
             if field not in config or not config[field]:
                 return jsonify({'success': False, 'message': f'{protocol.upper()} 协议缺少必要字段: {field}'}), 400
     
-    # 获取当前最大排序值，从1开始
-    max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
+    # 新节点排在最后
+    order = _allocate_node_orders(1)
     
     # 创建节点
     node = Node(
@@ -2590,7 +3717,7 @@ def manual_create_node():
         original_name=config['name'],
         protocol=protocol,
         subscription_id=subscription_id,
-        order=max_order + 1
+        order=order
     )
     node.set_config(config)
     
@@ -2628,8 +3755,8 @@ def create_relay_node():
     if not isinstance(config['proxies'], list) or len(config['proxies']) < 2:
         return jsonify({'success': False, 'message': '至少需要2个代理节点'}), 400
     
-    # 获取当前最大排序值，从1开始
-    max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
+    # 新节点排在最后
+    order = _allocate_node_orders(1)
     
     # 创建relay节点
     node = Node(
@@ -2637,7 +3764,7 @@ def create_relay_node():
         original_name=config['name'],
         protocol='relay',
         subscription_id=subscription_id,
-        order=max_order + 1
+        order=order
     )
     node.set_config(config)
     
@@ -2669,15 +3796,12 @@ def batch_create_relay_nodes():
         return jsonify({'success': False, 'message': '配置必须是列表'}), 400
     
     try:
-        # 获取当前最大排序值
-        max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
-        
         # 如果指定了订阅分组，先获取订阅对象
         subscription = None
         if subscription_id:
             subscription = Subscription.query.get(subscription_id)
         
-        created_count = 0
+        entries = []
         for config in configs:
             # 验证必要字段
             if 'name' not in config or 'type' not in config or 'proxies' not in config:
@@ -2689,24 +3813,10 @@ def batch_create_relay_nodes():
             if not isinstance(config['proxies'], list) or len(config['proxies']) < 2:
                 continue
             
-            # 创建relay节点
-            node = Node(
-                name=config['name'],
-                original_name=config['name'],
-                protocol='relay',
-                subscription_id=subscription_id,
-                order=max_order + created_count + 1
-            )
-            node.set_config(config)
-            
-            db.session.add(node)
-            
-            # 添加到多对多关系
-            if subscription:
-                node.subscriptions.append(subscription)
-            
-            created_count += 1
+            entries.append((config['name'], 'relay', config))
         
+        # 节点和分组关联各用一条批量 INSERT 写入
+        created_count = len(_bulk_insert_nodes(entries, subscription))
         db.session.commit()
         
         return jsonify({
@@ -2735,22 +3845,28 @@ def batch_create_dialer_proxy_nodes():
         return jsonify({'success': False, 'message': '配置必须是列表'}), 400
     
     try:
-        # 获取当前最大排序值
-        max_order = db.session.query(db.func.max(Node.order)).scalar() or 0
-        
         # 如果指定了订阅分组，先获取订阅对象
         subscription = None
         if subscription_id:
             subscription = Subscription.query.get(subscription_id)
         
-        created_count = 0
+        # 一次查出所有后置节点
+        back_node_ids = {
+            config['backNodeId'] for config in configs
+            if isinstance(config, dict) and isinstance(config.get('backNodeId'), int)
+        }
+        back_nodes = {
+            node.id: node for node in Node.query.filter(Node.id.in_(back_node_ids))
+        } if back_node_ids else {}
+        
+        entries = []
         for config in configs:
             # 验证必要字段
             if 'name' not in config or 'backNodeId' not in config or 'frontNodeName' not in config:
                 continue
             
             # 获取后置节点的完整配置
-            back_node = Node.query.get(config['backNodeId'])
+            back_node = back_nodes.get(config['backNodeId'])
             if not back_node:
                 continue
             
@@ -2783,24 +3899,10 @@ def batch_create_dialer_proxy_nodes():
                 if 'udp' in new_config:
                     del new_config['udp']
             
-            # 创建新节点
-            node = Node(
-                name=config['name'],
-                original_name=config['name'],
-                protocol=back_node.protocol,  # 保持原协议类型
-                subscription_id=subscription_id,
-                order=max_order + created_count + 1
-            )
-            node.set_config(new_config)
-            
-            db.session.add(node)
-            
-            # 添加到多对多关系
-            if subscription:
-                node.subscriptions.append(subscription)
-            
-            created_count += 1
+            # 保持后置节点的协议类型
+            entries.append((config['name'], back_node.protocol, new_config))
         
+        created_count = len(_bulk_insert_nodes(entries, subscription))
         db.session.commit()
         
         return jsonify({
@@ -2875,40 +3977,358 @@ def _user_xui_subscription_totals(user):
     }
 
 
-def _serialize_user(user):
-    subscription_nodes = []
-    for subscription in user.subscriptions:
-        subscription_nodes.extend(subscription.nodes)
+# 用户列表可排序字段
+USER_LIST_SORT_COLUMNS = {
+    'id': User.id,
+    'username': User.username,
+    'created_at': User.created_at,
+}
 
-    direct_assignments = _active_user_node_assignments(user)
-    direct_nodes = [assignment.node for assignment in direct_assignments if assignment.node]
-    active_xui_clients = _active_user_xui_clients(user)
-    visible_nodes = _dedupe_nodes(subscription_nodes + direct_nodes)
 
-    traffic_used = _user_traffic_used_bytes(user)
+def _active_user_node_condition(now_ms):
+    """与 _active_user_node_assignments 一致的 SQL 条件：未过期且未超出流量限制"""
+    return and_(
+        or_(UserNode.expiry_time.is_(None), UserNode.expiry_time == 0, UserNode.expiry_time > now_ms),
+        or_(
+            UserNode.traffic_limit.is_(None),
+            UserNode.traffic_limit == 0,
+            db.func.coalesce(UserNode.traffic_used, 0) < UserNode.traffic_limit
+        )
+    )
 
-    return {
-        'id': user.id,
-        'username': user.username,
-        'subscription_token': user.subscription_token,
-        'custom_slug': user.custom_slug,
-        'subscription_count': len(user.subscriptions),
-        'subscription_node_count': len(_dedupe_nodes(subscription_nodes)),
-        'direct_node_count': len(_dedupe_nodes(direct_nodes)),
-        'direct_node_total_count': len(user.node_assignments),
-        'xui_node_count': len(active_xui_clients),
-        'xui_node_total_count': len(user.xui_clients),
-        'node_count': len(visible_nodes) + len(active_xui_clients),
-        'enabled': user.enabled,
-        'remark': user.remark or '',
-        'template_id': user.template_id,
-        'template_name': user.template.name if user.template else None,
-        'traffic_limit': user.traffic_limit or 0,
-        'traffic_limit_gb': _bytes_to_gb(user.traffic_limit),
-        'traffic_used': traffic_used,
-        'traffic_used_gb': _bytes_to_gb(traffic_used),
-        'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S')
+
+def _user_listing_stats(user_ids):
+    """
+    用聚合查询批量统计用户的订阅数、节点数和流量，不逐个用户访问关联关系
+
+    Returns:
+        {user_id: {...}}，不包含需要解析 3x-ui 入站状态的统计
+    """
+    user_ids = list(user_ids)
+    stats = {
+        user_id: {
+            'subscription_count': 0,
+            'subscription_node_count': 0,
+            'direct_node_count': 0,
+            'direct_node_total_count': 0,
+            'visible_node_count': 0,
+            'legacy_traffic_used': 0,
+            'xui_traffic_used': 0,
+        }
+        for user_id in user_ids
     }
+    if not user_ids:
+        return stats
+
+    def collect(key, rows):
+        for user_id, value in rows:
+            stats[user_id][key] = int(value or 0)
+
+    user_column = user_subscription_table.c.user_id
+    collect('subscription_count', db.session.query(
+        user_column, db.func.count()
+    ).filter(user_column.in_(user_ids)).group_by(user_column))
+
+    subscription_nodes = db.session.query(
+        user_column.label('user_id'), subscription_node.c.node_id.label('node_id')
+    ).join(
+        subscription_node, subscription_node.c.subscription_id == user_subscription_table.c.subscription_id
+    ).filter(user_column.in_(user_ids))
+    active_direct_nodes = db.session.query(
+        UserNode.user_id.label('user_id'), UserNode.node_id.label('node_id')
+    ).join(Node, Node.id == UserNode.node_id).filter(
+        UserNode.user_id.in_(user_ids),
+        _active_user_node_condition(int(time.time() * 1000))
+    )
+
+    def count_nodes(key, node_query):
+        rows = node_query.subquery()
+        collect(key, db.session.query(
+            rows.c.user_id, db.func.count(rows.c.node_id.distinct())
+        ).group_by(rows.c.user_id))
+
+    count_nodes('subscription_node_count', subscription_nodes)
+    count_nodes('direct_node_count', active_direct_nodes)
+    count_nodes('visible_node_count', subscription_nodes.union(active_direct_nodes))
+
+    direct_totals = db.session.query(
+        UserNode.user_id,
+        db.func.count(),
+        db.func.coalesce(db.func.sum(UserNode.traffic_used), 0)
+    ).filter(UserNode.user_id.in_(user_ids)).group_by(UserNode.user_id)
+    for user_id, total, traffic_used in direct_totals:
+        stats[user_id]['direct_node_total_count'] = int(total or 0)
+        stats[user_id]['legacy_traffic_used'] = int(traffic_used or 0)
+
+    collect('xui_traffic_used', db.session.query(
+        UserXuiClient.user_id, db.func.coalesce(db.func.sum(UserXuiClient.traffic_used), 0)
+    ).filter(UserXuiClient.user_id.in_(user_ids)).group_by(UserXuiClient.user_id))
+    return stats
+
+
+USER_STATS_BATCH_SIZE = 500
+# 会话中等待重算统计的用户 ID
+USER_STATS_PENDING_KEY = 'user_stats_pending'
+
+
+def _compute_user_stats(chunk, now_ms):
+    """只读地计算一批用户的统计行，返回 {user_id: 统计字典}；不存在的用户不返回"""
+    refreshed = {}
+    fallback_traffic = dict(db.session.query(User.id, User.traffic_used).filter(User.id.in_(chunk)))
+    aggregates = _user_listing_stats(fallback_traffic)
+
+    # 最早到期的有效直分节点，到期后统计需要重算
+    valid_until = dict(db.session.query(
+        UserNode.user_id, db.func.min(UserNode.expiry_time)
+    ).join(Node, Node.id == UserNode.node_id).filter(
+        UserNode.user_id.in_(fallback_traffic),
+        UserNode.expiry_time > now_ms,
+        _active_user_node_condition(now_ms)
+    ).group_by(UserNode.user_id))
+
+    xui_counts = {}
+    for mapping in UserXuiClient.query.filter(UserXuiClient.user_id.in_(fallback_traffic)):
+        active, total = xui_counts.get(mapping.user_id, (0, 0))
+        inbound_state = _user_xui_client_active_state(mapping)
+        if inbound_state is not None:
+            active += 1
+            expiry_time = inbound_state['expiry_time']
+            if expiry_time and (not valid_until.get(mapping.user_id) or expiry_time < valid_until[mapping.user_id]):
+                valid_until[mapping.user_id] = expiry_time
+        xui_counts[mapping.user_id] = (active, total + 1)
+
+    for user_id, stats in aggregates.items():
+        xui_active, xui_total = xui_counts.get(user_id, (0, 0))
+        traffic_used = stats['legacy_traffic_used'] + stats['xui_traffic_used']
+        row = {
+            'user_id': user_id,
+            'subscription_count': stats['subscription_count'],
+            'subscription_node_count': stats['subscription_node_count'],
+            'direct_node_count': stats['direct_node_count'],
+            'direct_node_total_count': stats['direct_node_total_count'],
+            'xui_node_count': xui_active,
+            'xui_node_total_count': xui_total,
+            'node_count': stats['visible_node_count'] + xui_active,
+            'traffic_used': traffic_used or int(fallback_traffic[user_id] or 0),
+            'valid_until': int(valid_until.get(user_id) or 0),
+            'updated_at': datetime.utcnow(),
+        }
+        refreshed[user_id] = row
+    return refreshed
+
+
+def _refresh_user_stats(user_ids):
+    """
+    重新计算用户统计并写入 user_stats，随当前事务一起提交
+
+    Returns:
+        {user_id: 统计字典}；已删除的用户只清理统计行
+    """
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    refreshed = {}
+    now_ms = int(time.time() * 1000)
+    stats_table = UserStats.__table__
+
+    for start in range(0, len(user_ids), USER_STATS_BATCH_SIZE):
+        chunk = user_ids[start:start + USER_STATS_BATCH_SIZE]
+        rows = _compute_user_stats(chunk, now_ms)
+        refreshed.update(rows)
+        db.session.execute(stats_table.delete().where(stats_table.c.user_id.in_(chunk)))
+        if rows:
+            db.session.execute(stats_table.insert(), list(rows.values()))
+    return refreshed
+
+
+def _mark_user_stats_dirty(*user_ids):
+    """标记需要重算统计的用户，绕过 ORM 的批量写入需要手动调用"""
+    pending = db.session.info.setdefault(USER_STATS_PENDING_KEY, set())
+    pending.update(user_id for user_id in user_ids if user_id is not None)
+
+
+def _collection_changed(obj, attribute):
+    return sa_inspect(obj).attrs[attribute].history.has_changes()
+
+
+def _user_ids_linked_to(node_ids=(), subscription_ids=()):
+    """查询当前数据库中与节点或订阅分组关联的用户"""
+    user_ids = set()
+    node_ids, subscription_ids = list(node_ids), list(subscription_ids)
+    if subscription_ids:
+        user_ids.update(user_id for user_id, in db.session.query(user_subscription_table.c.user_id).filter(
+            user_subscription_table.c.subscription_id.in_(subscription_ids)
+        ))
+    for start in range(0, len(node_ids), USER_STATS_BATCH_SIZE):
+        chunk = node_ids[start:start + USER_STATS_BATCH_SIZE]
+        user_ids.update(user_id for user_id, in db.session.query(user_subscription_table.c.user_id).join(
+            subscription_node, subscription_node.c.subscription_id == user_subscription_table.c.subscription_id
+        ).filter(subscription_node.c.node_id.in_(chunk)))
+        user_ids.update(user_id for user_id, in db.session.query(UserNode.user_id).filter(UserNode.node_id.in_(chunk)))
+    return user_ids
+
+
+def _collect_user_stats_changes(session, include_new):
+    """找出本次 flush 影响统计的用户：直接关联对象取 user_id，节点和订阅分组按关联关系查询"""
+    pending = session.info.setdefault(USER_STATS_PENDING_KEY, set())
+    node_ids, subscription_ids = set(), set()
+    objects = list(session.dirty) + list(session.deleted)
+    if include_new:
+        objects += list(session.new)
+
+    for obj in objects:
+        if isinstance(obj, User):
+            pending.add(obj.id)
+        elif isinstance(obj, (UserNode, UserXuiClient)):
+            pending.add(obj.user_id)
+        elif isinstance(obj, Node) and obj.id is not None:
+            if obj in session.deleted or obj in session.new or _collection_changed(obj, 'subscriptions'):
+                node_ids.add(obj.id)
+        elif isinstance(obj, Subscription) and obj.id is not None:
+            if (
+                obj in session.deleted or obj in session.new
+                or _collection_changed(obj, 'nodes') or _collection_changed(obj, 'users')
+            ):
+                subscription_ids.add(obj.id)
+
+    if node_ids or subscription_ids:
+        pending.update(_user_ids_linked_to(node_ids, subscription_ids))
+    pending.discard(None)
+
+
+def _user_stats_before_flush(session, flush_context, instances):
+    # 写入前按旧的关联关系收集，覆盖节点移出分组、分组被删除等情况
+    _collect_user_stats_changes(session, include_new=False)
+
+
+def _user_stats_after_flush(session, flush_context):
+    # 写入后按新的关联关系收集，覆盖新增节点和新加入的分组
+    _collect_user_stats_changes(session, include_new=True)
+
+
+def _apply_pending_user_stats(session, *args):
+    pending = session.info.pop(USER_STATS_PENDING_KEY, None)
+    if pending:
+        _refresh_user_stats(pending)
+
+
+def _discard_pending_user_stats(session, *args):
+    session.info.pop(USER_STATS_PENDING_KEY, None)
+
+
+# 统计在同一事务内随写入更新；只标记未 flush 的批量写入在提交前处理
+event.listen(db.session, 'before_flush', _user_stats_before_flush)
+event.listen(db.session, 'after_flush', _user_stats_after_flush)
+event.listen(db.session, 'after_flush_postexec', _apply_pending_user_stats)
+event.listen(db.session, 'before_commit', _apply_pending_user_stats)
+event.listen(db.session, 'after_soft_rollback', _discard_pending_user_stats)
+
+
+def _stale_user_stats_condition(now_ms):
+    return and_(UserStats.valid_until > 0, UserStats.valid_until <= now_ms)
+
+
+def backfill_user_stats():
+    """
+    补齐缺失和已过期的用户统计行，启动时和后台刷新线程中执行，读请求不写库
+
+    多个实例同时补齐同一用户时后提交的一方主键冲突，回滚即可，另一方已写入。
+
+    Returns:
+        本次写入的用户数
+    """
+    now_ms = int(time.time() * 1000)
+    missing = db.session.query(User.id).outerjoin(UserStats, UserStats.user_id == User.id).filter(
+        or_(UserStats.user_id.is_(None), _stale_user_stats_condition(now_ms))
+    )
+    user_ids = [user_id for user_id, in missing]
+    written = 0
+    for start in range(0, len(user_ids), USER_STATS_BATCH_SIZE):
+        chunk = user_ids[start:start + USER_STATS_BATCH_SIZE]
+        try:
+            written += len(_refresh_user_stats(chunk))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+    return written
+
+
+def _load_user_stats(users):
+    """读取用户统计；缺失或已过期的行只在内存中重算，由 backfill_user_stats 写回"""
+    now_ms = int(time.time() * 1000)
+    stats_by_user = {}
+    stale_ids = []
+    for user in users:
+        stats = user.stats
+        if stats is None or (stats.valid_until and stats.valid_until <= now_ms):
+            stale_ids.append(user.id)
+            continue
+        stats_by_user[user.id] = {
+            column.name: getattr(stats, column.name) for column in UserStats.__table__.columns
+        }
+    for start in range(0, len(stale_ids), USER_STATS_BATCH_SIZE):
+        stats_by_user.update(_compute_user_stats(stale_ids[start:start + USER_STATS_BATCH_SIZE], now_ms))
+    return stats_by_user
+
+
+def _serialize_users(users):
+    """批量序列化用户，节点数和流量来自 user_stats 汇总表"""
+    stats_by_user = _load_user_stats(users)
+    result = []
+    for user in users:
+        stats = stats_by_user[user.id]
+        result.append({
+            'id': user.id,
+            'username': user.username,
+            'subscription_token': user.subscription_token,
+            'custom_slug': user.custom_slug,
+            'subscription_count': stats['subscription_count'],
+            'subscription_node_count': stats['subscription_node_count'],
+            'direct_node_count': stats['direct_node_count'],
+            'direct_node_total_count': stats['direct_node_total_count'],
+            'xui_node_count': stats['xui_node_count'],
+            'xui_node_total_count': stats['xui_node_total_count'],
+            'node_count': stats['node_count'],
+            'enabled': user.enabled,
+            'remark': user.remark or '',
+            'template_id': user.template_id,
+            'template_name': user.template.name if user.template else None,
+            'output_style': user.output_style,
+            'traffic_limit': user.traffic_limit or 0,
+            'traffic_limit_gb': _bytes_to_gb(user.traffic_limit),
+            'traffic_used': stats['traffic_used'],
+            'traffic_used_gb': _bytes_to_gb(stats['traffic_used']),
+            'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return result
+
+
+def _serialize_user(user):
+    return _serialize_users([user])[0]
+
+
+def _filter_user_listing(query, args):
+    """按名称或备注关键字、启用状态和订阅分组筛选用户列表"""
+    keyword = (args.get('q') or '').strip().lower()
+    if keyword:
+        query = query.filter(or_(
+            db.func.lower(User.username).contains(keyword, autoescape=True),
+            db.func.lower(db.func.coalesce(User.remark, '')).contains(keyword, autoescape=True)
+        ))
+
+    enabled = (args.get('enabled') or '').strip().lower()
+    if enabled in ('1', 'true'):
+        query = query.filter(User.enabled.is_(True))
+    elif enabled in ('0', 'false'):
+        query = query.filter(or_(User.enabled.is_(False), User.enabled.is_(None)))
+    elif enabled:
+        raise ValueError('enabled 只能是 1 或 0')
+
+    subscription_id = (args.get('subscription_id') or '').strip()
+    if subscription_id:
+        try:
+            query = query.filter(User.subscriptions.any(Subscription.id == int(subscription_id)))
+        except ValueError:
+            raise ValueError('subscription_id 必须是整数')
+    return query
 
 
 def _user_subscription_userinfo(user):
@@ -2929,8 +4349,17 @@ def _user_subscription_userinfo(user):
 def manage_users():
     """获取或添加用户（分组）"""
     if request.method == 'GET':
-        users = User.query.all()
-        return jsonify([_serialize_user(u) for u in users])
+        query = User.query.options(joinedload(User.stats), joinedload(User.template))
+        try:
+            query = _filter_user_listing(query, request.args)
+            page = _list_page_response(
+                query, request.args, USER_LIST_SORT_COLUMNS, 'id', User.id, _serialize_users
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        if page is not None:
+            return jsonify(page)
+        return jsonify(_serialize_users(query.order_by(User.id.asc()).all()))
     
     # POST - 添加用户（分组）
     data = request.get_json()
@@ -2965,12 +4394,15 @@ def manage_users():
     })
 
 
-@app.route('/api/users/<int:user_id>', methods=['PUT', 'DELETE'])
+@app.route('/api/users/<int:user_id>', methods=['GET', 'PUT', 'DELETE'])
 @login_required
 def update_user(user_id):
-    """更新或删除用户（分组）"""
+    """获取、更新或删除用户（分组）"""
     user = User.query.get_or_404(user_id)
     
+    if request.method == 'GET':
+        return jsonify(_serialize_user(user))
+    
     if request.method == 'DELETE':
         db.session.delete(user)
         db.session.commit()
@@ -3008,6 +4440,12 @@ def update_user(user_id):
     
     if 'template_id' in data:
         user.template_id = data['template_id'] if data['template_id'] else None
+
+    if 'output_style' in data:
+        try:
+            user.output_style = _normalize_output_style(data['output_style'], allow_empty=True)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
     
     if 'enabled' in data:
         user.enabled = data['enabled']
@@ -3469,6 +4907,7 @@ def manage_user_nodes(user_id):
         for assignment in UserNode.query.filter_by(user_id=user.id).all()
     }
     UserNode.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    _mark_user_stats_dirty(user.id)
     db.session.flush()
 
     for item in normalized:
@@ -3577,17 +5016,46 @@ def regenerate_user_token(user_id):
 
 # ============ 订阅接口 ============
 
+def _load_subscription_user(token):
+    """
+    按自定义后缀或系统 token 查找订阅用户，一次查询完成并预加载生成订阅所需的关联。
+
+    直接分配的节点和 3x-ui 客户端（含后端配置）分别用一条 selectin 查询批量加载，
+    避免逐个访问关系时的 N+1 查询；订阅分组下的节点由 _query_user_subscription_nodes 单独查询。
+    """
+    candidates = User.query.options(
+        selectinload(User.node_assignments).joinedload(UserNode.node),
+        selectinload(User.xui_clients).joinedload(UserXuiClient.backend),
+    ).filter(or_(User.custom_slug == token, User.subscription_token == token)).all()
+    # 自定义后缀优先于系统 token
+    for user in candidates:
+        if user.custom_slug == token:
+            return user
+    return candidates[0] if candidates else None
+
+
+def _query_user_subscription_nodes(user):
+    """一条查询取出用户所有订阅分组下的节点，按排序字段排序并去重"""
+    return Node.query.join(
+        subscription_node, subscription_node.c.node_id == Node.id
+    ).join(
+        user_subscription_table, user_subscription_table.c.subscription_id == subscription_node.c.subscription_id
+    ).filter(
+        user_subscription_table.c.user_id == user.id
+    ).distinct().order_by(Node.order, Node.id).all()
+
+
 @app.route('/sub/user/<token>')
 def user_subscription(token):
-    """用户订阅接口（支持自定义后缀和系统token）"""
+    """用户订阅接口（支持自定义后缀和系统token，?target= 选择输出格式）"""
     started_at = time.perf_counter()
     stats = {}
 
-    # 先尝试用custom_slug查找，再用subscription_token查找
-    user = User.query.filter_by(custom_slug=token).first()
-    if not user:
-        user = User.query.filter_by(subscription_token=token).first()
-    
+    target = _resolve_subscription_target()
+    if not target:
+        return "Unsupported target", 400
+
+    user = _load_subscription_user(token)
     if not user or not user.enabled:
         return "Invalid subscription", 404
 
@@ -3598,16 +5066,30 @@ def user_subscription(token):
 
     use_subscription_cache = not bool(user.node_assignments or user.xui_clients)
     if use_subscription_cache:
-        cache_entry = _get_subscription_cache('user', user.id)
+        cache_entry = _get_subscription_cache('user', user.id, target)
         if cache_entry:
             _log_subscription_timing('user', user.username, 'HIT', cache_entry.get('stats', {}), started_at)
             return _make_subscription_response(cache_entry, 'HIT')
+
+        # 其他格式已构建过中间结果时只需重新渲染。
+        ir_entry = _get_subscription_cache('user', user.id, SUBSCRIPTION_IR_TARGET)
+        if ir_entry:
+            cache_entry = _render_subscription_entry(
+                'user',
+                user.id,
+                user.username,
+                ir_entry,
+                target=target,
+                subscription_userinfo=_user_subscription_userinfo(user)
+            )
+            _log_subscription_timing('user', user.username, 'PARTIAL', cache_entry['stats'], started_at)
+            return _make_subscription_response(cache_entry, 'PARTIAL')
+    else:
+        _drop_subscription_cache('user', user.id)
     
     # 获取用户的所有订阅下的所有节点，并按排序字段排序
     collect_start = time.perf_counter()
-    all_nodes = []
-    for subscription in user.subscriptions:
-        all_nodes.extend(subscription.nodes)
+    all_nodes = _query_user_subscription_nodes(user)
     direct_assignments = _active_user_node_assignments(user)
     all_nodes.extend([assignment.node for assignment in direct_assignments if assignment.node])
     all_nodes = _dedupe_nodes(all_nodes)
@@ -3617,30 +5099,31 @@ def user_subscription(token):
     if not all_nodes and not xui_proxies:
         return "No nodes available", 404
     
-    # 按order字段排序节点
+    # 按order字段排序节点（直接分配的节点需要和订阅节点合并排序）
     all_nodes.sort(key=lambda n: (n.order if hasattr(n, 'order') and n.order is not None else 0, n.id))
     
-    # 如果用户设置了模板，使用模板生成
+    # 如果用户设置了模板，使用模板生成；用户未指定输出风格时跟随模板
     template_content = None
+    output_style = user.output_style
     if user.template_id:
         template = Template.query.get(user.template_id)
         if template:
             template_content = template.content
+            output_style = output_style or template.output_style
 
-    filename = f'clash_{user.username}.yaml'
     cache_entry = _build_subscription_cache_entry(
         'user',
         user.id,
         user.username,
-        filename,
         all_nodes,
         f"🚀 {user.username} 专属",
         template_content,
-        extra_proxies=xui_proxies
+        subscription_userinfo=_user_subscription_userinfo(user),
+        extra_proxies=xui_proxies,
+        store=use_subscription_cache,
+        target=target,
+        output_style=output_style or 'block'
     )
-    cache_entry['subscription_userinfo'] = _user_subscription_userinfo(user)
-    if not use_subscription_cache:
-        _subscription_cache.pop(('user', user.id), None)
     cache_entry['stats']['collect_ms'] = stats['collect_ms']
     _log_subscription_timing('user', user.username, 'MISS', cache_entry['stats'], started_at)
 
@@ -3649,10 +5132,14 @@ def user_subscription(token):
 
 @app.route('/sub/subscription/<token>')
 def subscription_access(token):
-    """订阅分组访问接口（支持自定义后缀和系统token）"""
+    """订阅分组访问接口（支持自定义后缀和系统token，?target= 选择输出格式）"""
     started_at = time.perf_counter()
     stats = {}
 
+    target = _resolve_subscription_target()
+    if not target:
+        return "Unsupported target", 400
+
     # 先尝试用custom_slug查找，再用subscription_token查找
     subscription = Subscription.query.filter_by(custom_slug=token).first()
     if not subscription:
@@ -3661,10 +5148,22 @@ def subscription_access(token):
     if not subscription:
         return "Invalid subscription", 404
 
-    cache_entry = _get_subscription_cache('subscription', subscription.id)
+    cache_entry = _get_subscription_cache('subscription', subscription.id, target)
     if cache_entry:
         _log_subscription_timing('subscription', subscription.name, 'HIT', cache_entry.get('stats', {}), started_at)
         return _make_subscription_response(cache_entry, 'HIT')
+
+    ir_entry = _get_subscription_cache('subscription', subscription.id, SUBSCRIPTION_IR_TARGET)
+    if ir_entry:
+        cache_entry = _render_subscription_entry(
+            'subscription',
+            subscription.id,
+            subscription.name,
+            ir_entry,
+            target=target
+        )
+        _log_subscription_timing('subscription', subscription.name, 'PARTIAL', cache_entry['stats'], started_at)
+        return _make_subscription_response(cache_entry, 'PARTIAL')
     
     if not subscription.nodes:
         return "No nodes available", 404
@@ -3676,20 +5175,22 @@ def subscription_access(token):
     
     # 如果订阅分组设置了模板，使用模板生成
     template_content = None
+    output_style = 'block'
     if subscription.template_id:
         template = Template.query.get(subscription.template_id)
         if template:
             template_content = template.content
+            output_style = template.output_style or 'block'
 
-    filename = f'clash_{subscription.name}.yaml'
     cache_entry = _build_subscription_cache_entry(
         'subscription',
         subscription.id,
         subscription.name,
-        filename,
         sorted_nodes,
         f"📡 {subscription.name}",
-        template_content
+        template_content,
+        target=target,
+        output_style=output_style
     )
     cache_entry['stats']['collect_ms'] = stats['collect_ms']
     _log_subscription_timing('subscription', subscription.name, 'MISS', cache_entry['stats'], started_at)
@@ -3710,6 +5211,7 @@ def manage_templates():
             'name': t.name,
             'description': t.description,
             'is_default': t.is_default,
+            'output_style': t.output_style or 'block',
             'created_at': t.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'usage_count': len(t.subscriptions) + len(t.users)
         } for t in templates])
@@ -3722,6 +5224,11 @@ def manage_templates():
     
     if not name or not content:
         return jsonify({'success': False, 'message': '模板名称和内容不能为空'}), 400
+
+    try:
+        output_style = _normalize_output_style(data.get('output_style'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
     # 验证YAML格式
     try:
@@ -3734,7 +5241,8 @@ def manage_templates():
         name=name,
         description=description,
         content=content,
-        is_default=False
+        is_default=False,
+        output_style=output_style
     )
     
     db.session.add(template)
@@ -3756,6 +5264,7 @@ def manage_template(template_id):
             'description': template.description,
             'content': template.content,
             'is_default': template.is_default,
+            'output_style': template.output_style or 'block',
             'created_at': template.created_at.strftime('%Y-%m-%d %H:%M:%S')
         })
     
@@ -3766,6 +5275,11 @@ def manage_template(template_id):
             template.name = data['name']
         if 'description' in data:
             template.description = data['description']
+        if 'output_style' in data:
+            try:
+                template.output_style = _normalize_output_style(data['output_style'])
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
         if 'content' in data:
             # 验证YAML格式
             try:
@@ -4434,167 +5948,18 @@ def change_admin_username():
 
 # ============ 初始化数据库 ============
 
-def _ensure_xui_config_schema():
-    """为旧数据库补齐多 3x-ui 后端所需字段。"""
-    with db.engine.begin() as conn:
-        rows = conn.exec_driver_sql("PRAGMA table_info(xui_configs)").fetchall()
-        if not rows:
-            return
-
-        columns = {row[1] for row in rows}
-        if 'name' not in columns:
-            conn.exec_driver_sql("ALTER TABLE xui_configs ADD COLUMN name VARCHAR(120)")
-        if 'created_at' not in columns:
-            conn.exec_driver_sql("ALTER TABLE xui_configs ADD COLUMN created_at DATETIME")
-        if 'public_host' not in columns:
-            conn.exec_driver_sql("ALTER TABLE xui_configs ADD COLUMN public_host VARCHAR(255)")
-
-        conn.exec_driver_sql(
-            "UPDATE xui_configs "
-            "SET name = '默认后端 ' || id "
-            "WHERE name IS NULL OR name = ''"
-        )
-        conn.exec_driver_sql(
-            "UPDATE xui_configs "
-            "SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) "
-            "WHERE created_at IS NULL"
-        )
-        conn.exec_driver_sql(
-            "UPDATE xui_configs "
-            "SET public_host = replace(replace(replace(base_url, 'https://', ''), 'http://', ''), '/panel', '') "
-            "WHERE (public_host IS NULL OR public_host = '') AND base_url IS NOT NULL AND base_url != ''"
-        )
-
-
-def _ensure_user_limit_schema():
-    """为旧数据库补齐用户额度与用户直接节点分配字段。"""
-    with db.engine.begin() as conn:
-        user_rows = conn.exec_driver_sql("PRAGMA table_info(users)").fetchall()
-        if user_rows:
-            user_columns = {row[1] for row in user_rows}
-            if 'traffic_limit' not in user_columns:
-                conn.exec_driver_sql("ALTER TABLE users ADD COLUMN traffic_limit BIGINT DEFAULT 0")
-            if 'traffic_used' not in user_columns:
-                conn.exec_driver_sql("ALTER TABLE users ADD COLUMN traffic_used BIGINT DEFAULT 0")
-
-        conn.exec_driver_sql(
-            """
-            CREATE TABLE IF NOT EXISTS user_nodes (
-                user_id INTEGER NOT NULL,
-                node_id INTEGER NOT NULL,
-                traffic_limit BIGINT DEFAULT 0,
-                traffic_used BIGINT DEFAULT 0,
-                expiry_time BIGINT DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, node_id),
-                FOREIGN KEY(user_id) REFERENCES users (id),
-                FOREIGN KEY(node_id) REFERENCES nodes (id)
-            )
-            """
-        )
-        node_rows = conn.exec_driver_sql("PRAGMA table_info(user_nodes)").fetchall()
-        node_columns = {row[1] for row in node_rows}
-        for column_name, ddl in {
-            'traffic_limit': 'ALTER TABLE user_nodes ADD COLUMN traffic_limit BIGINT DEFAULT 0',
-            'traffic_used': 'ALTER TABLE user_nodes ADD COLUMN traffic_used BIGINT DEFAULT 0',
-            'expiry_time': 'ALTER TABLE user_nodes ADD COLUMN expiry_time BIGINT DEFAULT 0',
-            'created_at': 'ALTER TABLE user_nodes ADD COLUMN created_at DATETIME',
-            'updated_at': 'ALTER TABLE user_nodes ADD COLUMN updated_at DATETIME',
-        }.items():
-            if column_name not in node_columns:
-                conn.exec_driver_sql(ddl)
-
-
-def _ensure_user_xui_client_schema():
-    """Ensure user-to-3x-ui client mappings exist on upgraded databases."""
-    with db.engine.begin() as conn:
-        conn.exec_driver_sql(
-            """
-            CREATE TABLE IF NOT EXISTS user_xui_clients (
-                id INTEGER NOT NULL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                backend_id INTEGER NOT NULL,
-                inbound_id INTEGER NOT NULL,
-                inbound_name VARCHAR(255),
-                inbound_protocol VARCHAR(40),
-                client_email VARCHAR(255) NOT NULL,
-                sub_id VARCHAR(255),
-                display_name VARCHAR(255),
-                comment TEXT,
-                flow VARCHAR(80),
-                limit_ip INTEGER DEFAULT 0,
-                enabled BOOLEAN DEFAULT 1,
-                online BOOLEAN DEFAULT 0,
-                traffic_up BIGINT DEFAULT 0,
-                traffic_down BIGINT DEFAULT 0,
-                traffic_used BIGINT DEFAULT 0,
-                traffic_limit BIGINT DEFAULT 0,
-                expiry_time BIGINT DEFAULT 0,
-                subscription_host VARCHAR(255) DEFAULT '',
-                subscription_port INTEGER DEFAULT 0,
-                raw_client TEXT,
-                raw_inbound TEXT,
-                last_sync_at DATETIME,
-                last_error TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users (id),
-                FOREIGN KEY(backend_id) REFERENCES xui_configs (id)
-            )
-            """
-        )
-        rows = conn.exec_driver_sql("PRAGMA table_info(user_xui_clients)").fetchall()
-        columns = {row[1] for row in rows}
-        for column_name, ddl in {
-            'inbound_name': 'ALTER TABLE user_xui_clients ADD COLUMN inbound_name VARCHAR(255)',
-            'inbound_protocol': 'ALTER TABLE user_xui_clients ADD COLUMN inbound_protocol VARCHAR(40)',
-            'sub_id': 'ALTER TABLE user_xui_clients ADD COLUMN sub_id VARCHAR(255)',
-            'display_name': 'ALTER TABLE user_xui_clients ADD COLUMN display_name VARCHAR(255)',
-            'comment': 'ALTER TABLE user_xui_clients ADD COLUMN comment TEXT',
-            'flow': 'ALTER TABLE user_xui_clients ADD COLUMN flow VARCHAR(80)',
-            'limit_ip': 'ALTER TABLE user_xui_clients ADD COLUMN limit_ip INTEGER DEFAULT 0',
-            'enabled': 'ALTER TABLE user_xui_clients ADD COLUMN enabled BOOLEAN DEFAULT 1',
-            'online': 'ALTER TABLE user_xui_clients ADD COLUMN online BOOLEAN DEFAULT 0',
-            'traffic_up': 'ALTER TABLE user_xui_clients ADD COLUMN traffic_up BIGINT DEFAULT 0',
-            'traffic_down': 'ALTER TABLE user_xui_clients ADD COLUMN traffic_down BIGINT DEFAULT 0',
-            'traffic_used': 'ALTER TABLE user_xui_clients ADD COLUMN traffic_used BIGINT DEFAULT 0',
-            'traffic_limit': 'ALTER TABLE user_xui_clients ADD COLUMN traffic_limit BIGINT DEFAULT 0',
-            'expiry_time': 'ALTER TABLE user_xui_clients ADD COLUMN expiry_time BIGINT DEFAULT 0',
-            'subscription_host': "ALTER TABLE user_xui_clients ADD COLUMN subscription_host VARCHAR(255) DEFAULT ''",
-            'subscription_port': 'ALTER TABLE user_xui_clients ADD COLUMN subscription_port INTEGER DEFAULT 0',
-            'raw_client': 'ALTER TABLE user_xui_clients ADD COLUMN raw_client TEXT',
-            'raw_inbound': 'ALTER TABLE user_xui_clients ADD COLUMN raw_inbound TEXT',
-            'last_sync_at': 'ALTER TABLE user_xui_clients ADD COLUMN last_sync_at DATETIME',
-            'last_error': 'ALTER TABLE user_xui_clients ADD COLUMN last_error TEXT',
-            'created_at': 'ALTER TABLE user_xui_clients ADD COLUMN created_at DATETIME',
-            'updated_at': 'ALTER TABLE user_xui_clients ADD COLUMN updated_at DATETIME',
-        }.items():
-            if column_name not in columns:
-                conn.exec_driver_sql(ddl)
-
-        conn.exec_driver_sql(
-            "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_xui_client_backend_email "
-            "ON user_xui_clients (backend_id, client_email)"
-        )
-        conn.exec_driver_sql(
-            "CREATE INDEX IF NOT EXISTS ix_user_xui_client_user_id "
-            "ON user_xui_clients (user_id)"
-        )
-        conn.exec_driver_sql(
-            "CREATE INDEX IF NOT EXISTS ix_user_xui_client_backend_id "
-            "ON user_xui_clients (backend_id)"
-        )
-
-
 def init_db():
     """初始化数据库"""
     with app.app_context():
         try:
-            db.create_all()
-            _ensure_xui_config_schema()
-            _ensure_user_limit_schema()
-            _ensure_user_xui_client_schema()
+            # 已是最新版本时只读取一次版本号
+            applied = upgrade_schema(db.engine, db.metadata)
+            if applied:
+                print(f"✅ 数据库已迁移到版本 {applied[-1]}")
+            # 旧库升级后没有统计行，列表接口只读，这里一次补齐
+            backfilled = backfill_user_stats()
+            if backfilled:
+                print(f"✅ 已补齐 {backfilled} 个用户的统计")
             
             # 创建默认管理员（如果不存在）
             if not Admin.query.first():
@@ -4736,7 +6101,7 @@ rules:
             print("2. 数据库文件损坏")
             print("\n解决方案：")
             print("选项 1 - 迁移数据库（保留数据）:")
-            print("  python migrate_database.py")
+            print("  python migrations.py")
             print("\n选项 2 - 重置数据库（清空数据）:")
             print("  python reset_database.py")
             print("\n选项 3 - 手动删除数据库:")
@@ -4750,6 +6115,10 @@ rules:
 if __name__ == '__main__':
     init_db()
     
+    # 后台定时刷新上游订阅源，可通过 UPSTREAM_REFRESH=0 关闭
+    if os.environ.get('UPSTREAM_REFRESH', '1') != '0':
+        start_upstream_refresher()
+    
     # 从环境变量或配置文件读取端口
     port = int(os.environ.get('PORT', 5000))
     
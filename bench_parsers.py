@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+分享链接解析基准测试
+按协议生成随机节点配置，导出为分享链接后测量
+ProxyParser.parse_proxy 和 ProxyParser.to_share_url 的吞吐量（链接/秒）。
+节点生成函数同时供往返测试（tests/test_parser_roundtrip.py）使用。
+--query 额外对比 urllib.parse.parse_qs 与 ProxyParser._parse_query 的查询串解析速度。
+"""
+
+import argparse
+import json
+import random
+import statistics
+import string
+import sys
+import time
+import urllib.parse
+
+from parsers import ProxyParser
+
+
+for stream in (sys.stdout, sys.stderr):
+    if hasattr(stream, 'reconfigure'):
+        stream.reconfigure(errors='replace')
+
+
+# 名称和密码中刻意包含需要转义的字符，覆盖 URL 编码和 base64 边界。
+NAME_ALPHABET = string.ascii_letters + string.digits + ' -_.|#%&+=/:@?' + '香港节点日本美国'
+SECRET_ALPHABET = string.ascii_letters + string.digits + '-_.~!$&+=:@/'
+SS_CIPHERS = (
+    'aes-128-gcm', 'aes-256-gcm', 'chacha20-ietf-poly1305',
+    '2022-blake3-aes-128-gcm', '2022-blake3-aes-256-gcm', '2022-blake3-chacha20-poly1305',
+)
+FINGERPRINTS = ('chrome', 'firefox', 'safari', 'ios', 'random')
+ALPN_CHOICES = (['h2'], ['http/1.1'], ['h2', 'http/1.1'], ['h3'])
+
+
+def _text(rng, alphabet, min_length=1, max_length=16):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(min_length, max_length)))
+
+
+def _name(rng, index):
+    return f'{_text(rng, NAME_ALPHABET, 1, 12)}-{index}'
+
+
+def _host(rng):
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+    if kind == 1:
+        return f'2001:db8::{rng.randint(1, 0xffff):x}'
+    return f'{_text(rng, string.ascii_lowercase + string.digits, 3, 10)}.example.com'
+
+
+def _domain(rng):
+    return f'{_text(rng, string.ascii_lowercase, 3, 8)}.example.net'
+
+
+def _uuid(rng):
+    value = f'{rng.getrandbits(128):032x}'
+    return f'{value[:8]}-{value[8:12]}-4{value[13:16]}-8{value[17:20]}-{value[20:]}'
+
+
+def _base(rng, index, proxy_type):
+    return {
+        'name': _name(rng, index),
+        'type': proxy_type,
+        'server': _host(rng),
+        'port': rng.randint(1, 65535),
+    }
+
+
+def _ss_password(rng, cipher):
+    if cipher.startswith('2022-'):
+        # ss2022 的密钥是 base64 串，多用户形式为 "服务端密钥:用户密钥"
+        key = ''.join(rng.choice(string.ascii_letters + string.digits + '+/') for _ in range(43)) + '='
+        return f'{key}:{key[::-1].lstrip("=")}=' if rng.random() < 0.3 else key
+    return _text(rng, SECRET_ALPHABET, 4, 24)
+
+
+def generate_ss(rng, index):
+    proxy = _base(rng, index, 'ss')
+    proxy['cipher'] = rng.choice(SS_CIPHERS)
+    proxy['password'] = _ss_password(rng, proxy['cipher'])
+    if rng.random() < 0.5:
+        proxy['udp'] = True
+    if rng.random() < 0.2:
+        proxy['udp-over-tcp'] = True
+    plugin = rng.randrange(3)
+    if plugin == 1:
+        proxy['plugin'] = 'obfs'
+        proxy['plugin-opts'] = {'mode': rng.choice(('http', 'tls')), 'host': _domain(rng)}
+    elif plugin == 2:
+        proxy['plugin'] = 'v2ray-plugin'
+        proxy['plugin-opts'] = {
+            'mode': 'websocket', 'tls': rng.random() < 0.5, 'host': _domain(rng), 'path': f'/{_text(rng, string.ascii_lowercase)}'
+        }
+    return proxy
+
+
+def generate_ssr(rng, index):
+    proxy = _base(rng, index, 'ssr')
+    proxy.update({
+        'cipher': rng.choice(('aes-256-cfb', 'chacha20-ietf', 'rc4-md5')),
+        'password': _text(rng, SECRET_ALPHABET, 4, 24),
+        'protocol': rng.choice(('origin', 'auth_aes128_md5', 'auth_chain_a')),
+        'obfs': rng.choice(('plain', 'http_simple', 'tls1.2_ticket_auth')),
+        'protocol-param': f'{rng.randint(1, 999)}:{_text(rng, string.ascii_letters)}' if rng.random() < 0.5 else '',
+        'obfs-param': _domain(rng) if rng.random() < 0.5 else '',
+    })
+    return proxy
+
+
+def _ws_opts(rng):
+    return {'path': f'/{_text(rng, string.ascii_lowercase + string.digits)}', 'headers': {'Host': _domain(rng)}}
+
+
+def generate_vmess(rng, index):
+    proxy = _base(rng, index, 'vmess')
+    proxy.update({
+        'uuid': _uuid(rng),
+        'alterId': rng.choice((0, 0, 64)),
+        'cipher': rng.choice(('auto', 'aes-128-gcm', 'chacha20-poly1305', 'none')),
+    })
+    if rng.random() < 0.6:
+        proxy['tls'] = True
+        proxy['servername'] = _domain(rng)
+    network = rng.choice(('tcp', 'ws', 'grpc'))
+    proxy['network'] = network
+    if network == 'ws':
+        proxy['ws-opts'] = _ws_opts(rng)
+    elif network == 'grpc':
+        proxy['grpc-opts'] = {'grpc-service-name': _text(rng, string.ascii_letters)}
+    return proxy
+
+
+def generate_vless(rng, index):
+    proxy = _base(rng, index, 'vless')
+    proxy['uuid'] = _uuid(rng)
+    security = rng.choice(('none', 'tls', 'reality'))
+    network = 'tcp' if security == 'reality' else rng.choice(('tcp', 'ws', 'grpc'))
+    proxy['network'] = network
+    if security != 'none':
+        proxy['tls'] = True
+        proxy['servername'] = _domain(rng)
+        proxy['client-fingerprint'] = rng.choice(FINGERPRINTS)
+    if security == 'reality':
+        # Reality 节点通常搭配 xtls-rprx-vision 流控
+        proxy['flow'] = 'xtls-rprx-vision'
+        proxy['reality-opts'] = {
+            'public-key': _text(rng, string.ascii_letters + string.digits + '-_', 43, 43),
+            'short-id': f'{rng.getrandbits(32):08x}',
+        }
+    if network == 'ws':
+        proxy['ws-opts'] = _ws_opts(rng)
+    elif network == 'grpc':
+        proxy['grpc-opts'] = {'grpc-service-name': _text(rng, string.ascii_letters)}
+    return proxy
+
+
+def generate_trojan(rng, index):
+    proxy = _base(rng, index, 'trojan')
+    proxy['password'] = _text(rng, SECRET_ALPHABET, 4, 24)
+    proxy['sni'] = _domain(rng)
+    if rng.random() < 0.3:
+        proxy['skip-cert-verify'] = True
+    if rng.random() < 0.5:
+        proxy['alpn'] = list(rng.choice(ALPN_CHOICES))
+    if rng.random() < 0.5:
+        proxy['client-fingerprint'] = rng.choice(FINGERPRINTS)
+    network = rng.choice((None, 'ws', 'grpc'))
+    if network == 'ws':
+        proxy['network'] = 'ws'
+        proxy['ws-opts'] = _ws_opts(rng)
+    elif network == 'grpc':
+        proxy['network'] = 'grpc'
+        proxy['grpc-opts'] = {'grpc-service-name': _text(rng, string.ascii_letters)}
+    return proxy
+
+
+def generate_hysteria2(rng, index):
+    proxy = _base(rng, index, 'hysteria2')
+    proxy['password'] = _text(rng, SECRET_ALPHABET, 4, 24)
+    if rng.random() < 0.7:
+        proxy['sni'] = _domain(rng)
+    if rng.random() < 0.3:
+        proxy['skip-cert-verify'] = True
+    if rng.random() < 0.5:
+        proxy['obfs'] = 'salamander'
+        proxy['obfs-password'] = _text(rng, SECRET_ALPHABET, 4, 16)
+    if rng.random() < 0.3:
+        proxy['alpn'] = list(rng.choice(ALPN_CHOICES))
+    if rng.random() < 0.3:
+        proxy['up'] = str(rng.randint(10, 1000))
+        proxy['down'] = str(rng.randint(10, 1000))
+    return proxy
+
+
+def generate_anytls(rng, index):
+    proxy = _base(rng, index, 'anytls')
+    proxy['password'] = _text(rng, SECRET_ALPHABET, 4, 24)
+    if rng.random() < 0.7:
+        proxy['sni'] = _domain(rng)
+    if rng.random() < 0.3:
+        proxy['skip-cert-verify'] = True
+    if rng.random() < 0.5:
+        proxy['client-fingerprint'] = rng.choice(FINGERPRINTS)
+    if rng.random() < 0.3:
+        proxy['alpn'] = list(rng.choice(ALPN_CHOICES))
+    if rng.random() < 0.5:
+        proxy['udp'] = True
+    return proxy
+
+
+def generate_http(rng, index):
+    proxy = _base(rng, index, 'http')
+    if rng.random() < 0.7:
+        proxy['username'] = _text(rng, SECRET_ALPHABET, 1, 12)
+        proxy['password'] = _text(rng, SECRET_ALPHABET, 1, 12)
+    if rng.random() < 0.5:
+        proxy['tls'] = True
+    return proxy
+
+
+def generate_socks5(rng, index):
+    proxy = _base(rng, index, 'socks5')
+    if rng.random() < 0.7:
+        proxy['username'] = _text(rng, SECRET_ALPHABET, 1, 12)
+        proxy['password'] = _text(rng, SECRET_ALPHABET, 1, 12)
+    return proxy
+
+
+PROXY_GENERATORS = {
+    'ss': generate_ss,
+    'ssr': generate_ssr,
+    'vmess': generate_vmess,
+    'vless': generate_vless,
+    'trojan': generate_trojan,
+    'hysteria2': generate_hysteria2,
+    'anytls': generate_anytls,
+    'http': generate_http,
+    'socks5': generate_socks5,
+}
+
+
+def generate_proxies(protocol, count, seed=0):
+    """按协议生成 count 个确定性的随机节点配置。"""
+    rng = random.Random(f'{protocol}-{seed}')
+    generator = PROXY_GENERATORS[protocol]
+    return [generator(rng, index) for index in range(count)]
+
+
+def _median_seconds(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def benchmark(protocols, count, repeat, seed=0):
+    report = []
+    for protocol in protocols:
+        proxies = generate_proxies(protocol, count, seed)
+        links = [ProxyParser.to_share_url(proxy) for proxy in proxies]
+
+        parse_seconds = _median_seconds(lambda: [ProxyParser.parse_proxy(link) for link in links], repeat)
+        export_seconds = _median_seconds(lambda: [ProxyParser.to_share_url(proxy) for proxy in proxies], repeat)
+        report.append({
+            'protocol': protocol,
+            'count': count,
+            'parse_per_sec': count / parse_seconds if parse_seconds else 0.0,
+            'export_per_sec': count / export_seconds if export_seconds else 0.0,
+            'avg_link_bytes': sum(len(link.encode('utf-8')) for link in links) / count,
+        })
+    return report
+
+
+def benchmark_query_parsing(protocols, count, repeat, seed=0):
+    """用生成链接中的查询串对比 parse_qs 与单遍解析器的吞吐量（查询串/秒）"""
+    queries = []
+    for protocol in protocols:
+        for proxy in generate_proxies(protocol, count, seed):
+            link = ProxyParser.to_share_url(proxy).split('#', 1)[0]
+            if '?' in link:
+                queries.append(link.split('?', 1)[1])
+    if not queries:
+        return None
+
+    parse_qs_seconds = _median_seconds(lambda: [urllib.parse.parse_qs(query) for query in queries], repeat)
+    single_pass_seconds = _median_seconds(lambda: [ProxyParser._parse_query(query) for query in queries], repeat)
+    return {
+        'count': len(queries),
+        'parse_qs_per_sec': len(queries) / parse_qs_seconds if parse_qs_seconds else 0.0,
+        'single_pass_per_sec': len(queries) / single_pass_seconds if single_pass_seconds else 0.0,
+    }
+
+
+def print_query_report(query_report):
+    speedup = query_report['single_pass_per_sec'] / query_report['parse_qs_per_sec'] if query_report['parse_qs_per_sec'] else 0.0
+    print(f"\n🔎 查询串解析 ({query_report['count']:,} 条):")
+    print(f"  urllib.parse.parse_qs   {query_report['parse_qs_per_sec']:>14,.0f} 条/秒")
+    print(f"  ProxyParser._parse_query{query_report['single_pass_per_sec']:>14,.0f} 条/秒  (×{speedup:.2f})")
+
+
+def print_report(report, args):
+    print("=" * 66)
+    print(f"📊 分享链接解析基准: count={args.count} repeat={args.repeat} seed={args.seed}")
+    print("=" * 66)
+    print(f"  {'协议':<12}{'解析(链接/秒)':>18}{'导出(链接/秒)':>18}{'平均长度(B)':>14}")
+    for item in report:
+        print(f"  {item['protocol']:<12}{item['parse_per_sec']:>18,.0f}"
+              f"{item['export_per_sec']:>18,.0f}{item['avg_link_bytes']:>14.0f}")
+
+
+def compare_with_baseline(report, baseline_path, threshold):
+    """
+    与基线 JSON 对比，任一协议吞吐量低于基线 (1 - threshold) 倍即视为回归。
+
+    Returns:
+        (回归列表, 各协议相对基线的变化说明)
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {item['protocol']: item for item in json.load(f).get('report', [])}
+
+    regressions = []
+    changes = []
+    for item in report:
+        previous = baseline.get(item['protocol'])
+        if not previous:
+            continue
+        deltas = []
+        for metric in ('parse_per_sec', 'export_per_sec'):
+            if previous[metric]:
+                deltas.append(f"{item[metric] / previous[metric] - 1:+.0%}")
+            if item[metric] < previous[metric] * (1 - threshold):
+                regressions.append(
+                    f"{item['protocol']} {metric}: {previous[metric]:,.0f} → {item[metric]:,.0f} 链接/秒"
+                )
+        changes.append(f"{item['protocol']:<12}解析 {deltas[0]:>6}  导出 {deltas[1]:>6}" if len(deltas) == 2 else item['protocol'])
+    return regressions, changes
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='分享链接解析基准测试 - 各协议解析/导出吞吐量',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用示例:
+  # 所有协议，每个协议 5000 条链接
+  python bench_parsers.py
+
+  # 只测 vless 和 ss，保存为基线
+  python bench_parsers.py --protocols vless ss --json parsers_baseline.json
+
+  # 与基线对比，吞吐量下降超过 20% 时返回非零退出码
+  python bench_parsers.py --compare parsers_baseline.json
+
+  # 同时对比查询串解析（parse_qs 与单遍解析器）
+  python bench_parsers.py --protocols vless trojan hysteria2 anytls --query
+        """
+    )
+    parser.add_argument('--protocols', nargs='+', choices=sorted(PROXY_GENERATORS),
+                        default=list(PROXY_GENERATORS), help='要测试的协议（默认: 全部）')
+    parser.add_argument('--count', type=int, default=5000, help='每个协议的链接数量（默认: 5000）')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取中位数（默认: 5）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（默认: 0）')
+    parser.add_argument('--json', dest='json_output', help='将结果写入 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 基线对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值比例（默认: 0.2）')
+    parser.add_argument('--query', action='store_true', help='额外对比 parse_qs 与单遍查询串解析器')
+    args = parser.parse_args()
+
+    if args.count <= 0 or args.repeat <= 0:
+        parser.error('链接数量和重复次数必须为正数')
+
+    report = benchmark(args.protocols, args.count, args.repeat, seed=args.seed)
+    print_report(report, args)
+
+    query_report = None
+    if args.query:
+        query_report = benchmark_query_parsing(args.protocols, args.count, args.repeat, seed=args.seed)
+        if query_report:
+            print_query_report(query_report)
+
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'report': report, 'query': query_report}, f, ensure_ascii=False, indent=2)
+        print(f"\n📁 结果已保存: {args.json_output}")
+
+    if args.compare:
+        regressions, changes = compare_with_baseline(report, args.compare, args.threshold)
+        if changes:
+            print("\n📈 相对基线的吞吐量变化:")
+            for line in changes:
+                print(f"  {line}")
+        if regressions:
+            print("\n❌ 检测到性能回归:")
+            for line in regressions:
+                print(f"  • {line}")
+            sys.exit(1)
+        print("\n✅ 未检测到性能回归")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  用户中断操作")
+        sys.exit(0)
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+订阅渲染基准测试
+在内存 SQLite 中生成合成节点集，测量
+_build_proxy_configs_with_chain_dependencies → ClashConfigGenerator.generate → _dump_clash_config
+各阶段耗时、内存分配和输出字节数，并对比冷/热缓存。
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from flask import Flask
+
+# 全局 app 也指向内存库，基准测试不会连上 DATABASE_URL 指定的正式库
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import app as web
+from generator import ClashConfigGenerator
+from models import db, Node, Subscription, Template, User
+
+
+for stream in (sys.stdout, sys.stderr):
+    if hasattr(stream, 'reconfigure'):
+        stream.reconfigure(errors='replace')
+
+
+STAGES = ('collect', 'deps', 'generate', 'yaml')
+PROXY_GROUP_NAME = '🚀 bench 专属'
+
+
+def create_bench_app():
+    """创建绑定内存数据库的独立 Flask 应用，避免触碰 clash_manager.db。"""
+    bench_app = Flask('bench_subscription')
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(bench_app)
+    return bench_app
+
+
+def _make_proxy_config(index, rng):
+    """按索引生成一个确定性的代理配置，协议轮换以覆盖不同字段形状。"""
+    name = f'bench-{index:05d}'
+    server = f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+    port = rng.randint(1024, 65535)
+    kind = index % 4
+
+    if kind == 0:
+        return {
+            'name': name, 'type': 'ss', 'server': server, 'port': port,
+            'cipher': 'aes-256-gcm', 'password': f'pw-{index}', 'udp': True
+        }
+    if kind == 1:
+        return {
+            'name': name, 'type': 'vmess', 'server': server, 'port': port,
+            'uuid': f'{index:08x}-0000-4000-8000-000000000000', 'alterId': 0,
+            'cipher': 'auto', 'tls': True, 'network': 'ws',
+            'ws-opts': {'path': f'/ws/{index}', 'headers': {'Host': f'cdn{index}.example.com'}}
+        }
+    if kind == 2:
+        return {
+            'name': name, 'type': 'vless', 'server': server, 'port': port,
+            'uuid': f'{index:08x}-1111-4111-8111-111111111111', 'network': 'tcp',
+            'tls': True, 'flow': 'xtls-rprx-vision', 'servername': 'www.example.com',
+            'reality-opts': {'public-key': f'pk{index:040d}', 'short-id': f'{index:08x}'},
+            'client-fingerprint': 'chrome'
+        }
+    return {
+        'name': name, 'type': 'hysteria2', 'server': server, 'port': port,
+        'password': f'hy2-{index}', 'sni': 'www.example.com', 'skip-cert-verify': False
+    }
+
+
+def _make_template(size_index):
+    """生成规模递增的模板：规则数和代理组数随 size_index 增长。"""
+    group_count = 2 + size_index * 4
+    rule_count = 50 * (1 + size_index * 4)
+    groups = [{
+        'name': PROXY_GROUP_NAME,
+        'type': 'select',
+        'proxies': ['DIRECT', 'PROXY_NODES']
+    }]
+    for group_index in range(group_count):
+        groups.append({
+            'name': f'group-{group_index}',
+            'type': 'url-test' if group_index % 2 else 'select',
+            'url': 'http://www.gstatic.com/generate_204',
+            'interval': 300,
+            'proxies': [PROXY_GROUP_NAME, 'PROXY_NODES']
+        })
+    rules = [
+        f'DOMAIN-SUFFIX,bench{rule_index}.example.com,group-{rule_index % group_count}'
+        for rule_index in range(rule_count)
+    ]
+    rules.append(f'MATCH,{PROXY_GROUP_NAME}')
+    template = {
+        'mixed-port': 7890,
+        'mode': 'rule',
+        'proxies': [],
+        'proxy-groups': groups,
+        'rules': rules,
+    }
+    return web._dump_yaml_bytes(template).decode('utf-8'), rule_count
+
+
+def seed_fleet(node_count, chain_count, template_count, seed=0, output_style='block'):
+    """
+    写入合成节点集。
+
+    Args:
+        node_count: 普通节点数量
+        chain_count: 链式节点数量（dialer-proxy 指向普通节点，依赖节点不在订阅内）
+        template_count: 模板数量，第 0 个场景固定为无模板的默认配置
+        output_style: 用户输出风格，block 或 json
+
+    Returns:
+        [(场景名, 用户令牌), ...]
+    """
+    rng = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    nodes = []
+    for index in range(node_count):
+        config = _make_proxy_config(index, rng)
+        node = Node(name=config['name'], original_name=config['name'], protocol=config['type'], order=index)
+        node.set_config(config)
+        nodes.append(node)
+
+    # 链式节点只引用订阅外的前置节点，使依赖解析阶段必须额外查询并隐藏写入。
+    hidden_nodes = []
+    chain_nodes = []
+    for index in range(chain_count):
+        front = _make_proxy_config(node_count + chain_count + index, rng)
+        front['name'] = f'bench-front-{index:05d}'
+        front_node = Node(name=front['name'], original_name=front['name'], protocol=front['type'], order=0)
+        front_node.set_config(front)
+        hidden_nodes.append(front_node)
+
+        config = _make_proxy_config(node_count + index, rng)
+        config['name'] = f'bench-chain-{index:05d}'
+        config['dialer-proxy'] = front['name']
+        config['__chain_dependencies'] = [front['name']]
+        chain_node = Node(
+            name=config['name'], original_name=config['name'], protocol=config['type'],
+            order=node_count + index
+        )
+        chain_node.set_config(config)
+        chain_nodes.append(chain_node)
+
+    db.session.add_all(nodes + hidden_nodes + chain_nodes)
+
+    subscription = Subscription(name='bench', subscription_token='bench-subscription')
+    subscription.nodes = nodes + chain_nodes
+    db.session.add(subscription)
+
+    scenarios = []
+    for template_index in range(template_count + 1):
+        template_id = None
+        label = 'default'
+        if template_index:
+            content, rule_count = _make_template(template_index - 1)
+            template = Template(name=f'bench-template-{template_index}', content=content)
+            db.session.add(template)
+            db.session.flush()
+            template_id = template.id
+            label = f'template-{template_index}({rule_count} rules)'
+
+        token = f'bench-user-{template_index}'
+        user = User(
+            username=f'bench-{template_index}', subscription_token=token,
+            template_id=template_id, output_style=output_style
+        )
+        user.subscriptions = [subscription]
+        db.session.add(user)
+        scenarios.append((label, token))
+
+    db.session.commit()
+    return scenarios
+
+
+def _collect_user_nodes(user):
+    all_nodes = []
+    for subscription in user.subscriptions:
+        all_nodes.extend(subscription.nodes)
+    all_nodes = web._dedupe_nodes(all_nodes)
+    all_nodes.sort(key=lambda n: (n.order if n.order is not None else 0, n.id))
+    template_content = None
+    if user.template_id:
+        template = db.session.get(Template, user.template_id)
+        if template:
+            template_content = template.content
+    return all_nodes, template_content
+
+
+def run_stages(token, trace_memory=False, output_style='block'):
+    """
+    按 /sub/user 的顺序逐阶段执行一次冷渲染。
+
+    Returns:
+        {stage: {'ms': 耗时, 'alloc_bytes': 净分配, 'peak_bytes': 峰值}}, 输出字节数
+    """
+    db.session.expire_all()
+    results = {}
+    state = {}
+
+    def measure(stage, func):
+        if trace_memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        value = func()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        result = {'ms': elapsed_ms}
+        if trace_memory:
+            after, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['alloc_bytes'] = after - before
+            result['peak_bytes'] = peak - before
+        results[stage] = result
+        return value
+
+    user = User.query.filter_by(subscription_token=token).first()
+    state['nodes'], state['template'] = measure('collect', lambda: _collect_user_nodes(user))
+    proxies = measure('deps', lambda: web._build_proxy_configs_with_chain_dependencies(state['nodes']))
+    generator = ClashConfigGenerator()
+    config = measure('generate', lambda: generator.generate(
+        proxies, PROXY_GROUP_NAME, state['template']
+    ))
+    body = measure('yaml', lambda: web._dump_clash_config(generator, config, output_style))
+    return results, len(body)
+
+
+def run_endpoint(bench_app, token, cold):
+    """通过 user_subscription 视图完整走一次请求，冷模式会先清空订阅缓存。"""
+    if cold:
+        web._invalidate_subscription_cache('bench-cold', publish=False)
+        db.session.expire_all()
+    with bench_app.test_request_context(f'/sub/user/{token}'):
+        start = time.perf_counter()
+        response = web.user_subscription(token)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    cache_status = response.headers.get('X-Subscription-Cache')
+    expected = 'MISS' if cold else 'HIT'
+    if cache_status != expected:
+        raise RuntimeError(f'缓存状态异常: 期望 {expected}，实际 {cache_status}')
+    return elapsed_ms, len(response.get_data())
+
+
+def _median(values):
+    return statistics.median(values) if values else 0.0
+
+
+def benchmark(bench_app, scenarios, repeat, output_style='block'):
+    report = []
+    for label, token in scenarios:
+        stage_runs = {stage: [] for stage in STAGES}
+        output_bytes = 0
+        for _ in range(repeat):
+            results, output_bytes = run_stages(token, output_style=output_style)
+            for stage in STAGES:
+                stage_runs[stage].append(results[stage]['ms'])
+        memory, _ = run_stages(token, trace_memory=True, output_style=output_style)
+
+        cold_runs = []
+        warm_runs = []
+        for _ in range(repeat):
+            cold_ms, _ = run_endpoint(bench_app, token, cold=True)
+            cold_runs.append(cold_ms)
+            warm_ms, _ = run_endpoint(bench_app, token, cold=False)
+            warm_runs.append(warm_ms)
+
+        tracemalloc.start()
+        run_endpoint(bench_app, token, cold=False)
+        _, warm_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report.append({
+            'scenario': label,
+            'bytes': output_bytes,
+            'stages': {
+                stage: {
+                    'ms': round(_median(stage_runs[stage]), 3),
+                    'alloc_bytes': memory[stage]['alloc_bytes'],
+                    'peak_bytes': memory[stage]['peak_bytes'],
+                }
+                for stage in STAGES
+            },
+            'cold_ms': round(_median(cold_runs), 3),
+            'warm_ms': round(_median(warm_runs), 3),
+            'warm_peak_bytes': warm_peak,
+        })
+    return report
+
+
+def print_report(report, args):
+    print("=" * 78)
+    print(f"📊 订阅渲染基准: nodes={args.nodes} chains={args.chains} "
+          f"templates={args.templates} repeat={args.repeat} style={args.output_style}")
+    print("=" * 78)
+    for item in report:
+        print(f"\n🧪 {item['scenario']}  输出 {item['bytes'] / 1024:.1f} KiB")
+        print(f"  {'阶段':<10}{'耗时(ms)':>12}{'净分配(KiB)':>16}{'峰值(KiB)':>14}")
+        for stage in STAGES:
+            stage_result = item['stages'][stage]
+            print(f"  {stage:<10}{stage_result['ms']:>12.2f}"
+                  f"{stage_result['alloc_bytes'] / 1024:>16.1f}{stage_result['peak_bytes'] / 1024:>14.1f}")
+        print(f"  冷缓存请求: {item['cold_ms']:.2f} ms")
+        print(f"  热缓存请求: {item['warm_ms']:.2f} ms  (峰值 {item['warm_peak_bytes'] / 1024:.1f} KiB)")
+
+
+def compare_with_baseline(report, baseline_path, threshold):
+    """与基线 JSON 对比，任一阶段耗时超过 (1 + threshold) 倍即视为回归。"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {item['scenario']: item for item in json.load(f).get('report', [])}
+
+    regressions = []
+    for item in report:
+        previous = baseline.get(item['scenario'])
+        if not previous:
+            continue
+        checks = [(f'{stage}_ms', item['stages'][stage]['ms'], previous['stages'][stage]['ms']) for stage in STAGES]
+        checks.append(('cold_ms', item['cold_ms'], previous['cold_ms']))
+        checks.append(('warm_ms', item['warm_ms'], previous['warm_ms']))
+        for metric, current, old in checks:
+            # 低于 1ms 的阶段噪声太大，不参与回归判断。
+            if old >= 1 and current > old * (1 + threshold):
+                regressions.append(f"{item['scenario']} {metric}: {old:.2f} → {current:.2f} ms")
+    return regressions
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description='订阅渲染基准测试 - 合成节点集的冷/热缓存分阶段耗时',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用示例:
+  # 默认规模
+  python bench_subscription.py
+
+  # 5000 节点、500 链式节点、3 个模板，保存为基线
+  python bench_subscription.py --nodes 5000 --chains 500 --templates 3 --json bench_baseline.json
+
+  # 与基线对比，耗时增长超过 20% 时返回非零退出码
+  python bench_subscription.py --nodes 5000 --chains 500 --templates 3 --compare bench_baseline.json
+        """
+    )
+    parser.add_argument('--nodes', type=int, default=1000, help='普通节点数量（默认: 1000）')
+    parser.add_argument('--chains', type=int, default=100, help='链式节点数量（默认: 100）')
+    parser.add_argument('--templates', type=int, default=2, help='模板数量，规模逐个递增（默认: 2）')
+    parser.add_argument('--repeat', type=int, default=5, help='每个场景重复次数，取中位数（默认: 5）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（默认: 0）')
+    parser.add_argument('--output-style', choices=['block', 'json'], default='block',
+                        help='订阅输出风格（默认: block）')
+    parser.add_argument('--json', dest='json_output', help='将结果写入 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 基线对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值比例（默认: 0.2）')
+    args = parser.parse_args()
+
+    if args.nodes <= 0 or args.chains < 0 or args.templates < 0 or args.repeat <= 0:
+        parser.error('节点数和重复次数必须为正数，链式节点数和模板数不能为负数')
+
+    bench_app = create_bench_app()
+    with bench_app.app_context():
+        print("🔧 正在生成合成节点集...")
+        scenarios = seed_fleet(args.nodes, args.chains, args.templates, seed=args.seed, output_style=args.output_style)
+        report = benchmark(bench_app, scenarios, args.repeat, output_style=args.output_style)
+
+    print_report(report, args)
+
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'report': report}, f, ensure_ascii=False, indent=2)
+        print(f"\n📁 结果已保存: {args.json_output}")
+
+    if args.compare:
+        regressions = compare_with_baseline(report, args.compare, args.threshold)
+        if regressions:
+            print("\n❌ 检测到性能回归:")
+            for line in regressions:
+                print(f"  • {line}")
+            sys.exit(1)
+        print("\n✅ 未检测到性能回归")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  用户中断操作")
+        sys.exit(0)
@@ -6,8 +6,8 @@ Clash Meta 订阅转换器
 
 import argparse
 import sys
-import requests
-from typing import List
+from typing import Iterator, List, Optional
+from fetcher import DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT, fetch_and_parse_many, merge_source_results
 from parsers import ProxyParser
 from generator import ClashConfigGenerator
 
@@ -17,41 +17,56 @@ for stream in (sys.stdout, sys.stderr):
         stream.reconfigure(errors='replace')
 
 
-def fetch_subscription(url: str) -> str:
+def fetch_subscriptions(urls: List[str], timeout: float, concurrency: int, workers: Optional[int]) -> List[dict]:
     """
-    从 URL 获取订阅内容
+    并发获取并解析多个订阅链接
     
     Args:
-        url: 订阅链接
+        urls: 订阅链接列表
+        timeout: 单个订阅的超时秒数
+        concurrency: 同时拉取的订阅数
+        workers: 解析进程数，所有订阅共用
     
     Returns:
-        订阅内容
+        按链接顺序合并后的节点列表
     """
-    try:
-        print(f"📡 正在获取订阅: {url}")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        return response.text
-    except requests.RequestException as e:
-        print(f"❌ 获取订阅失败: {e}")
-        sys.exit(1)
+    print(f"📡 正在并发获取 {len(urls)} 个订阅...")
+    
+    def report_progress(result):
+        if result.ok:
+            print(f"  ✅ [{result.index + 1}] {len(result.proxies)} 个节点 ({result.elapsed:.1f}s) {result.url}")
+        else:
+            print(f"  ❌ [{result.index + 1}] 获取订阅失败: {result.error}")
+    
+    results = fetch_and_parse_many(
+        urls,
+        timeout=timeout,
+        max_workers=concurrency,
+        workers=workers,
+        on_result=report_progress
+    )
+    return merge_source_results(results)
 
 
-def read_subscription_file(file_path: str) -> str:
+def read_subscription_file(file_path: str) -> Iterator[bytes]:
     """
-    从本地文件读取订阅内容
+    从本地文件分块读取订阅内容
     
     Args:
         file_path: 文件路径
     
     Returns:
-        订阅内容
+        订阅内容分块迭代器
     """
     try:
         print(f"📄 正在读取文件: {file_path}")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(ProxyParser.STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    except OSError as e:
         print(f"❌ 读取文件失败: {e}")
         sys.exit(1)
 
@@ -66,9 +81,15 @@ def main():
   # 从订阅链接转换
   python converter.py --url "https://your-subscription-url" --output config.yaml
   
+  # 并发合并多个订阅链接
+  python converter.py --url "https://sub-a" "https://sub-b" "https://sub-c" --output config.yaml
+  
   # 从本地文件转换
   python converter.py --file subscription.txt --output config.yaml
   
+  # 使用全部 CPU 并行解析大型订阅文件
+  python converter.py --file subscription.txt --workers 0 --output config.yaml
+  
   # 添加单个节点
   python converter.py --url "https://sub-url" --nodes "vmess://xxx" --output config.yaml
   
@@ -83,7 +104,8 @@ def main():
     input_group = parser.add_mutually_exclusive_group()
     input_group.add_argument(
         '--url',
-        help='订阅链接 URL'
+        nargs='+',
+        help='订阅链接 URL（可以多个，并发获取后按顺序合并）'
     )
     input_group.add_argument(
         '--file',
@@ -106,6 +128,24 @@ def main():
         default='🚀 节点选择',
         help='代理组名称（默认: 🚀 节点选择）'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='并行解析订阅的进程数（默认串行，0 表示使用全部 CPU）'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f'单个订阅的超时秒数（默认: {DEFAULT_TIMEOUT}）'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f'同时获取的订阅数（默认: {DEFAULT_MAX_WORKERS}）'
+    )
     parser.add_argument(
         '--test',
         action='store_true',
@@ -125,17 +165,17 @@ def main():
     
     # 从订阅获取节点
     if args.url or args.file:
+        parsed_count = len(all_proxies)
         if args.url:
-            subscription_content = fetch_subscription(args.url)
+            all_proxies.extend(fetch_subscriptions(args.url, args.timeout, args.concurrency, args.workers))
         else:
-            subscription_content = read_subscription_file(args.file)
-        
-        print("🔍 正在解析订阅内容...")
-        proxies = ProxyParser.parse_subscription(subscription_content)
+            subscription_chunks = read_subscription_file(args.file)
+            print("🔍 正在解析订阅内容...")
+            all_proxies.extend(ProxyParser.iter_subscription(subscription_chunks, args.workers))
+        parsed_count = len(all_proxies) - parsed_count
         
-        if proxies:
-            print(f"✅ 成功解析 {len(proxies)} 个节点")
-            all_proxies.extend(proxies)
+        if parsed_count:
+            print(f"✅ 成功解析 {parsed_count} 个节点")
         else:
             print("⚠️  未能从订阅中解析到任何节点")
     
@@ -0,0 +1,130 @@
+"""
+数据库连接配置
+从环境变量读取数据库地址和连接池参数，并为每个 SQLite 连接设置 WAL 等 PRAGMA，
+让订阅读取和 3x-ui 同步写入不再互相阻塞。
+
+环境变量:
+    DATABASE_URL              数据库地址（默认 sqlite:///clash_manager.db，相对路径位于 instance 目录）
+    DB_POOL_SIZE              连接池大小
+    DB_MAX_OVERFLOW           连接池溢出上限
+    DB_POOL_TIMEOUT           获取连接的等待秒数
+    DB_POOL_RECYCLE           连接回收秒数
+    SQLITE_JOURNAL_MODE       日志模式（默认 WAL）
+    SQLITE_SYNCHRONOUS        同步级别（默认 NORMAL）
+    SQLITE_BUSY_TIMEOUT_MS    锁等待毫秒数（默认 5000）
+    SQLITE_CACHE_SIZE_KB      页缓存大小 KiB（默认 20000）
+    SQLITE_MMAP_SIZE          内存映射字节数（默认 256 MiB）
+"""
+
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URI = 'sqlite:///clash_manager.db'
+
+# 环境变量 -> create_engine 的连接池参数
+POOL_OPTION_ENV = {
+    'pool_size': 'DB_POOL_SIZE',
+    'max_overflow': 'DB_MAX_OVERFLOW',
+    'pool_timeout': 'DB_POOL_TIMEOUT',
+    'pool_recycle': 'DB_POOL_RECYCLE',
+}
+SQLITE_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SQLITE_SYNCHRONOUS_LEVELS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'环境变量 {name} 必须是整数: {value}')
+
+
+def get_database_uri():
+    """数据库地址，优先使用 DATABASE_URL"""
+    uri = os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URI
+    # 部分平台提供的是 postgres:// 前缀，SQLAlchemy 只识别 postgresql://
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def _env_choice(name, default, choices):
+    value = (os.environ.get(name) or default).upper()
+    if value not in choices:
+        raise ValueError(f'环境变量 {name} 只能是 {", ".join(sorted(choices))}: {value}')
+    return value
+
+
+def get_sqlite_pragmas():
+    """每个 SQLite 连接建立时执行的 PRAGMA，按顺序执行"""
+    return (
+        ('journal_mode', _env_choice('SQLITE_JOURNAL_MODE', 'WAL', SQLITE_JOURNAL_MODES)),
+        ('synchronous', _env_choice('SQLITE_SYNCHRONOUS', 'NORMAL', SQLITE_SYNCHRONOUS_LEVELS)),
+        ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        # 负数表示以 KiB 为单位
+        ('cache_size', -_env_int('SQLITE_CACHE_SIZE_KB', 20000)),
+        ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        ('temp_store', 'MEMORY'),
+    )
+
+
+def is_sqlite_memory(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def get_engine_options(uri):
+    """根据数据库类型生成 SQLALCHEMY_ENGINE_OPTIONS"""
+    url = make_url(uri)
+    options = {}
+
+    if url.get_backend_name() == 'sqlite':
+        # 内存库使用单连接池，不接受连接池参数
+        if is_sqlite_memory(uri):
+            return options
+        # 连接由连接池在多个请求线程和后台刷新线程之间复用；锁等待交给 busy_timeout
+        options['connect_args'] = {
+            'check_same_thread': False,
+            'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000,
+        }
+    else:
+        options['pool_pre_ping'] = True
+
+    for option, env_name in POOL_OPTION_ENV.items():
+        value = _env_int(env_name)
+        if value is not None:
+            options[option] = value
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in get_sqlite_pragmas():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def install_sqlite_pragmas(engine):
+    """为 SQLite 引擎注册连接钩子；其他数据库直接忽略"""
+    if engine.dialect.name != 'sqlite':
+        return False
+    if not event.contains(engine, 'connect', _apply_sqlite_pragmas):
+        event.listen(engine, 'connect', _apply_sqlite_pragmas)
+    return True
+
+
+def configure_database(app):
+    """把数据库地址和引擎参数写入 Flask 配置，需要在 db.init_app 之前调用"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or get_database_uri()
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    engine_options = get_engine_options(uri)
+    engine_options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    return uri
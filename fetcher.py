@@ -0,0 +1,242 @@
+"""
+上游订阅拉取
+使用 ETag / Last-Modified 条件请求，并用内容哈希判断订阅是否真正变化；
+多个订阅通过共享连接池并发拉取，按输入顺序合并结果
+"""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from parsers import ParseReport, ProxyParser
+
+# 并发拉取多个订阅时的默认线程数（也是连接池大小）
+DEFAULT_MAX_WORKERS = 8
+# 单个订阅源从发起请求到读完内容的总超时秒数
+DEFAULT_TIMEOUT = 30
+
+
+class FetchResult:
+    """一次上游拉取的结果"""
+
+    # 服务端返回 304，内容未变化
+    NOT_MODIFIED = 'not_modified'
+    # 服务端返回了内容，但与上次的哈希一致
+    UNCHANGED = 'unchanged'
+    # 内容已变化，需要重新解析
+    CHANGED = 'changed'
+
+    def __init__(self, status, body=b'', etag=None, last_modified=None, content_hash=None):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+
+    @property
+    def changed(self):
+        return self.status == self.CHANGED
+
+
+def build_conditional_headers(etag=None, last_modified=None):
+    """根据上次保存的校验值构造条件请求头"""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def fetch_upstream(url, etag=None, last_modified=None, content_hash=None, session=None, timeout=30):
+    """
+    条件拉取上游订阅
+
+    Args:
+        url: 订阅链接
+        etag: 上次响应的 ETag
+        last_modified: 上次响应的 Last-Modified
+        content_hash: 上次内容的 SHA-256
+        session: requests 模块或 Session，便于复用连接池
+        timeout: 超时秒数
+
+    Returns:
+        FetchResult；请求失败时抛出 requests.RequestException
+    """
+    http = session or requests
+    response = http.get(
+        url,
+        headers=build_conditional_headers(etag, last_modified),
+        timeout=timeout,
+        stream=True
+    )
+    try:
+        if response.status_code == 304:
+            return FetchResult(
+                FetchResult.NOT_MODIFIED,
+                etag=etag,
+                last_modified=last_modified,
+                content_hash=content_hash
+            )
+        response.raise_for_status()
+
+        digest = hashlib.sha256()
+        chunks = []
+        for chunk in response.iter_content(chunk_size=ProxyParser.STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+            chunks.append(chunk)
+        new_hash = digest.hexdigest()
+        headers = response.headers or {}
+        status = FetchResult.UNCHANGED if new_hash == content_hash else FetchResult.CHANGED
+        return FetchResult(
+            status,
+            body=b''.join(chunks) if status == FetchResult.CHANGED else b'',
+            etag=headers.get('ETag'),
+            last_modified=headers.get('Last-Modified'),
+            content_hash=new_hash
+        )
+    finally:
+        response.close()
+
+
+class SourceResult:
+    """单个订阅源的拉取与解析结果"""
+
+    def __init__(self, index, url, proxies=None, report=None, error=None, elapsed=0.0):
+        self.index = index
+        self.url = url
+        self.proxies = proxies or []
+        self.report = report
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def create_session(pool_size=DEFAULT_MAX_WORKERS):
+    """创建连接池大小与并发数匹配的 Session，同一主机的多个订阅复用连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _iter_until_deadline(chunks, deadline, url):
+    """requests 的 timeout 只限制单次读取，这里限制整个下载的总时长"""
+    for chunk in chunks:
+        if time.monotonic() > deadline:
+            raise requests.Timeout(f'读取订阅超时: {url}')
+        yield chunk
+
+
+def fetch_and_parse(url, session=None, timeout=DEFAULT_TIMEOUT, index=0, workers=None, executor=None):
+    """
+    流式拉取并解析单个订阅，边下载边解析；executor 为多个订阅共享的解析进程池
+
+    Returns:
+        SourceResult；网络错误和解析错误记录在 error 中而不抛出
+    """
+    http = session or requests
+    started = time.monotonic()
+    report = ParseReport()
+    try:
+        response = http.get(url, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+            chunks = _iter_until_deadline(
+                response.iter_content(chunk_size=ProxyParser.STREAM_CHUNK_SIZE),
+                started + timeout,
+                url
+            )
+            proxies = list(ProxyParser.iter_subscription(chunks, workers, report=report, executor=executor))
+        finally:
+            response.close()
+    except requests.RequestException as e:
+        return SourceResult(index, url, report=report, error=str(e), elapsed=time.monotonic() - started)
+    except Exception as e:
+        # 单个订阅内容无法解析时只记录到该订阅源，不影响同批次的其他订阅
+        return SourceResult(index, url, report=report, error=f'解析订阅失败: {e}', elapsed=time.monotonic() - started)
+    return SourceResult(index, url, proxies, report, elapsed=time.monotonic() - started)
+
+
+def _create_parse_pool(workers):
+    """
+    所有订阅共用一个解析进程池，进程总数不随并发拉取数增加；workers 为空或 1 时串行解析
+
+    在启动拉取线程之前拉起子进程，避免在多线程状态下 fork。
+    """
+    if workers is not None and workers <= 0:
+        workers = os.cpu_count() or 1
+    if not workers or workers == 1:
+        return None, workers
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pool.submit(os.getpid).result()
+    return pool, workers
+
+
+def iter_fetch_and_parse(urls, session=None, timeout=DEFAULT_TIMEOUT, max_workers=None, workers=None):
+    """并发拉取并解析多个订阅，按完成顺序产出 SourceResult，总耗时取决于最慢的订阅源"""
+    urls = list(urls)
+    if not urls:
+        return
+    max_workers = min(len(urls), max_workers or DEFAULT_MAX_WORKERS)
+    own_session = session is None
+    if own_session:
+        session = create_session(max_workers)
+    parse_pool, workers = _create_parse_pool(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch') as executor:
+            futures = [
+                executor.submit(fetch_and_parse, url, session, timeout, index, workers, parse_pool)
+                for index, url in enumerate(urls)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+        if own_session:
+            session.close()
+
+
+def fetch_and_parse_many(urls, session=None, timeout=DEFAULT_TIMEOUT, max_workers=None, workers=None, on_result=None):
+    """
+    并发拉取并解析多个订阅
+
+    Args:
+        on_result: 每个订阅源完成时的回调（按完成顺序），便于输出进度
+
+    Returns:
+        按输入顺序排列的 SourceResult 列表，结果与完成先后无关
+    """
+    urls = list(urls)
+    results = [None] * len(urls)
+    for result in iter_fetch_and_parse(urls, session, timeout, max_workers, workers):
+        results[result.index] = result
+        if on_result:
+            on_result(result)
+    return results
+
+
+def merge_source_results(results):
+    """按订阅源顺序合并节点，不同订阅中的同名节点追加序号避免名称冲突"""
+    merged = []
+    used_names = set()
+    for result in results:
+        for proxy in result.proxies:
+            name = proxy.get('name')
+            if name in used_names:
+                count = 2
+                while f'{name} {count}' in used_names:
+                    count += 1
+                proxy = dict(proxy, name=f'{name} {count}')
+            used_names.add(proxy.get('name'))
+            merged.append(proxy)
+    return merged
@@ -3,8 +3,10 @@ Clash Meta 配置生成器
 生成包含代理节点和分流规则的完整 Clash 配置
 """
 
+import threading
 import yaml
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 
 try:
     from yaml import CDumper as YamlDumper
@@ -14,9 +16,17 @@ except ImportError:
 
 class ClashConfigGenerator:
     """Clash Meta 配置生成器"""
+
+    # 默认配置中与节点无关的部分（基础设置、DNS、规则）按代理组名称只构建一次，
+    # 所有生成结果共享同一份对象，调用方不得修改。
+    STATIC_SECTIONS_MAX_SIZE = 256
+    DYNAMIC_KEYS = ('proxies', 'proxy-groups')
+    _static_sections = OrderedDict()
+    _static_sections_lock = threading.Lock()
     
     def __init__(self):
         self.config = {}
+        self.static_sections = None
     
     def generate(self, proxies: List[Dict[str, Any]], 
                  proxy_group_name: str = "🚀 节点选择",
@@ -50,20 +60,71 @@ class ClashConfigGenerator:
                 selectable_proxies
             )
         
-        # 否则使用默认配置
-        config = {
-            'mixed-port': 7890,
-            'allow-lan': False,
-            'mode': 'rule',
-            'log-level': 'info',
-            'external-controller': '127.0.0.1:9090',
-            'dns': self._generate_dns_config(),
-            'proxies': output_proxies,
-            'proxy-groups': self._generate_proxy_groups(selectable_proxies, proxy_group_name),
-            'rules': self._generate_rules(proxy_group_name),
-        }
+        # 否则使用默认配置，只有代理组需要按节点重新生成
+        sections = self._get_static_sections(proxy_group_name)
+        self.static_sections = sections
+        config = dict(sections['head'])
+        config['proxies'] = output_proxies
+        config['proxy-groups'] = self._generate_proxy_groups(selectable_proxies, proxy_group_name)
+        config['rules'] = sections['rules']
         
         return config
+
+    @classmethod
+    def _get_static_sections(cls, proxy_group_name: str) -> Dict[str, Any]:
+        """
+        获取默认配置的静态部分（有界 LRU）。
+
+        返回的 serialized 字典供调用方缓存静态部分序列化后的字节，
+        键由调用方决定（如输出风格）。
+        """
+        with cls._static_sections_lock:
+            sections = cls._static_sections.get(proxy_group_name)
+            if sections is not None:
+                cls._static_sections.move_to_end(proxy_group_name)
+                return sections
+
+        generator = cls()
+        sections = {
+            'head': {
+                'mixed-port': 7890,
+                'allow-lan': False,
+                'mode': 'rule',
+                'log-level': 'info',
+                'external-controller': '127.0.0.1:9090',
+                'dns': generator._generate_dns_config(),
+            },
+            'rules': generator._generate_rules(proxy_group_name),
+            'serialized': {},
+        }
+
+        with cls._static_sections_lock:
+            cached = cls._static_sections.setdefault(proxy_group_name, sections)
+            while len(cls._static_sections) > cls.STATIC_SECTIONS_MAX_SIZE:
+                cls._static_sections.popitem(last=False)
+        return cached
+
+    def split_static_sections(self, config: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]]:
+        """
+        将默认配置拆成 (静态前缀, 节点相关部分, 静态后缀)，三段按顺序拼接即为完整配置。
+
+        模板生成的配置或被调用方改动过结构的配置返回 None。
+        """
+        sections = self.static_sections
+        if sections is None:
+            return None
+
+        expected_keys = list(sections['head']) + list(self.DYNAMIC_KEYS) + ['rules']
+        if list(config) != expected_keys:
+            return None
+        if config['rules'] is not sections['rules'] or config['dns'] is not sections['head']['dns']:
+            return None
+        if any(config[key] != value for key, value in sections['head'].items() if key != 'dns'):
+            return None
+
+        head = {key: config[key] for key in sections['head']}
+        dynamic = {key: config[key] for key in self.DYNAMIC_KEYS}
+        return head, dynamic, {'rules': config['rules']}
     
     def _prepare_proxies(self, proxies: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
         """
@@ -404,3 +465,275 @@ class ClashConfigGenerator:
             return False
         
         return True
+
+
+class SingBoxConfigGenerator:
+    """sing-box 配置生成器，将 Clash 格式的节点字典转换为 sing-box outbounds"""
+
+    AUTO_GROUP_NAME = '♻️ 自动选择'
+
+    def generate(self, proxies: List[Dict[str, Any]],
+                 proxy_group_name: str = "🚀 节点选择") -> Dict[str, Any]:
+        """
+        生成 sing-box 配置
+
+        Args:
+            proxies: 代理节点列表（与 ClashConfigGenerator 相同的输入，隐藏节点只作为 detour 目标）
+            proxy_group_name: 选择器出站名称
+
+        Returns:
+            完整的配置字典
+        """
+        if not proxies:
+            raise ValueError("代理节点列表不能为空")
+
+        outbounds = []
+        selectable_tags = []
+        seen_tags = set()
+
+        for proxy in proxies:
+            if not isinstance(proxy, dict):
+                continue
+
+            outbound = self._convert_proxy(proxy)
+            if not outbound or outbound['tag'] in seen_tags:
+                continue
+
+            seen_tags.add(outbound['tag'])
+            outbounds.append(outbound)
+            if proxy.get('__hidden') is not True:
+                selectable_tags.append(outbound['tag'])
+
+        # 前置节点无法转换时，链式节点也无法正确连接，需要一并移除。
+        while True:
+            available_tags = {outbound['tag'] for outbound in outbounds}
+            kept = [
+                outbound for outbound in outbounds
+                if not outbound.get('detour') or outbound['detour'] in available_tags
+            ]
+            if len(kept) == len(outbounds):
+                break
+            outbounds = kept
+
+        available_tags = {outbound['tag'] for outbound in outbounds}
+        selectable_tags = [tag for tag in selectable_tags if tag in available_tags]
+
+        # 没有可转换节点时仍输出合法配置，选择器只保留直连。
+        group_outbounds = [
+            {
+                'type': 'selector',
+                'tag': proxy_group_name,
+                'outbounds': ([self.AUTO_GROUP_NAME] if selectable_tags else []) + ['direct'] + selectable_tags,
+            },
+        ]
+        if selectable_tags:
+            group_outbounds.append({
+                'type': 'urltest',
+                'tag': self.AUTO_GROUP_NAME,
+                'outbounds': selectable_tags,
+                'url': 'http://www.gstatic.com/generate_204',
+                'interval': '5m',
+            })
+
+        return {
+            'log': {'level': 'info'},
+            'inbounds': [
+                {
+                    'type': 'mixed',
+                    'tag': 'mixed-in',
+                    'listen': '127.0.0.1',
+                    'listen_port': 7890,
+                },
+            ],
+            'outbounds': group_outbounds + outbounds + [
+                {'type': 'direct', 'tag': 'direct'},
+            ],
+            'route': {
+                'auto_detect_interface': True,
+                'final': proxy_group_name,
+            },
+        }
+
+    def _convert_proxy(self, proxy: Dict[str, Any]) -> Dict[str, Any]:
+        """转换单个节点，不支持的类型（如 ssr、relay）返回 None。"""
+        proxy_type = str(proxy.get('type', '')).lower()
+        name = proxy.get('name')
+        if not name or not proxy.get('server') or not proxy.get('port'):
+            return None
+
+        outbound = {
+            'tag': name,
+            'server': proxy['server'],
+            'server_port': int(proxy['port']),
+        }
+
+        if proxy_type == 'ss':
+            outbound.update({
+                'type': 'shadowsocks',
+                'method': proxy.get('cipher'),
+                'password': proxy.get('password'),
+            })
+            plugin = self._convert_ss_plugin(proxy)
+            if plugin is False:
+                return None
+            if plugin:
+                outbound.update(plugin)
+            if proxy.get('udp-over-tcp'):
+                outbound['udp_over_tcp'] = True
+        elif proxy_type == 'vmess':
+            outbound.update({
+                'type': 'vmess',
+                'uuid': proxy.get('uuid'),
+                'alter_id': int(proxy.get('alterId') or 0),
+                'security': proxy.get('cipher') or 'auto',
+            })
+        elif proxy_type == 'vless':
+            outbound.update({
+                'type': 'vless',
+                'uuid': proxy.get('uuid'),
+            })
+            if proxy.get('flow'):
+                outbound['flow'] = proxy['flow']
+        elif proxy_type == 'trojan':
+            outbound.update({
+                'type': 'trojan',
+                'password': proxy.get('password'),
+            })
+        elif proxy_type in ('hysteria2', 'hy2'):
+            outbound.update({
+                'type': 'hysteria2',
+                'password': proxy.get('password'),
+            })
+            if proxy.get('obfs'):
+                outbound['obfs'] = {
+                    'type': proxy['obfs'],
+                    'password': proxy.get('obfs-password', ''),
+                }
+        elif proxy_type == 'anytls':
+            outbound.update({
+                'type': 'anytls',
+                'password': proxy.get('password'),
+            })
+        elif proxy_type == 'http':
+            outbound['type'] = 'http'
+            self._copy_auth(proxy, outbound)
+        elif proxy_type in ('socks4', 'socks5'):
+            outbound.update({
+                'type': 'socks',
+                'version': proxy_type[-1],
+            })
+            self._copy_auth(proxy, outbound)
+        else:
+            return None
+
+        tls = self._convert_tls(proxy, proxy_type)
+        if tls:
+            outbound['tls'] = tls
+
+        transport = self._convert_transport(proxy)
+        if transport is False:
+            return None
+        if transport:
+            outbound['transport'] = transport
+
+        dialer_proxy = proxy.get('dialer-proxy')
+        if isinstance(dialer_proxy, str) and dialer_proxy:
+            outbound['detour'] = dialer_proxy
+
+        return outbound
+
+    @staticmethod
+    def _copy_auth(proxy: Dict[str, Any], outbound: Dict[str, Any]):
+        if proxy.get('username'):
+            outbound['username'] = proxy['username']
+        if proxy.get('password'):
+            outbound['password'] = proxy['password']
+
+    @staticmethod
+    def _convert_ss_plugin(proxy: Dict[str, Any]):
+        """转换 SS 插件，返回 None 表示无插件，False 表示插件不受支持。"""
+        plugin = proxy.get('plugin')
+        if not plugin:
+            return None
+
+        opts = proxy.get('plugin-opts') if isinstance(proxy.get('plugin-opts'), dict) else {}
+        if plugin == 'obfs':
+            parts = [f"obfs={opts.get('mode', 'http')}"]
+            if opts.get('host'):
+                parts.append(f"obfs-host={opts['host']}")
+            return {'plugin': 'obfs-local', 'plugin_opts': ';'.join(parts)}
+
+        if plugin == 'v2ray-plugin':
+            parts = [f"mode={opts.get('mode', 'websocket')}"]
+            if opts.get('tls'):
+                parts.append('tls')
+            if opts.get('host'):
+                parts.append(f"host={opts['host']}")
+            if opts.get('path'):
+                parts.append(f"path={opts['path']}")
+            return {'plugin': 'v2ray-plugin', 'plugin_opts': ';'.join(parts)}
+
+        return False
+
+    @staticmethod
+    def _convert_tls(proxy: Dict[str, Any], proxy_type: str) -> Dict[str, Any]:
+        # trojan、hysteria2、anytls 协议本身要求 TLS，其余协议按 tls 字段判断。
+        always_tls = proxy_type in ('trojan', 'hysteria2', 'hy2', 'anytls')
+        if not always_tls and not proxy.get('tls'):
+            return None
+
+        tls = {'enabled': True}
+        server_name = proxy.get('servername') or proxy.get('sni')
+        if server_name:
+            tls['server_name'] = server_name
+        if proxy.get('skip-cert-verify'):
+            tls['insecure'] = True
+        alpn = proxy.get('alpn')
+        if alpn:
+            tls['alpn'] = alpn if isinstance(alpn, list) else [alpn]
+        if proxy.get('client-fingerprint'):
+            tls['utls'] = {'enabled': True, 'fingerprint': proxy['client-fingerprint']}
+
+        reality_opts = proxy.get('reality-opts')
+        if isinstance(reality_opts, dict) and reality_opts.get('public-key'):
+            tls['reality'] = {
+                'enabled': True,
+                'public_key': reality_opts['public-key'],
+                'short_id': reality_opts.get('short-id', ''),
+            }
+        return tls
+
+    @staticmethod
+    def _convert_transport(proxy: Dict[str, Any]):
+        """转换传输层，返回 None 表示 TCP，False 表示传输方式不受支持。"""
+        network = proxy.get('network') or 'tcp'
+        if network == 'tcp':
+            return None
+
+        if network == 'ws':
+            opts = proxy.get('ws-opts') or {}
+            transport = {'type': 'ws', 'path': opts.get('path') or '/'}
+            if opts.get('headers'):
+                transport['headers'] = opts['headers']
+            return transport
+
+        if network == 'grpc':
+            opts = proxy.get('grpc-opts') or {}
+            return {'type': 'grpc', 'service_name': opts.get('grpc-service-name', '')}
+
+        if network == 'h2':
+            opts = proxy.get('h2-opts') or {}
+            transport = {'type': 'http', 'path': opts.get('path') or '/'}
+            if opts.get('host'):
+                transport['host'] = opts['host']
+            return transport
+
+        if network == 'http':
+            opts = proxy.get('http-opts') or {}
+            transport = {'type': 'http'}
+            paths = opts.get('path')
+            if paths:
+                transport['path'] = paths[0] if isinstance(paths, list) else paths
+            return transport
+
+        return False
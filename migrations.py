@@ -0,0 +1,399 @@
+"""
+数据库结构迁移
+每个迁移有一个递增的版本号，执行成功后写入 schema_version 表。启动时只读取已记录的最高版本号，
+已是最新版本时不再检查任何表结构，启动耗时与数据量无关。
+
+迁移只使用 SQLAlchemy 的表达式和反射接口，字段定义按当前数据库方言编译，
+SQLite、PostgreSQL、MySQL 共用同一套迁移。MySQL 的 DDL 不能回滚，迁移中途失败时需要人工检查。
+
+新增字段或表时在末尾追加一个 @migration(下一个版本号, 说明) 函数，不要修改已发布的迁移。
+迁移不引用 models 中的模型：回填数据用到的算法在本文件中按迁移发布时的版本固定下来，
+之后模型变化不会改变迁移结果。
+迁移也可以单独执行: python migrations.py
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.schema import CreateColumn
+
+# schema_version 不属于业务模型，单独放在一个 MetaData 里，create_all 不会带上它
+_version_metadata = sa.MetaData()
+schema_version = sa.Table(
+    'schema_version', _version_metadata,
+    sa.Column('version', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('description', sa.String(255)),
+    sa.Column('applied_at', sa.DateTime),
+)
+
+# [(版本号, 说明, 迁移函数)]，按版本号升序
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """登记一个迁移，函数接收当前事务的连接"""
+    def register(func):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f'迁移版本号必须递增: {version}')
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(engine):
+    """已记录的最高版本号，没有 schema_version 表时返回 None"""
+    # 单独用一个连接查询，表不存在时的报错不会影响后续事务
+    with engine.connect() as conn:
+        try:
+            return conn.execute(sa.select(sa.func.max(schema_version.c.version))).scalar() or 0
+        except DBAPIError:
+            return None
+
+
+def _record(conn, versions):
+    conn.execute(schema_version.insert(), [
+        {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+        for version, description in versions
+    ])
+
+
+def upgrade(engine, metadata):
+    """
+    把数据库升级到最新版本，返回本次执行的版本号列表
+
+    - 空库：按模型建表，直接记录为最新版本
+    - 没有 schema_version 的旧库：补建缺少的表，再依次执行全部迁移（迁移会检查字段是否已存在）
+    - 其他情况：只执行高于已记录版本的迁移
+    """
+    version = current_version(engine)
+    if version is not None and version >= latest_version():
+        return []
+    with engine.begin() as conn:
+        if version is None:
+            fresh = not sa.inspect(conn).get_table_names()
+            metadata.create_all(conn)
+            schema_version.create(conn, checkfirst=True)
+            if fresh:
+                _record(conn, [(number, description) for number, description, _ in MIGRATIONS])
+                return []
+        else:
+            # 迁移只负责改已有的表，新增的表由模型创建
+            metadata.create_all(conn)
+
+    applied = []
+    for number, description, func in MIGRATIONS:
+        if version is not None and number <= version:
+            continue
+        with engine.connect() as conn:
+            # 先写版本记录占位：多个进程同时启动时只有一个能插入成功，其余跳过该迁移
+            try:
+                _record(conn, [(number, description)])
+            except IntegrityError:
+                conn.rollback()
+                continue
+            # 迁移失败时连接关闭即回滚，版本记录一并撤销
+            func(conn)
+            conn.commit()
+        applied.append(number)
+    return applied
+
+
+def _columns(conn, table):
+    inspector = sa.inspect(conn)
+    if not inspector.has_table(table):
+        return None
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def _add_missing_columns(conn, table, *columns):
+    """补齐缺少的字段，字段定义按当前方言编译，返回新增的字段名"""
+    existing = _columns(conn, table)
+    if existing is None:
+        return set()
+    preparer = conn.dialect.identifier_preparer
+    # 字段需要挂在表上才能编译
+    sa.Table(table, sa.MetaData(), *columns)
+    added = set()
+    for column in columns:
+        if column.name not in existing:
+            spec = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.execute(sa.text(f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {spec}"))
+            added.add(column.name)
+    return added
+
+
+def _create_index(conn, name, table, *columns, unique=False):
+    """索引不存在时创建；MySQL 不支持 CREATE INDEX IF NOT EXISTS，先反射检查"""
+    inspector = sa.inspect(conn)
+    existing = {index['name'] for index in inspector.get_indexes(table)}
+    if unique:
+        existing.update(constraint['name'] for constraint in inspector.get_unique_constraints(table))
+    if name in existing:
+        return
+    target = sa.Table(table, sa.MetaData(), *(sa.Column(column) for column in columns))
+    sa.Index(name, *(target.c[column] for column in columns), unique=unique).create(conn)
+
+
+def _nodes_table(*columns):
+    return sa.table('nodes', sa.column('id'), sa.column('config'), *(sa.column(column) for column in columns))
+
+
+def _load_node_configs(conn, *criteria):
+    nodes = _nodes_table()
+    for node_id, config_text in conn.execute(sa.select(nodes.c.id, nodes.c.config).where(*criteria)):
+        try:
+            config = json.loads(config_text)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(config, dict):
+            yield node_id, config
+
+
+def _update_nodes(conn, columns, rows):
+    """按 ID 批量回填节点字段，rows 为 [{'node_id': ..., 字段: 值}]"""
+    if not rows:
+        return
+    nodes = _nodes_table(*columns)
+    conn.execute(
+        nodes.update().where(nodes.c.id == sa.bindparam('node_id'))
+        .values({column: sa.bindparam(column) for column in columns}),
+        rows
+    )
+
+
+# 以下函数复制自迁移发布时的 Node 模型，回填结果固定，不随模型修改
+_FINGERPRINT_FIELDS = ('uuid', 'password', 'username', 'dialer-proxy')
+
+
+def _fingerprint_v6(config):
+    """迁移 6 回填的节点指纹：类型、地址、端口和凭据的 SHA-256"""
+    server = str(config.get('server') or '').strip().lower()
+    if not server:
+        return None
+    proxy_type = str(config.get('type') or '').lower()
+    identity = [
+        'hysteria2' if proxy_type == 'hy2' else proxy_type,
+        server,
+        str(config.get('port') or ''),
+    ]
+    identity.extend(str(config.get(field) or '') for field in _FINGERPRINT_FIELDS)
+    return hashlib.sha256(json.dumps(identity, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _dialer_proxy_v8(config):
+    dialer_proxy = config.get('dialer-proxy')
+    return dialer_proxy if isinstance(dialer_proxy, str) and dialer_proxy else None
+
+
+def _server_v9(config):
+    server = str(config.get('server') or '').strip()
+    return server[:255] or None
+
+
+def _port_v9(config):
+    try:
+        return int(config.get('port'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _chain_dependencies_v9(config):
+    """relay 的 proxies、dialer-proxy 和 __chain_dependencies 中的节点名称，按首次出现去重"""
+    names = []
+    relay_proxies = config.get('proxies') if config.get('type') == 'relay' else None
+    if isinstance(relay_proxies, list):
+        names.extend(relay_proxies)
+    names.append(config.get('dialer-proxy'))
+    explicit_dependencies = config.get('__chain_dependencies')
+    if isinstance(explicit_dependencies, list):
+        names.extend(explicit_dependencies)
+    result = []
+    for name in names:
+        if isinstance(name, str) and name and name not in result:
+            result.append(name)
+    return result
+
+
+@migration(1, '移除用户密码字段')
+def _drop_user_password(conn):
+    columns = _columns(conn, 'users')
+    if columns and 'password_hash' in columns:
+        conn.execute(sa.text("ALTER TABLE users DROP COLUMN password_hash"))
+    _add_missing_columns(conn, 'users', sa.Column('remark', sa.String(255)))
+
+
+@migration(2, '多 3x-ui 后端字段')
+def _xui_config_fields(conn):
+    if _columns(conn, 'xui_configs') is None:
+        return
+    _add_missing_columns(
+        conn, 'xui_configs',
+        sa.Column('name', sa.String(120)),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('public_host', sa.String(255)),
+    )
+    configs = sa.table(
+        'xui_configs', sa.column('id'), sa.column('name', sa.String), sa.column('created_at'),
+        sa.column('updated_at'), sa.column('public_host', sa.String), sa.column('base_url', sa.String)
+    )
+    conn.execute(
+        configs.update()
+        .where(sa.or_(configs.c.name.is_(None), configs.c.name == ''))
+        .values(name=sa.literal('默认后端 ', sa.String) + sa.cast(configs.c.id, sa.String))
+    )
+    conn.execute(
+        configs.update()
+        .where(configs.c.created_at.is_(None))
+        .values(created_at=sa.func.coalesce(configs.c.updated_at, sa.func.current_timestamp()))
+    )
+    host = configs.c.base_url
+    for prefix in ('https://', 'http://', '/panel'):
+        host = sa.func.replace(host, prefix, '')
+    conn.execute(
+        configs.update()
+        .where(
+            sa.or_(configs.c.public_host.is_(None), configs.c.public_host == ''),
+            configs.c.base_url.isnot(None),
+            configs.c.base_url != ''
+        )
+        .values(public_host=host)
+    )
+
+
+@migration(3, '用户额度与直接节点分配字段')
+def _user_limit_fields(conn):
+    _add_missing_columns(
+        conn, 'users',
+        sa.Column('traffic_limit', sa.BigInteger, server_default='0'),
+        sa.Column('traffic_used', sa.BigInteger, server_default='0'),
+    )
+    _add_missing_columns(
+        conn, 'user_nodes',
+        sa.Column('traffic_limit', sa.BigInteger, server_default='0'),
+        sa.Column('traffic_used', sa.BigInteger, server_default='0'),
+        sa.Column('expiry_time', sa.BigInteger, server_default='0'),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('updated_at', sa.DateTime),
+    )
+
+
+@migration(4, '用户 3x-ui 客户端映射字段')
+def _user_xui_client_fields(conn):
+    if _columns(conn, 'user_xui_clients') is None:
+        return
+    _add_missing_columns(
+        conn, 'user_xui_clients',
+        sa.Column('inbound_name', sa.String(255)),
+        sa.Column('inbound_protocol', sa.String(40)),
+        sa.Column('sub_id', sa.String(255)),
+        sa.Column('display_name', sa.String(255)),
+        sa.Column('comment', sa.Text),
+        sa.Column('flow', sa.String(80)),
+        sa.Column('limit_ip', sa.Integer, server_default='0'),
+        sa.Column('enabled', sa.Boolean, server_default=sa.true()),
+        sa.Column('online', sa.Boolean, server_default=sa.false()),
+        sa.Column('traffic_up', sa.BigInteger, server_default='0'),
+        sa.Column('traffic_down', sa.BigInteger, server_default='0'),
+        sa.Column('traffic_used', sa.BigInteger, server_default='0'),
+        sa.Column('traffic_limit', sa.BigInteger, server_default='0'),
+        sa.Column('expiry_time', sa.BigInteger, server_default='0'),
+        sa.Column('subscription_host', sa.String(255), server_default=''),
+        sa.Column('subscription_port', sa.Integer, server_default='0'),
+        sa.Column('raw_client', sa.Text),
+        sa.Column('raw_inbound', sa.Text),
+        sa.Column('last_sync_at', sa.DateTime),
+        sa.Column('last_error', sa.Text),
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('updated_at', sa.DateTime),
+    )
+    _create_index(conn, 'uq_user_xui_client_backend_email', 'user_xui_clients', 'backend_id', 'client_email',
+                  unique=True)
+    _create_index(conn, 'ix_user_xui_client_user_id', 'user_xui_clients', 'user_id')
+    _create_index(conn, 'ix_user_xui_client_backend_id', 'user_xui_clients', 'backend_id')
+
+
+@migration(5, '模板和用户的订阅输出风格')
+def _output_style_fields(conn):
+    _add_missing_columns(conn, 'templates', sa.Column('output_style', sa.String(20), server_default='block'))
+    _add_missing_columns(conn, 'users', sa.Column('output_style', sa.String(20)))
+
+
+@migration(6, '节点身份指纹')
+def _node_fingerprint(conn):
+    if _columns(conn, 'nodes') is None:
+        return
+    _add_missing_columns(conn, 'nodes', sa.Column('fingerprint', sa.String(64)))
+    _create_index(conn, 'ix_nodes_fingerprint', 'nodes', 'fingerprint')
+    updates = []
+    for node_id, config in _load_node_configs(conn, sa.column('fingerprint').is_(None)):
+        fingerprint = _fingerprint_v6(config)
+        if fingerprint:
+            updates.append({'node_id': node_id, 'fingerprint': fingerprint})
+    _update_nodes(conn, ['fingerprint'], updates)
+
+
+@migration(7, '节点来源上游订阅')
+def _node_upstream_source(conn):
+    if _columns(conn, 'nodes') is None:
+        return
+    # ALTER TABLE 追加的字段不带外键约束，关联完整性由应用维护
+    _add_missing_columns(conn, 'nodes', sa.Column('upstream_source_id', sa.Integer))
+    _create_index(conn, 'ix_nodes_upstream_source_id', 'nodes', 'upstream_source_id')
+
+
+@migration(8, '节点 dialer-proxy 字段')
+def _node_dialer_proxy(conn):
+    if _columns(conn, 'nodes') is None:
+        return
+    if _add_missing_columns(conn, 'nodes', sa.Column('dialer_proxy', sa.String(100))):
+        updates = []
+        for node_id, config in _load_node_configs(conn, sa.column('config').contains('dialer-proxy')):
+            dialer_proxy = _dialer_proxy_v8(config)
+            if dialer_proxy:
+                updates.append({'node_id': node_id, 'dialer_proxy': dialer_proxy})
+        _update_nodes(conn, ['dialer_proxy'], updates)
+    _create_index(conn, 'ix_nodes_dialer_proxy', 'nodes', 'dialer_proxy')
+
+
+@migration(9, '节点服务器、端口、链式依赖和更新计数字段')
+def _node_hot_columns(conn):
+    if _columns(conn, 'nodes') is None:
+        return
+    _add_missing_columns(conn, 'nodes', sa.Column('config_version', sa.Integer, nullable=False, server_default='0'))
+    if _add_missing_columns(
+        conn, 'nodes',
+        sa.Column('server', sa.String(255)),
+        sa.Column('port', sa.Integer),
+        sa.Column('chain_dependencies', sa.Text),
+    ):
+        _update_nodes(conn, ['server', 'port', 'chain_dependencies'], [
+            {
+                'node_id': node_id,
+                'server': _server_v9(config),
+                'port': _port_v9(config),
+                'chain_dependencies': '\n'.join(_chain_dependencies_v9(config)) or None,
+            }
+            for node_id, config in _load_node_configs(conn)
+        ])
+    _create_index(conn, 'ix_nodes_server', 'nodes', 'server')
+    _create_index(conn, 'ix_nodes_name', 'nodes', 'name')
+    _create_index(conn, 'ix_nodes_protocol', 'nodes', 'protocol')
+
+
+if __name__ == '__main__':
+    from app import app, db
+
+    with app.app_context():
+        applied = upgrade(db.engine, db.metadata)
+        version = current_version(db.engine)
+    if applied:
+        print(f"✅ 已执行迁移: {', '.join(map(str, applied))}，当前版本 {version}")
+    else:
+        print(f"✅ 数据库已是最新版本 {version}")
@@ -4,8 +4,12 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
+from collections import OrderedDict
 from datetime import datetime
+import hashlib
 import json
+import os
+import threading
 
 db = SQLAlchemy()
 
@@ -51,6 +55,7 @@ class Template(db.Model):
     description = db.Column(db.String(255))  # 模板描述
     content = db.Column(db.Text, nullable=False)  # YAML模板内容
     is_default = db.Column(db.Boolean, default=False)  # 是否为默认模板
+    output_style = db.Column(db.String(20), default='block')  # 输出风格：block（YAML 块格式）或 json（JSON 兼容 YAML）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # 关联的订阅分组和用户
@@ -81,24 +86,189 @@ class Node(db.Model):
     __tablename__ = 'nodes'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)  # 链式依赖按名称查找
     original_name = db.Column(db.String(100))  # 原始名称
-    protocol = db.Column(db.String(20), nullable=False)  # ss, vmess, trojan, etc.
-    config = db.Column(db.Text, nullable=False)  # JSON格式的节点配置
+    protocol = db.Column(db.String(20), nullable=False, index=True)  # ss, vmess, trojan, etc.
+    config = db.Column(db.Text, nullable=False)  # JSON格式的节点配置（紧凑格式，读取时按需解析并缓存）
+    config_version = db.Column(db.Integer, nullable=False, default=0)  # 配置更新计数，作为解析缓存的键
+    server = db.Column(db.String(255), index=True)  # 以下字段从配置提取，查询时无需解析配置
+    port = db.Column(db.Integer)
+    chain_dependencies = db.Column(db.Text)  # 链式依赖的节点名称，每行一个
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=True)  # 保留用于兼容性，但不再使用
-    order = db.Column(db.Integer, default=0)  # 排序字段，数字越小越靠前
+    order = db.Column(db.BigInteger, default=0)  # 排序字段，数字越小越靠前；新节点按间隔分配，调整顺序时取相邻值的中间值
+    fingerprint = db.Column(db.String(64), index=True)  # 节点身份指纹，重复导入时据此去重
+    upstream_source_id = db.Column(db.Integer, db.ForeignKey('upstream_sources.id'), nullable=True, index=True)  # 来源上游订阅
+    dialer_proxy = db.Column(db.String(100), index=True)  # dialer-proxy 前置节点名称，列表页无需解析配置
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # 多对多关系：节点可以属于多个订阅
     subscriptions = db.relationship('Subscription', secondary=subscription_node, back_populates='nodes')
+
+    # 参与身份指纹计算的凭据字段；名称、传输参数等变化视为同一节点的更新
+    FINGERPRINT_FIELDS = ('uuid', 'password', 'username', 'dialer-proxy')
     
+    @staticmethod
+    def compute_fingerprint(config_dict):
+        """按类型、地址、端口和凭据计算节点身份指纹；没有服务器地址的节点（如 relay）返回 None"""
+        server = str(config_dict.get('server') or '').strip().lower()
+        if not server:
+            return None
+
+        proxy_type = str(config_dict.get('type') or '').lower()
+        identity = [
+            'hysteria2' if proxy_type == 'hy2' else proxy_type,
+            server,
+            str(config_dict.get('port') or ''),
+        ]
+        identity.extend(str(config_dict.get(field) or '') for field in Node.FINGERPRINT_FIELDS)
+        return hashlib.sha256(json.dumps(identity, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def extract_dialer_proxy(config_dict):
+        """读取配置中的 dialer-proxy 前置节点名称，未设置时返回 None"""
+        dialer_proxy = config_dict.get('dialer-proxy')
+        return dialer_proxy if isinstance(dialer_proxy, str) and dialer_proxy else None
+
+    @staticmethod
+    def extract_chain_dependencies(config_dict):
+        """提取链式节点依赖的前置/后置节点名称，按首次出现顺序去重"""
+        if not isinstance(config_dict, dict):
+            return []
+
+        dependency_names = []
+        # 旧 relay 方式通过 proxies 数组引用前置和后置节点
+        relay_proxies = config_dict.get('proxies') if config_dict.get('type') == 'relay' else None
+        if isinstance(relay_proxies, list):
+            dependency_names.extend(relay_proxies)
+        # 新 dialer-proxy 方式至少需要前置节点存在于 proxies 中
+        dependency_names.append(config_dict.get('dialer-proxy'))
+        # 新创建的链式节点会记录原始前置/后置节点，供订阅生成时隐藏写入
+        explicit_dependencies = config_dict.get('__chain_dependencies')
+        if isinstance(explicit_dependencies, list):
+            dependency_names.extend(explicit_dependencies)
+
+        seen = set()
+        result = []
+        for name in dependency_names:
+            if isinstance(name, str) and name and name not in seen:
+                seen.add(name)
+                result.append(name)
+        return result
+
+    @property
+    def chain_dependency_names(self):
+        return self.chain_dependencies.split('\n') if self.chain_dependencies else []
+
     def get_config(self):
-        """获取节点配置"""
-        return json.loads(self.config)
+        """获取节点配置；解析结果按 (节点 ID, 更新计数) 缓存，每次返回独立副本"""
+        if self.id is None:
+            return json.loads(self.config)
+        key = (self.id, self.config_version or 0)
+        with _config_cache_lock:
+            cached = _config_cache.get(key)
+            if cached is not None:
+                _config_cache.move_to_end(key)
+        # 同时比较原文，防止删除后重用的节点 ID 命中旧配置
+        if cached is None or cached[0] != self.config:
+            cached = (self.config, json.loads(self.config))
+            with _config_cache_lock:
+                _config_cache[key] = cached
+                while len(_config_cache) > NODE_CONFIG_CACHE_SIZE:
+                    _config_cache.popitem(last=False)
+        return _copy_config(cached[1])
     
     def set_config(self, config_dict):
-        """设置节点配置"""
-        self.config = json.dumps(config_dict, ensure_ascii=False)
+        """设置节点配置，同时更新指纹和从配置提取的查询字段"""
+        for column, value in Node.config_columns(config_dict).items():
+            setattr(self, column, value)
+        self.config_version = (self.config_version or 0) + 1
+
+    @staticmethod
+    def config_columns(config_dict):
+        """配置原文及从配置派生的列，set_config 和批量插入共用"""
+        return {
+            'config': json.dumps(config_dict, ensure_ascii=False, separators=(',', ':')),
+            'fingerprint': Node.compute_fingerprint(config_dict),
+            'dialer_proxy': Node.extract_dialer_proxy(config_dict),
+            'server': Node.extract_server(config_dict),
+            'port': Node.extract_port(config_dict),
+            'chain_dependencies': '\n'.join(Node.extract_chain_dependencies(config_dict)) or None,
+        }
+
+    @staticmethod
+    def extract_server(config_dict):
+        server = str(config_dict.get('server') or '').strip()
+        return server[:255] or None
+
+    @staticmethod
+    def extract_port(config_dict):
+        try:
+            return int(config_dict.get('port'))
+        except (TypeError, ValueError):
+            return None
+
+
+# 节点配置解析缓存（LRU），键为 (节点 ID, 更新计数)
+NODE_CONFIG_CACHE_SIZE = int(os.environ.get('NODE_CONFIG_CACHE_SIZE', '8192'))
+_config_cache = OrderedDict()
+_config_cache_lock = threading.Lock()
+
+
+def _copy_config(value):
+    """复制解析后的配置；只含 JSON 类型，比 copy.deepcopy 快得多"""
+    if type(value) is dict:
+        return {key: _copy_config(item) if type(item) in (dict, list) else item for key, item in value.items()}
+    if type(value) is list:
+        return [_copy_config(item) if type(item) in (dict, list) else item for item in value]
+    return value
+
+
+class UpstreamSource(db.Model):
+    """上游机场订阅源，由后台定时条件拉取并同步到节点"""
+    __tablename__ = 'upstream_sources'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    url = db.Column(db.Text, nullable=False)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=True)  # 同步到的订阅分组
+    enabled = db.Column(db.Boolean, default=True)
+    refresh_interval = db.Column(db.Integer, default=3600)  # 刷新间隔（秒）
+    etag = db.Column(db.String(255))
+    last_modified = db.Column(db.String(64))
+    content_hash = db.Column(db.String(64))  # 上次内容的 SHA-256，内容未变时跳过解析
+    last_checked_at = db.Column(db.DateTime)
+    last_changed_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(20))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    subscription = db.relationship('Subscription')
+    nodes = db.relationship('Node', backref='upstream_source', lazy=True)
+
+    def is_due(self, now=None):
+        """是否到了下一次刷新时间"""
+        if not self.enabled:
+            return False
+        if not self.last_checked_at:
+            return True
+        now = now or datetime.utcnow()
+        return (now - self.last_checked_at).total_seconds() >= (self.refresh_interval or 0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'url': self.url,
+            'subscription_id': self.subscription_id,
+            'enabled': self.enabled,
+            'refresh_interval': self.refresh_interval,
+            'node_count': len(self.nodes),
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+            'last_checked_at': self.last_checked_at.strftime('%Y-%m-%d %H:%M:%S') if self.last_checked_at else None,
+            'last_changed_at': self.last_changed_at.strftime('%Y-%m-%d %H:%M:%S') if self.last_changed_at else None,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+        }
 
 
 class UserNode(db.Model):
@@ -167,6 +337,7 @@ class User(db.Model):
     enabled = db.Column(db.Boolean, default=True)
     remark = db.Column(db.String(255))  # 备注说明
     template_id = db.Column(db.Integer, db.ForeignKey('templates.id'), nullable=True)  # 使用的模板
+    output_style = db.Column(db.String(20), nullable=True)  # 输出风格，为空时跟随模板
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     traffic_limit = db.Column(db.BigInteger, default=0)  # 用户总流量限制，0 表示不限
     traffic_used = db.Column(db.BigInteger, default=0)  # 预留给后续流量统计
@@ -175,6 +346,33 @@ class User(db.Model):
     subscriptions = db.relationship('Subscription', secondary=user_subscription, back_populates='users')
     node_assignments = db.relationship('UserNode', back_populates='user', cascade='all, delete-orphan', lazy=True)
     xui_clients = db.relationship('UserXuiClient', back_populates='user', cascade='all, delete-orphan', lazy=True)
+    # 统计汇总由写入时的会话事件维护，这里只读
+    stats = db.relationship('UserStats', uselist=False, viewonly=True, lazy=True)
+
+
+class UserStats(db.Model):
+    """用户统计汇总表：节点数和已用流量在写入时更新，列表页每个用户只读一行"""
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    subscription_count = db.Column(db.Integer, nullable=False, default=0)
+    subscription_node_count = db.Column(db.Integer, nullable=False, default=0)  # 订阅分组内的去重节点数
+    direct_node_count = db.Column(db.Integer, nullable=False, default=0)  # 有效的直接分配节点数
+    direct_node_total_count = db.Column(db.Integer, nullable=False, default=0)
+    xui_node_count = db.Column(db.Integer, nullable=False, default=0)  # 有效的 3x-ui 客户端数
+    xui_node_total_count = db.Column(db.Integer, nullable=False, default=0)
+    node_count = db.Column(db.Integer, nullable=False, default=0)  # 订阅中实际输出的节点数
+    traffic_used = db.Column(db.BigInteger, nullable=False, default=0)
+    valid_until = db.Column(db.BigInteger, nullable=False, default=0)  # 毫秒时间戳，最早到期的分配过期后需重算，0 表示长期有效
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Sequence(db.Model):
+    """命名序列：UPDATE 自增后读回，事务内持有行锁，并发事务分到的号段不会重叠"""
+    __tablename__ = 'sequences'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
 
 
 class XuiConfig(db.Model):
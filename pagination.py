@@ -0,0 +1,97 @@
+"""
+列表分页
+管理后台的用户、节点列表使用游标（keyset）分页：游标记录上一页最后一行的排序值和 ID，
+下一页直接从索引位置继续读取，翻到多深都不需要 OFFSET 扫描前面的行
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def parse_positive_int(value, default, name, maximum=None):
+    """校验分页参数，必须是正整数；超过 maximum 时取 maximum"""
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} 必须是正整数')
+    if number < 1:
+        raise ValueError(f'{name} 必须是正整数')
+    return min(number, maximum) if maximum else number
+
+
+def encode_cursor(sort_value, row_id):
+    """把排序值和行 ID 编码为不透明的游标字符串"""
+    if isinstance(sort_value, datetime):
+        sort_value = {'dt': sort_value.isoformat()}
+    payload = json.dumps([sort_value, row_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+
+    Returns:
+        (sort_value, row_id)；游标格式不正确时抛出 ValueError
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value['dt'])
+    except (TypeError, ValueError, KeyError, UnicodeError):
+        raise ValueError('cursor 无效')
+    if not isinstance(row_id, int):
+        raise ValueError('cursor 无效')
+    return sort_value, row_id
+
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """
+    按 (sort_column, id_column) 读取一页
+
+    Args:
+        query: 已筛选但未排序的查询
+        sort_column: 排序列（不能为 NULL，可为 coalesce 表达式）
+        id_column: 主键列，保证同值时次序稳定
+        cursor: 上一页返回的 next_cursor，为空时读取第一页
+        limit: 每页条数
+        descending: 是否倒序
+
+    Returns:
+        (rows, next_cursor)；没有下一页时 next_cursor 为 None
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+        else:
+            query = query.filter(or_(
+                sort_column > sort_value,
+                and_(sort_column == sort_value, id_column > row_id)
+            ))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # 多取一行判断是否还有下一页
+    rows = query.add_columns(sort_column.label('_sort_value')).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, last_sort_value = rows[-1][0], rows[-1][1]
+        next_cursor = encode_cursor(last_sort_value, getattr(last, id_column.key))
+    return [row[0] for row in rows], next_cursor
@@ -4,66 +4,225 @@
 """
 
 import base64
+import codecs
+import collections
+import concurrent.futures
 import ipaddress
+import itertools
 import json
+import logging
+import os
 import re
 import urllib.parse
-from typing import Dict, List, Optional, Any
+import time
+import types
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+class ParseReport:
+    """
+    订阅解析报告
+
+    记录检测到的格式、各协议节点数、逐行失败原因和耗时，供导入接口返回给前端。
+    失败明细最多保留 MAX_ERRORS 条，error_count 始终是完整计数。
+    """
+
+    MAX_ERRORS = 200
+
+    # 失败原因代码
+    NOT_A_LINK = 'not_a_link'
+    UNSUPPORTED_SCHEME = 'unsupported_scheme'
+    INVALID_LINK = 'invalid_link'
+    NOT_A_MAPPING = 'not_a_mapping'
+    MISSING_NAME = 'missing_name'
+    MISSING_TYPE = 'missing_type'
+    UNSUPPORTED_TYPE = 'unsupported_type'
+    DECODE_ERROR = 'decode_error'
+    INVALID_JSON = 'invalid_json'
+
+    def __init__(self):
+        self.format = None
+        self.total = 0
+        self.parsed = 0
+        self.protocols = collections.Counter()
+        self.errors = []
+        self.error_count = 0
+        self.elapsed_ms = 0.0
+        self._started_at = time.perf_counter()
+
+    def add_proxy(self, proxy: Dict[str, Any]):
+        self.total += 1
+        self.parsed += 1
+        self.protocols[str(proxy.get('type', 'unknown'))] += 1
+
+    def add_error(self, line: Optional[int], reason: str, content: Any = None):
+        """记录失败项；line 为订阅中的行号或 YAML 节点序号（从 1 开始）"""
+        if line is not None:
+            self.total += 1
+        self.error_count += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append({
+                'line': line,
+                'reason': reason,
+                'content': str(content)[:120] if content is not None else '',
+            })
+
+    def finish(self):
+        self.elapsed_ms = (time.perf_counter() - self._started_at) * 1000
+        logger.info(
+            "订阅解析完成: format=%s parsed=%s/%s errors=%s elapsed=%.1fms",
+            self.format, self.parsed, self.total, self.error_count, self.elapsed_ms
+        )
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'format': self.format,
+            'total': self.total,
+            'parsed': self.parsed,
+            'protocols': dict(self.protocols),
+            'error_count': self.error_count,
+            'errors': list(self.errors),
+            'elapsed_ms': round(self.elapsed_ms, 1),
+        }
+
+
+def _build_alias_lookup(aliases: Mapping[str, Tuple[str, ...]]) -> Mapping[str, Tuple[str, int]]:
+    """把别名表展开为 别名 -> (规范名, 优先级)，解析查询串时一次查表即可归一"""
+    return types.MappingProxyType({
+        alias: (canonical, rank)
+        for canonical, names in aliases.items()
+        for rank, alias in enumerate(names)
+    })
 
 
 class ProxyParser:
     """代理协议解析器基类"""
 
+    # 协议头 -> 解析函数，节点 type -> 分享链接导出函数；由 register_protocol 维护
+    _scheme_parsers: Dict[str, Callable[[str], Optional[Dict[str, Any]]]] = {}
+    _serializers: Dict[str, Callable[[Dict[str, Any]], str]] = {}
+
+    # 流式解析订阅时用于判断格式的开头片段长度，以及建议的读取分块大小
+    SNIFF_SIZE = 64 * 1024
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # 并行解析时每个进程任务包含的行数
+    PARALLEL_BATCH_SIZE = 1000
+
+    # detect_format 识别的订阅格式
+    FORMAT_YAML = 'yaml'
+    FORMAT_SINGBOX = 'singbox'
+    FORMAT_SIP008 = 'sip008'
+    FORMAT_BASE64 = 'base64'
+    FORMAT_PLAIN = 'plain'
+
+    # 行首出现 Clash 配置的顶层字段，或以 YAML 列表形式书写的节点
+    _YAML_MARKER_RE = re.compile(
+        r'^(?:proxies|proxy-groups|proxy-providers|mixed-port|port|socks-port|rules)\s*:'
+        r'|^[ \t]*-\s*(?:\{|name\s*:)',
+        re.MULTILINE
+    )
+
+    # 布尔参数取值表，查表代替每次构造集合
+    _BOOL_VALUES = {
+        '1': True, 'true': True, 'yes': True, 'y': True, 'on': True,
+        '0': False, 'false': False, 'no': False, 'n': False, 'off': False,
+    }
+    _DURATION_RE = re.compile(r'(\d+)(ms|s|m|h)?')
+    _DURATION_MULTIPLIERS = {'s': 1, 'm': 60, 'h': 3600}
+    # 常见的点分十进制 IPv4，不允许前导零，与 ipaddress 的判断一致
+    _IPV4_RE = re.compile(r'(?:(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\.){3}(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)')
+
+    # AnyTLS 参数的别名表：规范名 -> 按优先级排列的别名
+    _ANYTLS_PARAM_ALIASES = types.MappingProxyType({
+        'password': ('password', 'auth'),
+        'sni': ('sni', 'peer'),
+        'insecure': ('insecure', 'allowInsecure', 'skipCertVerify', 'skip-cert-verify'),
+        'client-fingerprint': ('fp', 'client-fingerprint', 'clientFingerprint'),
+        'idle-session-check-interval': (
+            'idle-session-check-interval', 'idle_session_check_interval', 'idleSessionCheckInterval'
+        ),
+        'idle-session-timeout': ('idle-session-timeout', 'idle_session_timeout', 'idleSessionTimeout'),
+        'min-idle-session': ('min-idle-session', 'min_idle_session', 'minIdleSession'),
+    })
+    _ANYTLS_PARAM_LOOKUP = _build_alias_lookup(_ANYTLS_PARAM_ALIASES)
+
     @staticmethod
-    def _get_first_param(params: Dict[str, List[str]], *names: str, default: Any = None) -> Any:
-        for name in names:
-            values = params.get(name)
-            if values:
-                return values[0]
-        return default
+    def _parse_query(
+        query: str,
+        aliases: Optional[Mapping[str, Tuple[str, int]]] = None,
+        repeated: Tuple[str, ...] = ()
+    ) -> Dict[str, str]:
+        """
+        单遍解析 URL 查询串，代替 parse_qs
+
+        与 parse_qs 一样忽略空值，但每个参数只保留一个字符串而不是列表：
+        普通参数取第一次出现的值；repeated 中的参数把多次出现的值用逗号合并；
+        aliases 由模块级 _build_alias_lookup 生成，别名归一为规范名，多个别名同时出现时按优先级取值。
+        """
+        params = {}
+        ranks = {}
+        for pair in query.split('&'):
+            key, _, value = pair.partition('=')
+            if not value:
+                continue
+            if '%' in key or '+' in key:
+                key = urllib.parse.unquote_plus(key)
+            if '%' in value or '+' in value:
+                value = urllib.parse.unquote_plus(value)
+
+            rank = 0
+            if aliases is not None:
+                key, rank = aliases.get(key, (key, 0))
+            if key in params:
+                if key in repeated:
+                    params[key] = f'{params[key]},{value}'
+                elif rank < ranks[key]:
+                    params[key] = value
+                    ranks[key] = rank
+                continue
+            params[key] = value
+            ranks[key] = rank
+        return params
 
     @staticmethod
     def _parse_bool(value: Any) -> Optional[bool]:
         if value is None:
             return None
-
-        normalized = str(value).strip().lower()
-        if normalized in {'1', 'true', 'yes', 'y', 'on'}:
-            return True
-        if normalized in {'0', 'false', 'no', 'n', 'off'}:
-            return False
-        return None
+        if isinstance(value, bool):
+            return value
+        return ProxyParser._BOOL_VALUES.get(str(value).strip().lower())
 
     @staticmethod
     def _parse_duration_seconds(value: Any) -> Optional[int]:
         if value is None:
             return None
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value if value >= 0 else None
 
-        text = str(value).strip().lower()
-        if not text:
-            return None
-
-        match = re.fullmatch(r'(\d+)(ms|s|m|h)?', text)
+        match = ProxyParser._DURATION_RE.fullmatch(str(value).strip().lower())
         if not match:
             return None
 
         amount = int(match.group(1))
         unit = match.group(2) or 's'
-
         if unit == 'ms':
             return max(1, amount // 1000)
-        if unit == 's':
-            return amount
-        if unit == 'm':
-            return amount * 60
-        if unit == 'h':
-            return amount * 3600
-        return None
+        return amount * ProxyParser._DURATION_MULTIPLIERS[unit]
 
     @staticmethod
     def _is_ip_literal(value: str) -> bool:
+        value = value.strip('[]')
+        if ProxyParser._IPV4_RE.fullmatch(value):
+            return True
+        # 域名不含冒号，只有疑似 IPv6 时才交给 ipaddress 校验
+        if ':' not in value:
+            return False
         try:
-            ipaddress.ip_address(value.strip('[]'))
+            ipaddress.ip_address(value)
             return True
         except ValueError:
             return False
@@ -74,6 +233,20 @@ class ProxyParser:
         encoder = base64.urlsafe_b64encode if urlsafe else base64.b64encode
         return encoder(data).decode('utf-8').rstrip('=')
 
+    @staticmethod
+    def _b64_decode_text(value: str) -> str:
+        """解码标准或 URL 安全字母表的 base64 文本，自动补齐填充"""
+        value = value.strip().rstrip('=').replace('+', '-').replace('/', '_')
+        return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('utf-8')
+
+    @staticmethod
+    def _unbracket_host(host: str) -> str:
+        """去掉链接中 IPv6 地址的方括号，Clash 配置中的 server 不带方括号"""
+        host = host.strip()
+        if host.startswith('[') and host.endswith(']'):
+            return host[1:-1]
+        return host
+
     @staticmethod
     def _format_host(host: Any) -> str:
         host_text = str(host or '').strip()
@@ -87,6 +260,14 @@ class ProxyParser:
             return
         params.append((key, str(value)))
 
+    @staticmethod
+    def _append_plugin_opt(parts: List[str], key: str, value: Any):
+        if value is None or value == '':
+            return
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        parts.append(f'{key}={value}')
+
     @staticmethod
     def _append_bool_param(params: List[tuple], key: str, value: Any, true_value: str = '1'):
         parsed = ProxyParser._parse_bool(value)
@@ -116,21 +297,7 @@ class ProxyParser:
             raise ValueError("节点配置无效")
 
         proxy_type = str(proxy.get('type', '')).lower()
-        exporters = {
-            'ss': ProxyParser._to_ss_url,
-            'ssr': ProxyParser._to_ssr_url,
-            'vmess': ProxyParser._to_vmess_url,
-            'vless': ProxyParser._to_vless_url,
-            'trojan': ProxyParser._to_trojan_url,
-            'hysteria2': ProxyParser._to_hysteria2_url,
-            'hy2': ProxyParser._to_hysteria2_url,
-            'anytls': ProxyParser._to_anytls_url,
-            'http': ProxyParser._to_http_url,
-            'socks4': ProxyParser._to_socks_url,
-            'socks5': ProxyParser._to_socks_url,
-        }
-
-        exporter = exporters.get(proxy_type)
+        exporter = ProxyParser._serializers.get(proxy_type)
         if not exporter:
             raise ValueError(f"{proxy_type or '未知'} 类型没有标准分享链接格式")
 
@@ -148,7 +315,13 @@ class ProxyParser:
 
         plugin = proxy.get('plugin')
         plugin_opts = proxy.get('plugin-opts') if isinstance(proxy.get('plugin-opts'), dict) else {}
-        if plugin:
+        if plugin == 'obfs':
+            # SIP003 中 obfs 插件名为 obfs-local，选项为 obfs / obfs-host
+            plugin_parts = ['obfs-local']
+            ProxyParser._append_plugin_opt(plugin_parts, 'obfs', plugin_opts.get('mode'))
+            ProxyParser._append_plugin_opt(plugin_parts, 'obfs-host', plugin_opts.get('host'))
+            params.append(('plugin', ';'.join(plugin_parts)))
+        elif plugin:
             plugin_parts = [str(plugin)]
             plugin_key_map = {
                 'mode': 'mode',
@@ -163,8 +336,7 @@ class ProxyParser:
                 'restls-script': 'restls-script',
             }
             for opt_key, plugin_key in plugin_key_map.items():
-                if opt_key in plugin_opts and plugin_opts[opt_key] not in (None, ''):
-                    plugin_parts.append(f"{plugin_key}={plugin_opts[opt_key]}")
+                ProxyParser._append_plugin_opt(plugin_parts, plugin_key, plugin_opts.get(opt_key))
             params.append(('plugin', ';'.join(plugin_parts)))
 
         link = f"ss://{userinfo}@{host}:{proxy['port']}"
@@ -415,7 +587,7 @@ class ProxyParser:
             params = {}
             if '?' in url:
                 url, params_str = url.split('?', 1)
-                params = urllib.parse.parse_qs(params_str)
+                params = ProxyParser._parse_query(params_str)
             
             # 解码 base64
             if '@' in url:
@@ -485,7 +657,7 @@ class ProxyParser:
             node = {
                 'name': name,
                 'type': 'ss',
-                'server': server.strip(),
+                'server': ProxyParser._unbracket_host(server),
                 'port': int(port.strip()),
                 'cipher': method.strip(),
                 'password': password.strip(),
@@ -495,15 +667,15 @@ class ProxyParser:
             if params:
                 # UDP 支持
                 if 'udp' in params:
-                    node['udp'] = params['udp'][0] == 'true' or params['udp'][0] == '1'
+                    node['udp'] = params['udp'] == 'true' or params['udp'] == '1'
                 
                 # udp-over-tcp
                 if 'uot' in params:
-                    node['udp-over-tcp'] = params['uot'][0] == 'true' or params['uot'][0] == '1'
+                    node['udp-over-tcp'] = params['uot'] == 'true' or params['uot'] == '1'
                 
                 # plugin 参数 (SIP002 格式: plugin=name;opt1=val1;opt2=val2)
                 if 'plugin' in params:
-                    plugin_str = params['plugin'][0]
+                    plugin_str = params['plugin']
                     plugin_parts = plugin_str.split(';')
                     
                     if plugin_parts:
@@ -515,6 +687,9 @@ class ProxyParser:
                             if '=' in part:
                                 key, value = part.split('=', 1)
                                 plugin_opts[key] = value
+                            elif part:
+                                # v2ray-plugin 的 tls、mux 等开关没有值
+                                plugin_opts[part] = 'true'
                         
                         # 识别插件类型并转换为 Clash 格式
                         if 'obfs' in plugin_name:
@@ -602,9 +777,7 @@ class ProxyParser:
             
             return node
         except Exception as e:
-            print(f"解析 SS 链接失败: {e}, URL: {url[:100]}")
-            import traceback
-            traceback.print_exc()
+            logger.debug("解析 SS 链接失败: %s, URL: %s", e, url[:100], exc_info=True)
             return None
     
     @staticmethod
@@ -618,29 +791,29 @@ class ProxyParser:
                 return None
             
             url = url[6:]  # 移除 ssr://
-            decoded = base64.b64decode(url + '=' * (4 - len(url) % 4)).decode('utf-8')
+            decoded = ProxyParser._b64_decode_text(url)
             
             # 分离主体和参数
             main_part, _, params_part = decoded.partition('/?')
             
             # 解析主体
-            parts = main_part.split(':')
+            parts = main_part.rsplit(':', 5)
             if len(parts) != 6:
                 return None
             
             server, port, protocol, method, obfs, password_b64 = parts
-            password = base64.b64decode(password_b64 + '=' * (4 - len(password_b64) % 4)).decode('utf-8')
+            password = ProxyParser._b64_decode_text(password_b64)
             
             # 解析参数
-            params = urllib.parse.parse_qs(params_part)
-            name = base64.b64decode(params.get('remarks', [b''])[0] + b'=' * 4).decode('utf-8') if params.get('remarks') else 'SSR节点'
-            obfs_param = base64.b64decode(params.get('obfsparam', [b''])[0] + b'=' * 4).decode('utf-8') if params.get('obfsparam') else ''
-            protocol_param = base64.b64decode(params.get('protoparam', [b''])[0] + b'=' * 4).decode('utf-8') if params.get('protoparam') else ''
+            params = ProxyParser._parse_query(params_part)
+            name = ProxyParser._b64_decode_text(params['remarks']) if params.get('remarks') else 'SSR节点'
+            obfs_param = ProxyParser._b64_decode_text(params['obfsparam']) if params.get('obfsparam') else ''
+            protocol_param = ProxyParser._b64_decode_text(params['protoparam']) if params.get('protoparam') else ''
             
             return {
                 'name': name,
                 'type': 'ssr',
-                'server': server,
+                'server': ProxyParser._unbracket_host(server),
                 'port': int(port),
                 'cipher': method,
                 'password': password,
@@ -650,7 +823,7 @@ class ProxyParser:
                 'obfs-param': obfs_param,
             }
         except Exception as e:
-            print(f"解析 SSR 链接失败: {e}")
+            logger.debug("解析 SSR 链接失败: %s", e)
             return None
     
     @staticmethod
@@ -712,7 +885,7 @@ class ProxyParser:
             
             return node
         except Exception as e:
-            print(f"解析 VMess 链接失败: {e}")
+            logger.debug("解析 VMess 链接失败: %s", e)
             return None
     
     @staticmethod
@@ -743,84 +916,84 @@ class ProxyParser:
             node = {
                 'name': name,
                 'type': 'vless',
-                'server': server,
+                'server': ProxyParser._unbracket_host(server),
                 'port': int(port),
                 'uuid': uuid,
             }
             
             # 解析参数
             if params_part:
-                params = urllib.parse.parse_qs(params_part)
+                params = ProxyParser._parse_query(params_part)
                 
                 # 加密方式
-                encryption = params.get('encryption', ['none'])[0]
+                encryption = params.get('encryption', 'none')
                 if encryption and encryption != 'none':
                     node['encryption'] = encryption
                 
                 # 传输协议
-                network = params.get('type', ['tcp'])[0]
+                network = params.get('type', 'tcp')
                 node['network'] = network
                 
                 # 流控 (flow)
                 if params.get('flow'):
-                    node['flow'] = params['flow'][0]
+                    node['flow'] = params['flow']
                 
                 # TLS/Reality
-                security = params.get('security', [''])[0]
+                security = params.get('security', '')
                 if security == 'tls':
                     node['tls'] = True
                     if params.get('sni'):
-                        node['servername'] = params['sni'][0]
+                        node['servername'] = params['sni']
                     # 跳过证书验证
                     if params.get('allowInsecure'):
-                        node['skip-cert-verify'] = params['allowInsecure'][0] == '1'
+                        node['skip-cert-verify'] = params['allowInsecure'] == '1'
                     # 客户端指纹
                     if params.get('fp'):
-                        node['client-fingerprint'] = params['fp'][0]
+                        node['client-fingerprint'] = params['fp']
                 elif security == 'reality':
                     node['tls'] = True
                     node['reality-opts'] = {}
                     if params.get('pbk'):
-                        node['reality-opts']['public-key'] = params['pbk'][0]
+                        node['reality-opts']['public-key'] = params['pbk']
                     if params.get('sid'):
-                        node['reality-opts']['short-id'] = params['sid'][0]
+                        node['reality-opts']['short-id'] = params['sid']
                     if params.get('sni'):
-                        node['servername'] = params['sni'][0]
+                        node['servername'] = params['sni']
                     # 跳过证书验证
                     if params.get('allowInsecure'):
-                        node['skip-cert-verify'] = params['allowInsecure'][0] == '1'
+                        node['skip-cert-verify'] = params['allowInsecure'] == '1'
                     # 客户端指纹
                     if params.get('fp'):
-                        node['client-fingerprint'] = params['fp'][0]
+                        node['client-fingerprint'] = params['fp']
                 
                 # TCP Fast Open
                 if params.get('tfo'):
-                    node['tfo'] = params['tfo'][0] == '1'
+                    node['tfo'] = params['tfo'] == '1'
                 
                 # WebSocket 配置
                 if network == 'ws':
                     node['ws-opts'] = {}
                     if params.get('path'):
-                        node['ws-opts']['path'] = params['path'][0]
+                        node['ws-opts']['path'] = params['path']
                     if params.get('host'):
-                        node['ws-opts']['headers'] = {'Host': params['host'][0]}
+                        node['ws-opts']['headers'] = {'Host': params['host']}
                 
                 # gRPC 配置
                 elif network == 'grpc':
                     node['grpc-opts'] = {}
                     if params.get('serviceName'):
-                        node['grpc-opts']['grpc-service-name'] = params['serviceName'][0]
+                        node['grpc-opts']['grpc-service-name'] = params['serviceName']
                 
                 # TCP 配置
                 elif network == 'tcp':
-                    if params.get('headerType', [''])[0] == 'http':
+                    if params.get('headerType', '') == 'http':
                         node['network'] = 'http'
                         if params.get('path'):
-                            node['http-opts'] = {'path': [params['path'][0]]}
+                            node['http-opts'] = {'path': [params['path']]}
             
             return node
         except Exception as e:
-            print(f"解析 VLESS 链接失败: {e}")
+            logger.debug("解析 VLESS 链接失败: %s", e)
             return None
     
     @staticmethod
@@ -857,32 +1030,42 @@ class ProxyParser:
             node = {
                 'name': name,
                 'type': 'hysteria2',
-                'server': server,
+                'server': ProxyParser._unbracket_host(server),
                 'port': int(port),
                 'password': password,
             }
             
             # 解析参数
             if params_part:
-                params = urllib.parse.parse_qs(params_part)
+                params = ProxyParser._parse_query(params_part)
                 
                 # SNI
                 if params.get('sni'):
-                    node['sni'] = params['sni'][0]
+                    node['sni'] = params['sni']
                 
                 # 跳过证书验证
-                if params.get('insecure', [''])[0] == '1':
+                if params.get('insecure', '') == '1':
                     node['skip-cert-verify'] = True
                 
                 # 混淆
                 if params.get('obfs'):
-                    node['obfs'] = params['obfs'][0]
+                    node['obfs'] = params['obfs']
                 if params.get('obfs-password'):
-                    node['obfs-password'] = params['obfs-password'][0]
+                    node['obfs-password'] = params['obfs-password']
+
+                # 证书指纹、ALPN 和带宽
+                if params.get('pinSHA256'):
+                    node['fingerprint'] = params['pinSHA256']
+                if params.get('alpn'):
+                    node['alpn'] = params['alpn'].split(',')
+                if params.get('upmbps'):
+                    node['up'] = params['upmbps']
+                if params.get('downmbps'):
+                    node['down'] = params['downmbps']
             
             return node
         except Exception as e:
-            print(f"解析 Hysteria2 链接失败: {e}")
+            logger.debug("解析 Hysteria2 链接失败: %s", e)
             return None
 
     @staticmethod
@@ -905,9 +1088,13 @@ class ProxyParser:
             except ValueError:
                 return None
 
-            params = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+            params = ProxyParser._parse_query(
+                parsed.query,
+                aliases=ProxyParser._ANYTLS_PARAM_LOOKUP,
+                repeated=('alpn',)
+            )
             userinfo = parsed.netloc.rsplit('@', 1)[0] if '@' in parsed.netloc else None
-            password = userinfo or ProxyParser._get_first_param(params, 'password', 'auth')
+            password = userinfo or params.get('password')
             if not password:
                 return None
 
@@ -922,82 +1109,47 @@ class ProxyParser:
                 'password': password,
             }
 
-            sni = ProxyParser._get_first_param(params, 'sni', 'peer')
+            sni = params.get('sni')
             if sni and not ProxyParser._is_ip_literal(sni):
                 node['sni'] = sni
 
-            insecure = ProxyParser._get_first_param(
-                params,
-                'insecure',
-                'allowInsecure',
-                'skipCertVerify',
-                'skip-cert-verify'
-            )
-            skip_cert_verify = ProxyParser._parse_bool(insecure)
+            skip_cert_verify = ProxyParser._parse_bool(params.get('insecure'))
             if skip_cert_verify is not None:
                 node['skip-cert-verify'] = skip_cert_verify
 
-            udp = ProxyParser._get_first_param(params, 'udp')
-            udp_enabled = ProxyParser._parse_bool(udp)
+            udp_enabled = ProxyParser._parse_bool(params.get('udp'))
             if udp_enabled is not None:
                 node['udp'] = udp_enabled
 
-            tfo = ProxyParser._get_first_param(params, 'tfo')
-            tfo_enabled = ProxyParser._parse_bool(tfo)
+            tfo_enabled = ProxyParser._parse_bool(params.get('tfo'))
             if tfo_enabled is not None:
                 node['tfo'] = tfo_enabled
 
-            client_fingerprint = ProxyParser._get_first_param(
-                params,
-                'fp',
-                'client-fingerprint',
-                'clientFingerprint'
-            )
-            if client_fingerprint:
-                node['client-fingerprint'] = client_fingerprint
+            if params.get('client-fingerprint'):
+                node['client-fingerprint'] = params['client-fingerprint']
 
-            fingerprint = ProxyParser._get_first_param(params, 'fingerprint')
-            if fingerprint:
-                node['fingerprint'] = fingerprint
+            if params.get('fingerprint'):
+                node['fingerprint'] = params['fingerprint']
 
-            alpn_values = []
-            for value in params.get('alpn', []):
-                alpn_values.extend([item.strip() for item in value.split(',') if item.strip()])
+            alpn_values = [item.strip() for item in params.get('alpn', '').split(',') if item.strip()]
             if alpn_values:
                 node['alpn'] = alpn_values
 
-            idle_check = ProxyParser._get_first_param(
-                params,
-                'idle-session-check-interval',
-                'idle_session_check_interval',
-                'idleSessionCheckInterval'
-            )
-            idle_check_seconds = ProxyParser._parse_duration_seconds(idle_check)
+            idle_check_seconds = ProxyParser._parse_duration_seconds(params.get('idle-session-check-interval'))
             if idle_check_seconds is not None:
                 node['idle-session-check-interval'] = idle_check_seconds
 
-            idle_timeout = ProxyParser._get_first_param(
-                params,
-                'idle-session-timeout',
-                'idle_session_timeout',
-                'idleSessionTimeout'
-            )
-            idle_timeout_seconds = ProxyParser._parse_duration_seconds(idle_timeout)
+            idle_timeout_seconds = ProxyParser._parse_duration_seconds(params.get('idle-session-timeout'))
             if idle_timeout_seconds is not None:
                 node['idle-session-timeout'] = idle_timeout_seconds
 
-            min_idle_session = ProxyParser._get_first_param(
-                params,
-                'min-idle-session',
-                'min_idle_session',
-                'minIdleSession'
-            )
+            min_idle_session = params.get('min-idle-session')
             if min_idle_session is not None and str(min_idle_session).isdigit():
                 node['min-idle-session'] = int(min_idle_session)
 
             return node
         except Exception as e:
-            print(f"解析 AnyTLS 链接失败: {e}")
+            logger.debug("解析 AnyTLS 链接失败: %s", e)
             return None
     
     @staticmethod
@@ -1030,68 +1182,68 @@ class ProxyParser:
             node = {
                 'name': name,
                 'type': 'trojan',
-                'server': server,
+                'server': ProxyParser._unbracket_host(server),
                 'port': int(port),
                 'password': password,
             }
             
             # 解析参数
             if params_part:
-                params = urllib.parse.parse_qs(params_part)
+                params = ProxyParser._parse_query(params_part)
                 
                 # SNI
                 if params.get('sni'):
-                    node['sni'] = params['sni'][0]
+                    node['sni'] = params['sni']
                 
                 # ALPN
                 if params.get('alpn'):
-                    node['alpn'] = params['alpn'][0].split(',')
+                    node['alpn'] = params['alpn'].split(',')
                 
                 # 客户端指纹
                 if params.get('fp'):
-                    node['client-fingerprint'] = params['fp'][0]
+                    node['client-fingerprint'] = params['fp']
                 
                 # fingerprint (证书指纹)
                 if params.get('fingerprint'):
-                    node['fingerprint'] = params['fingerprint'][0]
+                    node['fingerprint'] = params['fingerprint']
                 
                 # 跳过证书验证
-                if params.get('allowInsecure', [''])[0] == '1' or params.get('skipCertVerify', [''])[0] == '1':
+                if params.get('allowInsecure', '') == '1' or params.get('skipCertVerify', '') == '1':
                     node['skip-cert-verify'] = True
                 
                 # UDP 支持
                 if params.get('udp'):
-                    node['udp'] = params['udp'][0] == 'true' or params['udp'][0] == '1'
+                    node['udp'] = params['udp'] == 'true' or params['udp'] == '1'
                 
                 # 安全协议 (Reality)
-                security = params.get('security', [''])[0]
+                security = params.get('security', '')
                 if security == 'reality':
                     node['reality-opts'] = {}
                     if params.get('pbk'):
-                        node['reality-opts']['public-key'] = params['pbk'][0]
+                        node['reality-opts']['public-key'] = params['pbk']
                     if params.get('sid'):
-                        node['reality-opts']['short-id'] = params['sid'][0]
+                        node['reality-opts']['short-id'] = params['sid']
                 
                 # 传输协议
                 if params.get('type'):
-                    network = params['type'][0]
+                    network = params['type']
                     node['network'] = network
                     
                     if network == 'ws':
                         node['ws-opts'] = {}
                         if params.get('path'):
-                            node['ws-opts']['path'] = params['path'][0]
+                            node['ws-opts']['path'] = params['path']
                         if params.get('host'):
-                            node['ws-opts']['headers'] = {'Host': params['host'][0]}
+                            node['ws-opts']['headers'] = {'Host': params['host']}
                     
                     elif network == 'grpc':
                         node['grpc-opts'] = {}
                         if params.get('serviceName'):
-                            node['grpc-opts']['grpc-service-name'] = params['serviceName'][0]
+                            node['grpc-opts']['grpc-service-name'] = params['serviceName']
             
             return node
         except Exception as e:
-            print(f"解析 Trojan 链接失败: {e}")
+            logger.debug("解析 Trojan 链接失败: %s", e)
             return None
     
     @staticmethod
@@ -1149,7 +1301,7 @@ class ProxyParser:
             node = {
                 'name': name,
                 'type': 'http',
-                'server': server.strip(),
+                'server': ProxyParser._unbracket_host(server),
                 'port': int(port),
             }
             
@@ -1164,7 +1316,7 @@ class ProxyParser:
             
             return node
         except Exception as e:
-            print(f"解析 HTTP/HTTPS 链接失败: {e}")
+            logger.debug("解析 HTTP/HTTPS 链接失败: %s", e)
             return None
     
     @staticmethod
@@ -1224,7 +1376,7 @@ class ProxyParser:
             node = {
                 'name': name,
                 'type': socks_type,
-                'server': server.strip(),
+                'server': ProxyParser._unbracket_host(server),
                 'port': int(port),
             }
             
@@ -1235,42 +1387,64 @@ class ProxyParser:
             
             return node
         except Exception as e:
-            print(f"解析 SOCKS 链接失败: {e}")
+            logger.debug("解析 SOCKS 链接失败: %s", e)
             return None
     
+    @staticmethod
+    def _parse_line(url: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """解析单个代理链接，返回 (节点配置, 失败原因代码)"""
+        scheme, separator, _ = url.partition('://')
+        if not separator:
+            return None, ParseReport.NOT_A_LINK
+
+        parser = ProxyParser._scheme_parsers.get(scheme.lower())
+        if not parser:
+            return None, ParseReport.UNSUPPORTED_SCHEME
+
+        proxy = parser(url)
+        if not proxy:
+            return None, ParseReport.INVALID_LINK
+        return proxy, None
+
     @staticmethod
     def parse_proxy(url: str) -> Optional[Dict[str, Any]]:
-        """解析代理链接，自动识别协议类型"""
-        url = url.strip()
-        
-        if url.startswith('ss://'):
-            return ProxyParser.parse_ss(url)
-        elif url.startswith('ssr://'):
-            return ProxyParser.parse_ssr(url)
-        elif url.startswith('vmess://'):
-            return ProxyParser.parse_vmess(url)
-        elif url.startswith('vless://'):
-            return ProxyParser.parse_vless(url)
-        elif url.startswith('hysteria2://') or url.startswith('hy2://'):
-            return ProxyParser.parse_hysteria2(url)
-        elif url.startswith('anytls://'):
-            return ProxyParser.parse_anytls(url)
-        elif url.startswith('trojan://'):
-            return ProxyParser.parse_trojan(url)
-        elif url.startswith('http://') or url.startswith('https://'):
-            return ProxyParser.parse_http(url)
-        elif url.startswith('socks4://') or url.startswith('socks5://'):
-            return ProxyParser.parse_socks(url)
-        else:
-            return None
-    
+        """解析代理链接，按 :// 之前的协议头查表分发"""
+        return ProxyParser._parse_line(url.strip())[0]
+
+    @classmethod
+    def register_protocol(cls, schemes, parser=None, serializer=None, types=()):
+        """
+        注册协议的解析器和分享链接导出器。
+
+        Args:
+            schemes: 链接协议头（:// 之前的部分），可以是字符串或列表
+            parser: 接收完整链接、返回节点配置或 None 的函数
+            serializer: 接收节点配置、返回分享链接的函数（可选）
+            types: serializer 对应的节点 type，默认与 schemes 相同
+
+        已注册的协议头或类型会被覆盖，第三方协议无需修改本模块即可接入。
+        """
+        if isinstance(schemes, str):
+            schemes = [schemes]
+        if isinstance(types, str):
+            types = [types]
+
+        if parser is not None:
+            for scheme in schemes:
+                cls._scheme_parsers[scheme.lower()] = parser
+        if serializer is not None:
+            for proxy_type in (types or schemes):
+                cls._serializers[proxy_type.lower()] = serializer
+
     @staticmethod
-    def parse_yaml_proxies(content: str) -> List[Dict[str, Any]]:
+    def parse_yaml_proxies(content: str, report: Optional[ParseReport] = None) -> List[Dict[str, Any]]:
         """
         解析 YAML 格式的 Clash 配置，提取 proxies 节点
         支持格式：
         - YAML 完整配置（包含 proxies 字段）
         - YAML 数组格式（直接是节点列表）
+
+        跳过的节点记录到 report（可选）中。
         """
         try:
             import yaml
@@ -1278,7 +1452,8 @@ class ProxyParser:
             # 解析 YAML
             try:
                 config = yaml.safe_load(content)
-            except yaml.YAMLError:
+            except yaml.YAMLError as e:
+                logger.debug("YAML 解析失败: %s", e)
                 return []
             
             proxies = []
@@ -1295,83 +1470,512 @@ class ProxyParser:
             
             # 简单验证：只要有 name 和 type 就接受，完全保持原样
             validated_proxies = []
+            skipped = []
             for idx, proxy in enumerate(proxies):
                 if not isinstance(proxy, dict):
-                    print(f"节点 {idx+1} 不是字典类型，跳过")
+                    skipped.append((idx + 1, ParseReport.NOT_A_MAPPING, proxy))
                     continue
                 
                 # 只验证必须包含 name 和 type
                 if 'name' not in proxy:
-                    print(f"节点 {idx+1} 缺少 name 字段，跳过")
+                    skipped.append((idx + 1, ParseReport.MISSING_NAME, proxy.get('type')))
                     continue
                     
                 if 'type' not in proxy:
-                    print(f"节点 {idx+1} ({proxy.get('name')}) 缺少 type 字段，跳过")
+                    skipped.append((idx + 1, ParseReport.MISSING_TYPE, proxy.get('name')))
                     continue
                 
                 # 原样保存，完全不做修改
-                print(f"节点 {idx+1}: {proxy.get('name')} [{proxy.get('type')}]")
                 validated_proxies.append(proxy)
+
+            if report is not None:
+                for line, reason, item in skipped:
+                    report.add_error(line, reason, item)
             
-            print(f"成功导入 {len(validated_proxies)}/{len(proxies)} 个节点")
+            logger.debug("YAML 节点校验: %s/%s 个有效", len(validated_proxies), len(proxies))
             return validated_proxies
         
         except ImportError:
-            print("警告: yaml 模块未安装，无法解析 YAML 格式")
+            logger.warning("yaml 模块未安装，无法解析 YAML 格式")
             return []
         except Exception as e:
-            print(f"解析 YAML 配置失败: {e}")
+            logger.warning("解析 YAML 配置失败: %s", e)
             return []
     
     @staticmethod
-    def parse_subscription(content: str) -> List[Dict[str, Any]]:
-        """解析订阅内容，返回节点列表"""
+    def _load_json(content: str, report: Optional[ParseReport]) -> Any:
+        try:
+            return json.loads(content)
+        except ValueError as e:
+            logger.debug("JSON 解析失败: %s", e)
+            if report is not None:
+                report.add_error(None, ParseReport.INVALID_JSON, e)
+            return None
+
+    @staticmethod
+    def _convert_ss_plugin(plugin: Any, plugin_opts: Any) -> Optional[Dict[str, Any]]:
+        """
+        将 SIP003 插件名和选项字符串（如 obfs=http;obfs-host=a.com）转换为 Clash 格式
+
+        无插件返回空字典，不支持的插件返回 None。
+        """
+        if not plugin:
+            return {}
+
+        opts = {}
+        for part in str(plugin_opts or '').split(';'):
+            if not part:
+                continue
+            key, separator, value = part.partition('=')
+            # v2ray-plugin 的 tls 等开关没有值
+            opts[key] = value if separator else 'true'
+
+        if 'obfs' in plugin:
+            result = {'mode': opts.get('obfs', 'http')}
+            if opts.get('obfs-host'):
+                result['host'] = opts['obfs-host']
+            return {'plugin': 'obfs', 'plugin-opts': result}
+
+        if 'v2ray' in plugin:
+            result = {'mode': opts.get('mode', 'websocket')}
+            if 'tls' in opts:
+                result['tls'] = opts['tls'] in ('true', '1')
+            for key in ('host', 'path'):
+                if opts.get(key):
+                    result[key] = opts[key]
+            return {'plugin': 'v2ray-plugin', 'plugin-opts': result}
+
+        return None
+
+    @staticmethod
+    def parse_sip008(content: str, report: Optional[ParseReport] = None) -> List[Dict[str, Any]]:
+        """
+        解析 SIP008 格式的 Shadowsocks 订阅（{"version": 1, "servers": [...]}）
+
+        兼容直接以服务器数组作为顶层的变体。
+        """
+        config = ProxyParser._load_json(content, report)
+        servers = config.get('servers') if isinstance(config, dict) else config
+        if not isinstance(servers, list):
+            return []
+
         proxies = []
-        
-        # 检测内容格式
-        content_stripped = content.strip()
-        
-        # 1. 尝试解析为 YAML 格式（Clash 原生配置）
-        # 检测 YAML 特征：包含 "proxies:" 或 以 "- {" 或 "- name:" 开头
-        is_yaml = False
-        if ('proxies:' in content_stripped or 
-            content_stripped.startswith('- {') or 
-            content_stripped.startswith('- name:') or
-            'type: trojan' in content_stripped or
-            'type: vmess' in content_stripped or
-            'type: vless' in content_stripped or
-            'type: anytls' in content_stripped or
-            'type: ss' in content_stripped):
-            is_yaml = True
-        
-        if is_yaml:
-            print("检测到 YAML 格式订阅，正在解析...")
-            proxies = ProxyParser.parse_yaml_proxies(content)
-            if proxies:
-                print(f"从 YAML 格式解析到 {len(proxies)} 个节点")
-                return proxies
+        for idx, server in enumerate(servers):
+            if not isinstance(server, dict):
+                if report is not None:
+                    report.add_error(idx + 1, ParseReport.NOT_A_MAPPING, server)
+                continue
+
+            name = server.get('remarks') or server.get('id') or f"{server.get('server')}:{server.get('server_port')}"
+            if not server.get('server') or not server.get('server_port') or not server.get('method'):
+                if report is not None:
+                    report.add_error(idx + 1, ParseReport.INVALID_LINK, name)
+                continue
+
+            plugin = ProxyParser._convert_ss_plugin(server.get('plugin'), server.get('plugin_opts'))
+            if plugin is None:
+                if report is not None:
+                    report.add_error(idx + 1, ParseReport.UNSUPPORTED_TYPE, server.get('plugin'))
+                continue
+
+            try:
+                proxy = {
+                    'name': str(name),
+                    'type': 'ss',
+                    'server': server['server'],
+                    'port': int(server['server_port']),
+                    'cipher': server['method'],
+                    'password': server.get('password', ''),
+                }
+            except (TypeError, ValueError) as e:
+                logger.debug("解析 SIP008 节点失败: %s", e)
+                if report is not None:
+                    report.add_error(idx + 1, ParseReport.INVALID_LINK, name)
+                continue
+            proxy.update(plugin)
+            proxies.append(proxy)
+
+        return proxies
+
+    # sing-box 中不代表具体节点的出站类型，解析时直接忽略
+    SINGBOX_NON_PROXY_TYPES = frozenset({'selector', 'urltest', 'direct', 'block', 'dns'})
+
+    @staticmethod
+    def parse_singbox_config(content: str, report: Optional[ParseReport] = None) -> List[Dict[str, Any]]:
+        """解析 sing-box JSON 配置中的 outbounds，转换为 Clash 节点；detour 转换为 dialer-proxy"""
+        config = ProxyParser._load_json(content, report)
+        outbounds = config.get('outbounds') if isinstance(config, dict) else None
+        if not isinstance(outbounds, list):
+            return []
+
+        proxies = []
+        for idx, outbound in enumerate(outbounds):
+            if not isinstance(outbound, dict):
+                if report is not None:
+                    report.add_error(idx + 1, ParseReport.NOT_A_MAPPING, outbound)
+                continue
+            if outbound.get('type') in ProxyParser.SINGBOX_NON_PROXY_TYPES:
+                continue
+
+            try:
+                proxy, reason = ProxyParser._convert_singbox_outbound(outbound)
+            except (TypeError, ValueError) as e:
+                logger.debug("解析 sing-box 出站失败: %s", e)
+                proxy, reason = None, ParseReport.INVALID_LINK
+            if proxy:
+                proxies.append(proxy)
+            elif report is not None:
+                report.add_error(idx + 1, reason, outbound.get('tag'))
+
+        return proxies
+
+    @staticmethod
+    def _convert_singbox_outbound(outbound: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """转换单个 sing-box 出站，返回 (节点配置, 失败原因代码)"""
+        outbound_type = outbound.get('type')
+        if not outbound.get('tag') or not outbound.get('server') or not outbound.get('server_port'):
+            return None, ParseReport.INVALID_LINK
+
+        proxy = {
+            'name': outbound['tag'],
+            'server': outbound['server'],
+            'port': int(outbound['server_port']),
+        }
+
+        if outbound_type == 'shadowsocks':
+            plugin = ProxyParser._convert_ss_plugin(outbound.get('plugin'), outbound.get('plugin_opts'))
+            if plugin is None:
+                return None, ParseReport.UNSUPPORTED_TYPE
+            proxy.update({
+                'type': 'ss',
+                'cipher': outbound.get('method'),
+                'password': outbound.get('password'),
+            })
+            proxy.update(plugin)
+            if outbound.get('udp_over_tcp'):
+                proxy['udp-over-tcp'] = True
+        elif outbound_type == 'vmess':
+            proxy.update({
+                'type': 'vmess',
+                'uuid': outbound.get('uuid'),
+                'alterId': int(outbound.get('alter_id') or 0),
+                'cipher': outbound.get('security') or 'auto',
+            })
+        elif outbound_type == 'vless':
+            proxy.update({
+                'type': 'vless',
+                'uuid': outbound.get('uuid'),
+            })
+            if outbound.get('flow'):
+                proxy['flow'] = outbound['flow']
+        elif outbound_type in ('trojan', 'anytls'):
+            proxy.update({
+                'type': outbound_type,
+                'password': outbound.get('password'),
+            })
+        elif outbound_type == 'hysteria2':
+            proxy.update({
+                'type': 'hysteria2',
+                'password': outbound.get('password'),
+            })
+            obfs = outbound.get('obfs')
+            if isinstance(obfs, dict) and obfs.get('type'):
+                proxy['obfs'] = obfs['type']
+                proxy['obfs-password'] = obfs.get('password', '')
+        elif outbound_type in ('http', 'socks'):
+            proxy['type'] = 'http' if outbound_type == 'http' else f"socks{outbound.get('version') or '5'}"
+            for key in ('username', 'password'):
+                if outbound.get(key):
+                    proxy[key] = outbound[key]
+        else:
+            return None, ParseReport.UNSUPPORTED_TYPE
+
+        tls = outbound.get('tls')
+        if isinstance(tls, dict) and tls.get('enabled'):
+            if proxy['type'] not in ('trojan', 'hysteria2', 'anytls'):
+                proxy['tls'] = True
+            if tls.get('server_name'):
+                proxy['servername' if proxy['type'] in ('vmess', 'vless') else 'sni'] = tls['server_name']
+            if tls.get('insecure'):
+                proxy['skip-cert-verify'] = True
+            if tls.get('alpn'):
+                proxy['alpn'] = tls['alpn']
+            utls = tls.get('utls')
+            if isinstance(utls, dict) and utls.get('enabled') and utls.get('fingerprint'):
+                proxy['client-fingerprint'] = utls['fingerprint']
+            reality = tls.get('reality')
+            if isinstance(reality, dict) and reality.get('enabled'):
+                proxy['reality-opts'] = {
+                    'public-key': reality.get('public_key', ''),
+                    'short-id': reality.get('short_id', ''),
+                }
+
+        transport = outbound.get('transport')
+        if isinstance(transport, dict) and transport.get('type'):
+            transport_type = transport['type']
+            if transport_type == 'ws':
+                ws_opts = {'path': transport.get('path') or '/'}
+                if transport.get('headers'):
+                    ws_opts['headers'] = transport['headers']
+                proxy.update({'network': 'ws', 'ws-opts': ws_opts})
+            elif transport_type == 'grpc':
+                proxy.update({
+                    'network': 'grpc',
+                    'grpc-opts': {'grpc-service-name': transport.get('service_name', '')},
+                })
+            elif transport_type == 'http':
+                h2_opts = {'path': transport.get('path') or '/'}
+                if transport.get('host'):
+                    h2_opts['host'] = transport['host']
+                proxy.update({'network': 'h2', 'h2-opts': h2_opts})
             else:
-                print("YAML 解析失败，尝试其他格式...")
-        
-        # 2. 尝试 base64 解码（传统订阅格式）
+                return None, ParseReport.UNSUPPORTED_TYPE
+
+        if isinstance(outbound.get('detour'), str) and outbound['detour']:
+            proxy['dialer-proxy'] = outbound['detour']
+
+        return proxy, None
+
+    @staticmethod
+    def detect_format(head: str) -> str:
+        """
+        根据订阅开头片段判断格式，只扫描传入的片段一次
+
+        Returns:
+            yaml（Clash 配置，含 JSON 形式）、singbox、sip008、base64（含 URL 安全字母表）或 plain
+        """
+        text = head.lstrip('\ufeff \t\r\n')
+        if not text:
+            return ProxyParser.FORMAT_PLAIN
+
+        if text[0] in '{[':
+            if '"outbounds"' in text:
+                return ProxyParser.FORMAT_SINGBOX
+            if '"servers"' in text or ('"server_port"' in text and '"method"' in text):
+                return ProxyParser.FORMAT_SIP008
+            # JSON 是 YAML 的子集，其余 JSON（如 JSON 风格的 Clash 配置）交给 YAML 解析
+            return ProxyParser.FORMAT_YAML
+
+        # YAML 配置开头常有注释（其中可能带生成来源的 URL），只看第一条有效行
+        first_line = next(
+            (line for line in text.split('\n') if line.strip() and not line.lstrip().startswith('#')), ''
+        )
+        if '://' in first_line:
+            return ProxyParser.FORMAT_PLAIN
+        if ProxyParser._YAML_MARKER_RE.search(text):
+            return ProxyParser.FORMAT_YAML
+        if ProxyParser._looks_like_base64(text):
+            return ProxyParser.FORMAT_BASE64
+        return ProxyParser.FORMAT_PLAIN
+
+    @staticmethod
+    def _iter_text_chunks(source: Union[str, bytes, Iterable[Union[str, bytes]]]) -> Iterator[str]:
+        """将字符串、字节串或分块迭代器统一为文本分块，字节按 UTF-8 增量解码。"""
+        if isinstance(source, (str, bytes)):
+            source = [source]
+
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for chunk in source:
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk)
+            if chunk:
+                yield chunk
+
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+    @staticmethod
+    def _looks_like_base64(head: str) -> bool:
+        """开头片段去掉空白后只包含 base64（含 URL 安全字母表）字符时视为 base64 订阅"""
+        compact = ''.join(head.split())
+        return bool(compact) and re.fullmatch(r'[A-Za-z0-9+/_=-]+', compact) is not None
+
+    @staticmethod
+    def _iter_base64_lines(chunks: Iterable[str], report: Optional[ParseReport] = None) -> Iterator[str]:
+        """增量解码 base64 文本并逐行产出，任意时刻只保留一个分块的解码结果"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = ''
+        buffer = ''
+
         try:
-            decoded = base64.b64decode(content + '=' * (4 - len(content) % 4)).decode('utf-8')
-            lines = decoded.strip().split('\n')
-            print("检测到 Base64 编码订阅")
-        except:
-            # 如果不是 base64，直接按行分割
-            lines = content.strip().split('\n')
-            print("检测到纯文本订阅")
-        
-        # 3. 逐行解析节点链接
-        for line in lines:
+            for chunk in chunks:
+                pending += ''.join(chunk.split())
+                usable = len(pending) - len(pending) % 4
+                if not usable:
+                    continue
+
+                data, pending = pending[:usable], pending[usable:]
+                buffer += decoder.decode(base64.urlsafe_b64decode(data.replace('+', '-').replace('/', '_')))
+                *lines, buffer = buffer.split('\n')
+                yield from lines
+
+            if pending.rstrip('='):
+                pending = pending.rstrip('=')
+                buffer += decoder.decode(base64.urlsafe_b64decode(
+                    pending.replace('+', '-').replace('/', '_') + '=' * (-len(pending) % 4)
+                ))
+        except ValueError as e:
+            # 中途出现无法解码的内容时保留已解码部分
+            logger.warning("Base64 解码中断: %s", e)
+            if report is not None:
+                report.add_error(None, ParseReport.DECODE_ERROR, e)
+        buffer += decoder.decode(b'', final=True)
+        yield from buffer.split('\n')
+
+    @staticmethod
+    def _iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+        """将文本分块拼接后逐行产出"""
+        buffer = ''
+        for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split('\n')
+            yield from lines
+        yield buffer
+
+    @staticmethod
+    def _iter_numbered_results(lines: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str, Optional[Dict[str, Any]], Optional[str]]]:
+        """解析带行号的链接，产出 (行号, 原始行, 节点配置, 失败原因代码)，跳过空行"""
+        for line_number, line in lines:
             line = line.strip()
             if not line:
                 continue
-            
-            proxy = ProxyParser.parse_proxy(line)
+            proxy, reason = ProxyParser._parse_line(line)
+            yield line_number, line, proxy, reason
+
+    @staticmethod
+    def _iter_parsed_lines(lines: Iterable[str], workers: Optional[int] = None,
+                           report: Optional[ParseReport] = None,
+                           executor: Optional[concurrent.futures.Executor] = None) -> Iterator[Dict[str, Any]]:
+        """
+        逐行解析节点链接，保持输入顺序
+
+        workers 大于 1（或小于等于 0 表示使用全部 CPU）时按批次提交到进程池并行解析，
+        同时在途的批次数有上限，流式输入的内存占用仍然有界。
+        传入 executor 时复用调用方的进程池，workers 只决定在途批次数。
+        """
+        if workers is not None and workers <= 0:
+            workers = os.cpu_count() or 1
+
+        numbered_lines = enumerate(lines, 1)
+        if executor is None and (not workers or workers == 1):
+            yield from ProxyParser._collect_parsed(ProxyParser._iter_numbered_results(numbered_lines), report)
+            return
+
+        if executor is None:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as own_executor:
+                yield from ProxyParser._iter_batch_results(numbered_lines, own_executor, workers, report)
+        else:
+            yield from ProxyParser._iter_batch_results(numbered_lines, executor, workers or 1, report)
+
+    @staticmethod
+    def _iter_batch_results(numbered_lines: Iterator[Tuple[int, str]], executor: concurrent.futures.Executor,
+                            workers: int, report: Optional[ParseReport]) -> Iterator[Dict[str, Any]]:
+        """按批次提交到进程池，最多 workers * 2 个批次在途"""
+        batches = iter(lambda: list(itertools.islice(numbered_lines, ProxyParser.PARALLEL_BATCH_SIZE)), [])
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(executor.submit(_parse_proxy_batch, batch))
+            if len(pending) >= workers * 2:
+                yield from ProxyParser._collect_parsed(pending.popleft().result(), report)
+        while pending:
+            yield from ProxyParser._collect_parsed(pending.popleft().result(), report)
+
+    @staticmethod
+    def _collect_parsed(results, report: Optional[ParseReport]) -> Iterator[Dict[str, Any]]:
+        for line_number, line, proxy, reason in results:
             if proxy:
-                proxies.append(proxy)
-        
-        return proxies
+                if report is not None:
+                    report.add_proxy(proxy)
+                yield proxy
+            elif report is not None:
+                report.add_error(line_number, reason, line)
+
+    @staticmethod
+    def iter_subscription(source: Union[str, bytes, Iterable[Union[str, bytes]]],
+                          workers: Optional[int] = None,
+                          report: Optional[ParseReport] = None,
+                          executor: Optional[concurrent.futures.Executor] = None) -> Iterator[Dict[str, Any]]:
+        """
+        流式解析订阅内容，逐个产出节点
+
+        Args:
+            source: 订阅内容，可以是字符串、字节串，或按块产出字符串/字节串的迭代器
+                    （如 requests 的 iter_content、按块读取的文件）
+            workers: 并行解析的进程数，默认在当前进程串行解析；小于等于 0 时使用全部 CPU
+            report: 可选的 ParseReport，迭代过程中写入格式、协议计数和逐行失败原因，
+                    迭代结束时记录耗时
+            executor: 可选的共享进程池，多个订阅同时解析时避免各自创建进程池
+
+        格式由 detect_format 根据开头 SNIFF_SIZE 个字符判断，不再逐个格式试错。
+        base64 和纯文本订阅按块解码、逐行解析，内存占用与订阅大小无关；
+        YAML、sing-box 和 SIP008 需要完整文档才能解析，会读取全部内容。
+        子进程只包含模块导入时注册的协议，运行时通过 register_protocol 注册的协议
+        在 spawn 启动方式下不可用。
+        """
+        chunks = ProxyParser._iter_text_chunks(source)
+
+        # 读取开头片段判断格式，之后与剩余分块重新拼接
+        head_parts = []
+        head_size = 0
+        for chunk in chunks:
+            head_parts.append(chunk)
+            head_size += len(chunk)
+            if head_size >= ProxyParser.SNIFF_SIZE:
+                break
+        head = ''.join(head_parts)
+        stream = itertools.chain([head], chunks)
+
+        if report is None:
+            report = ParseReport()
+
+        # 格式只判断一次，整份内容只按判断出的格式解析一遍
+        report.format = ProxyParser.detect_format(head)
+
+        # 1. YAML / sing-box / SIP008 需要完整文档
+        document_parsers = {
+            ProxyParser.FORMAT_YAML: ProxyParser.parse_yaml_proxies,
+            ProxyParser.FORMAT_SINGBOX: ProxyParser.parse_singbox_config,
+            ProxyParser.FORMAT_SIP008: ProxyParser.parse_sip008,
+        }
+        document_parser = document_parsers.get(report.format)
+        if document_parser:
+            for proxy in document_parser(''.join(stream), report):
+                report.add_proxy(proxy)
+                yield proxy
+            report.finish()
+            return
+
+        # 2. base64 编码（传统订阅格式）或纯文本链接列表
+        if report.format == ProxyParser.FORMAT_BASE64:
+            lines = ProxyParser._iter_base64_lines(stream, report)
+        else:
+            lines = ProxyParser._iter_lines(stream)
+
+        # 3. 逐行解析节点链接
+        yield from ProxyParser._iter_parsed_lines(lines, workers, report, executor)
+        report.finish()
+
+    @staticmethod
+    def parse_subscription(content: str, workers: Optional[int] = None,
+                           report: Optional[ParseReport] = None) -> List[Dict[str, Any]]:
+        """解析订阅内容，返回节点列表；workers 和 report 含义同 iter_subscription"""
+        return list(ProxyParser.iter_subscription(content, workers, report))
+
+
+def _parse_proxy_batch(lines: List[Tuple[int, str]]) -> List[Tuple[int, str, Optional[Dict[str, Any]], Optional[str]]]:
+    """进程池任务：解析一批带行号的节点链接（需要定义在模块顶层才能被 pickle）"""
+    return list(ProxyParser._iter_numbered_results(lines))
+
+
+ProxyParser.register_protocol('ss', ProxyParser.parse_ss, ProxyParser._to_ss_url)
+ProxyParser.register_protocol('ssr', ProxyParser.parse_ssr, ProxyParser._to_ssr_url)
+ProxyParser.register_protocol('vmess', ProxyParser.parse_vmess, ProxyParser._to_vmess_url)
+ProxyParser.register_protocol('vless', ProxyParser.parse_vless, ProxyParser._to_vless_url)
+ProxyParser.register_protocol(['hysteria2', 'hy2'], ProxyParser.parse_hysteria2, ProxyParser._to_hysteria2_url)
+ProxyParser.register_protocol('anytls', ProxyParser.parse_anytls, ProxyParser._to_anytls_url)
+ProxyParser.register_protocol('trojan', ProxyParser.parse_trojan, ProxyParser._to_trojan_url)
+ProxyParser.register_protocol(['http', 'https'], ProxyParser.parse_http, ProxyParser._to_http_url, types='http')
+ProxyParser.register_protocol(['socks4', 'socks5'], ProxyParser.parse_socks, ProxyParser._to_socks_url)
 
+register_protocol = ProxyParser.register_protocol
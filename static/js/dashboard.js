@@ -6,6 +6,10 @@ let currentEditTemplateId = null;
 let currentEditNodeId = null;
 let currentEditNodeProtocol = null;
 let allNodes = [];
+let nodeListState = { page: 1, perPage: 50, q: '', protocol: '', subscriptionId: '' };
+let nodeSearchTimer = null;
+let userListState = { q: '', enabled: '', subscriptionId: '', nextCursor: null };
+let userSearchTimer = null;
 let allSubscriptions = [];
 let allTemplates = [];
 let selectedRelayNodes = [];
@@ -191,6 +195,8 @@ async function loadSubscriptions() {
             `;
             tbody.appendChild(row);
         });
+        renderNodeSubscriptionFilter();
+        renderUserSubscriptionFilter();
     } catch (error) {
         console.error('加载订阅失败:', error);
     }
@@ -257,7 +263,10 @@ async function showManageSubscriptionNodesModal(subscriptionId, subscriptionName
     document.getElementById('manageSubscriptionName').textContent = subscriptionName;
     
     // 获取分组当前节点
-    const response = await fetch(`/api/subscriptions/${subscriptionId}/nodes`);
+    const [response] = await Promise.all([
+        fetch(`/api/subscriptions/${subscriptionId}/nodes`),
+        loadAllNodes()
+    ]);
     const subscriptionNodes = await response.json();
     const subscriptionNodeIds = subscriptionNodes.map(n => n.id);
     
@@ -319,15 +328,77 @@ async function saveSubscriptionNodes() {
 
 // ============ 节点管理 ============
 
+// 管理节点、创建链式节点时需要完整节点列表
+async function loadAllNodes() {
+    const response = await fetch('/api/nodes');
+    allNodes = await response.json();
+    return allNodes;
+}
+
+function renderNodeSubscriptionFilter() {
+    const select = document.getElementById('nodeSubscriptionFilter');
+    if (!select) return;
+    select.innerHTML = '<option value="">全部分组</option><option value="none">手动添加</option>';
+    allSubscriptions.forEach(sub => {
+        const option = document.createElement('option');
+        option.value = sub.id;
+        option.textContent = sub.name;
+        select.appendChild(option);
+    });
+    select.value = nodeListState.subscriptionId;
+}
+
+function onNodeFilterChange(debounce = false) {
+    clearTimeout(nodeSearchTimer);
+    const apply = () => {
+        nodeListState.q = document.getElementById('nodeSearch').value.trim();
+        nodeListState.protocol = document.getElementById('nodeProtocolFilter').value;
+        nodeListState.subscriptionId = document.getElementById('nodeSubscriptionFilter').value;
+        nodeListState.page = 1;
+        loadNodes();
+    };
+    if (debounce) {
+        nodeSearchTimer = setTimeout(apply, 300);
+    } else {
+        apply();
+    }
+}
+
+function goToNodePage(page) {
+    nodeListState.page = page;
+    loadNodes();
+}
+
+function renderNodesPagination(data) {
+    const container = document.getElementById('nodesPagination');
+    const pages = Math.max(data.pages, 1);
+    container.innerHTML = `
+        <span>共 ${data.total} 个节点，第 ${data.page} / ${pages} 页</span>
+        <button class="btn btn-small" ${data.page <= 1 ? 'disabled' : ''} onclick="goToNodePage(${data.page - 1})">上一页</button>
+        <button class="btn btn-small" ${data.page >= pages ? 'disabled' : ''} onclick="goToNodePage(${data.page + 1})">下一页</button>
+    `;
+}
+
 async function loadNodes() {
     try {
-        const response = await fetch('/api/nodes');
-        allNodes = await response.json();
+        const params = new URLSearchParams({ page: nodeListState.page, per_page: nodeListState.perPage });
+        if (nodeListState.q) params.set('q', nodeListState.q);
+        if (nodeListState.protocol) params.set('protocol', nodeListState.protocol);
+        if (nodeListState.subscriptionId) params.set('subscription_id', nodeListState.subscriptionId);
+        const response = await fetch(`/api/nodes?${params}`);
+        const data = await response.json();
+        // 删除节点后当前页可能已超出范围
+        if (data.page > 1 && data.page > data.pages) {
+            goToNodePage(Math.max(data.pages, 1));
+            return;
+        }
         
         const tbody = document.querySelector('#nodes-table tbody');
         tbody.innerHTML = '';
         
-        allNodes.forEach(node => {
+        data.items.forEach((node, index) => {
+            const previousNode = data.items[index - 1];
+            const nextNode = data.items[index + 1];
             // 显示所有关联的用户
             const userBadges = node.user_names && node.user_names.length > 0
                 ? node.user_names.map(name => `<span class="badge badge-success" style="margin-right: 4px;">${name}</span>`).join('')
@@ -351,7 +422,9 @@ async function loadNodes() {
                 <td>${subscriptionBadge}</td>
                 <td>${userBadges}</td>
                 <td>
-                    <span class="order-badge" onclick="editNodeOrder(${node.id}, ${node.order || 0})" style="cursor: pointer;" title="点击修改排序">${node.order || 0}</span>
+                    <span class="order-badge" title="排序值">${node.order || 0}</span>
+                    <button class="btn btn-secondary btn-small order-move" ${previousNode ? '' : 'disabled'} onclick="moveNode(${node.id}, { before_id: ${previousNode ? previousNode.id : 'null'} })" title="上移">▲</button>
+                    <button class="btn btn-secondary btn-small order-move" ${nextNode ? '' : 'disabled'} onclick="moveNode(${node.id}, { after_id: ${nextNode ? nextNode.id : 'null'} })" title="下移">▼</button>
                 </td>
                 <td class="action-buttons">
                     <button class="btn btn-info btn-small" onclick="showEditNodeModal(${node.id})">✏️ 编辑</button>
@@ -363,6 +436,8 @@ async function loadNodes() {
             tbody.appendChild(row);
         });
         
+        renderNodesPagination(data);
+        
         // 重置全选框和批量删除按钮
         document.getElementById('selectAllNodes').checked = false;
         updateBatchDeleteButton();
@@ -400,6 +475,8 @@ function showBatchImportModal() {
     
     document.getElementById('batchImportModal').style.display = 'block';
     document.getElementById('importUrl').value = '';
+    document.getElementById('importPrune').checked = false;
+    document.getElementById('importSaveSource').checked = false;
 }
 
 async function addNode() {
@@ -436,34 +513,83 @@ async function addNode() {
     }
 }
 
+const PARSE_ERROR_REASONS = {
+    not_a_link: '不是节点链接',
+    unsupported_scheme: '不支持的协议',
+    invalid_link: '链接格式错误',
+    not_a_mapping: '节点不是字典',
+    missing_name: '缺少 name 字段',
+    missing_type: '缺少 type 字段',
+    unsupported_type: '不支持的节点类型或插件',
+    decode_error: 'Base64 解码失败',
+    invalid_json: 'JSON 格式错误'
+};
+
+function formatParseReport(report) {
+    if (!report || !report.error_count) return '';
+    const lines = report.errors.slice(0, 10).map(error => {
+        const position = error.line ? `第 ${error.line} 行` : '订阅内容';
+        return `  ${position}: ${PARSE_ERROR_REASONS[error.reason] || error.reason} ${error.content}`;
+    });
+    if (report.error_count > lines.length) {
+        lines.push(`  ... 共 ${report.error_count} 条`);
+    }
+    return `\n\n${report.error_count} 条内容解析失败:\n` + lines.join('\n');
+}
+
+function formatSourceErrors(sources) {
+    const failed = (sources || []).filter(source => source.error);
+    if (!failed.length) return '';
+    return `\n\n${failed.length} 个订阅获取失败:\n` + failed.map(source => `  ${source.url}: ${source.error}`).join('\n');
+}
+
 async function batchImportNodes() {
-    const url = document.getElementById('importUrl').value.trim();
+    const urls = document.getElementById('importUrl').value
+        .split('\n')
+        .map(url => url.trim())
+        .filter(Boolean);
     const subscription_id = document.getElementById('importSubscription').value || null;
+    const prune = document.getElementById('importPrune').checked;
+    const save_source = document.getElementById('importSaveSource').checked;
     
-    if (!url) {
+    if (!urls.length) {
         alert('请输入订阅链接');
         return;
     }
     
-    if (!confirm('确定要从此链接导入节点吗？')) return;
+    if (prune && !subscription_id) {
+        alert('删除失效节点需要选择归属分组');
+        return;
+    }
+    
+    if (!confirm(`确定要从 ${urls.length} 个订阅链接导入节点吗？`)) return;
     
     try {
         const response = await fetch('/api/nodes/batch-import', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ url, subscription_id })
+            body: JSON.stringify({ urls, subscription_id, prune, save_source })
         });
         
         const data = await response.json();
         
         if (data.success) {
             closeModal('batchImportModal');
+            let summary = `新增 ${data.added} 个，更新 ${data.updated} 个，未变化 ${data.skipped} 个`;
+            if (data.pruned) {
+                summary += `，删除 ${data.pruned} 个`;
+            }
+            summary += formatSourceErrors(data.sources);
+            if (data.prune_skipped) {
+                summary += '\n\n部分订阅获取失败，已跳过删除失效节点';
+            }
+            alert(summary + formatParseReport(data.report));
             loadNodes();
             loadSubscriptions(); // 刷新订阅列表以更新节点数
             loadUsers(); // 刷新用户列表以更新节点数
             loadStats();
         } else {
-            alert('导入失败: ' + data.message);
+            alert('导入失败: ' + data.message + formatParseReport(data.report));
         }
     } catch (error) {
         alert('导入失败: ' + error.message);
@@ -615,13 +741,60 @@ function formatTrafficGb(bytes, decimals = 3) {
     return `${fixed.replace(/\.?0+$/, '') || '0'} GB`;
 }
 
-async function loadUsers() {
+function onUserFilterChange(debounce = false) {
+    clearTimeout(userSearchTimer);
+    const apply = () => {
+        userListState.q = document.getElementById('userSearch').value.trim();
+        userListState.enabled = document.getElementById('userEnabledFilter').value;
+        userListState.subscriptionId = document.getElementById('userSubscriptionFilter').value;
+        loadUsers();
+    };
+    if (debounce) {
+        userSearchTimer = setTimeout(apply, 300);
+    } else {
+        apply();
+    }
+}
+
+function renderUserSubscriptionFilter() {
+    const select = document.getElementById('userSubscriptionFilter');
+    if (!select) return;
+    select.innerHTML = '<option value="">全部订阅</option>';
+    allSubscriptions.forEach(sub => {
+        const option = document.createElement('option');
+        option.value = sub.id;
+        option.textContent = sub.name;
+        select.appendChild(option);
+    });
+    select.value = userListState.subscriptionId;
+}
+
+function renderUsersPagination() {
+    const container = document.getElementById('usersPagination');
+    const loaded = document.querySelectorAll('#users-table tbody tr.user-summary-row').length;
+    container.innerHTML = `
+        <span>已加载 ${loaded} 个用户</span>
+        ${userListState.nextCursor ? '<button class="btn btn-small" onclick="loadUsers(true)">加载更多</button>' : ''}
+    `;
+}
+
+// append 为 true 时按游标追加下一页，否则从第一页重新加载
+async function loadUsers(append = false) {
     try {
-        const response = await fetch('/api/users');
-        const users = await response.json();
+        const params = new URLSearchParams({ limit: 50 });
+        if (append && userListState.nextCursor) params.set('cursor', userListState.nextCursor);
+        if (userListState.q) params.set('q', userListState.q);
+        if (userListState.enabled) params.set('enabled', userListState.enabled);
+        if (userListState.subscriptionId) params.set('subscription_id', userListState.subscriptionId);
+        const response = await fetch(`/api/users?${params}`);
+        const data = await response.json();
+        const users = data.items;
+        userListState.nextCursor = data.next_cursor;
 
         const tbody = document.querySelector('#users-table tbody');
-        tbody.innerHTML = '';
+        if (!append) {
+            tbody.innerHTML = '';
+        }
 
         users.forEach(user => {
             const token = user.custom_slug || user.subscription_token;
@@ -685,6 +858,7 @@ async function loadUsers() {
                 loadUserOwnedNodes(user.id);
             }
         });
+        renderUsersPagination();
     } catch (error) {
         console.error('加载用户失败:', error);
     }
@@ -880,9 +1054,8 @@ async function showEditUserModal(userId) {
     
     // 获取用户信息
     try {
-        const response = await fetch(`/api/users`);
-        const users = await response.json();
-        const user = users.find(u => u.id === userId);
+        const response = await fetch(`/api/users/${userId}`);
+        const user = response.ok ? await response.json() : null;
         
         if (!user) {
             alert('用户不存在');
@@ -894,6 +1067,7 @@ async function showEditUserModal(userId) {
         document.getElementById('editUserRemark').value = user.remark || '';
         document.getElementById('editUserCustomSlug').value = user.custom_slug || '';
         document.getElementById('editUserTrafficLimitGb').value = user.traffic_limit_gb || 0;
+        document.getElementById('editUserOutputStyle').value = user.output_style || '';
         
         // 填充模板下拉框
         const templateSelect = document.getElementById('editUserTemplate');
@@ -921,6 +1095,7 @@ async function saveUserEdit() {
     const customSlug = document.getElementById('editUserCustomSlug').value.trim();
     const templateId = document.getElementById('editUserTemplate').value;
     const traffic_limit_gb = Number(document.getElementById('editUserTrafficLimitGb').value || 0);
+    const output_style = document.getElementById('editUserOutputStyle').value || null;
     
     if (!username) {
         alert('名称不能为空');
@@ -934,7 +1109,7 @@ async function saveUserEdit() {
     }
     
     try {
-        const updateData = { username, remark, custom_slug: customSlug || null, traffic_limit_gb };
+        const updateData = { username, remark, custom_slug: customSlug || null, traffic_limit_gb, output_style };
         if (templateId) {
             updateData.template_id = parseInt(templateId);
         }
@@ -5062,6 +5237,7 @@ async function loadTemplates() {
 function showAddTemplateModal() {
     document.getElementById('templateName').value = '';
     document.getElementById('templateDescription').value = '';
+    document.getElementById('templateOutputStyle').value = 'block';
     document.getElementById('templateContent').value = '';
     document.getElementById('addTemplateModal').style.display = 'block';
 }
@@ -5069,6 +5245,7 @@ function showAddTemplateModal() {
 async function addTemplate() {
     const name = document.getElementById('templateName').value.trim();
     const description = document.getElementById('templateDescription').value.trim();
+    const output_style = document.getElementById('templateOutputStyle').value;
     const content = document.getElementById('templateContent').value.trim();
     
     if (!name || !content) {
@@ -5080,7 +5257,7 @@ async function addTemplate() {
         const response = await fetch('/api/templates', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ name, description, content })
+            body: JSON.stringify({ name, description, content, output_style })
         });
         
         const data = await response.json();
@@ -5106,6 +5283,7 @@ async function showEditTemplateModal(templateId) {
         
         document.getElementById('editTemplateName').value = template.name;
         document.getElementById('editTemplateDescription').value = template.description || '';
+        document.getElementById('editTemplateOutputStyle').value = template.output_style || 'block';
         document.getElementById('editTemplateContent').value = template.content;
         document.getElementById('editTemplateModal').style.display = 'block';
     } catch (error) {
@@ -5116,6 +5294,7 @@ async function showEditTemplateModal(templateId) {
 async function saveTemplateEdit() {
     const name = document.getElementById('editTemplateName').value.trim();
     const description = document.getElementById('editTemplateDescription').value.trim();
+    const output_style = document.getElementById('editTemplateOutputStyle').value;
     const content = document.getElementById('editTemplateContent').value.trim();
     
     if (!name || !content) {
@@ -5127,7 +5306,7 @@ async function saveTemplateEdit() {
         const response = await fetch(`/api/templates/${currentEditTemplateId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ name, description, content })
+            body: JSON.stringify({ name, description, content, output_style })
         });
         
         const data = await response.json();
@@ -5824,11 +6003,9 @@ window.onclick = function(event) {
 
 async function loadRelayNodes() {
     try {
-        const response = await fetch('/api/nodes');
-        const nodes = await response.json();
-        
-        // 筛选出链式节点：旧的 relay 协议或新的 dialer-proxy 方式
-        const relayNodes = nodes.filter(n => n.protocol === 'relay' || n.dialer_proxy);
+        // 只获取链式节点：旧的 relay 协议或新的 dialer-proxy 方式
+        const response = await fetch('/api/nodes?chain=1');
+        const relayNodes = await response.json();
         
         const tbody = document.querySelector('#relay-nodes-table tbody');
         tbody.innerHTML = '';
@@ -5887,7 +6064,9 @@ async function loadRelayNodes() {
     }
 }
 
-function showCreateRelayModal() {
+async function showCreateRelayModal() {
+    await loadAllNodes();
+    
     // 填充订阅选择下拉框
     const select = document.getElementById('relayNodeSubscription');
     select.innerHTML = '<option value="">不归属任何分组</option>';
@@ -6120,34 +6299,22 @@ async function deleteRelayNode(id) {
 
 // ============ 节点排序功能 ============
 
-function editNodeOrder(nodeId, currentOrder) {
-    const newOrder = prompt('请输入新的排序数字（数字越小越靠前）:', currentOrder);
-    if (newOrder === null || newOrder === '') return;
-    
-    const orderNum = parseInt(newOrder);
-    if (isNaN(orderNum) || orderNum < 0) {
-        alert('请输入有效的数字（大于等于 0）');
-        return;
-    }
-    
-    updateNodeOrder(nodeId, orderNum);
-}
-
-async function updateNodeOrder(nodeId, order) {
+async function moveNode(nodeId, anchor) {
+    // 只移动这一个节点，服务端在相邻两个排序值之间取值
     try {
         const response = await fetch(`/api/nodes/${nodeId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ order: parseInt(order) })
+            body: JSON.stringify(anchor)
         });
         
         if (response.ok) {
-            // 刷新节点列表以显示新的排序
             loadNodes();
         } else {
-            alert('更新排序失败');
+            const result = await response.json();
+            alert('调整排序失败: ' + (result.message || response.status));
         }
     } catch (error) {
-        alert('更新排序失败: ' + error.message);
+        alert('调整排序失败: ' + error.message);
     }
 }
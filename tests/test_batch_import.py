@@ -0,0 +1,196 @@
+import shutil
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import requests
+
+import app as app_module
+from app import app, db
+from models import Node, Subscription
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content.encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for index in range(0, len(self.content), chunk_size):
+            yield self.content[index:index + chunk_size]
+
+    def close(self):
+        pass
+
+
+class BatchImportDedupTest(unittest.TestCase):
+    FEED = [
+        'trojan://pw@a.example.test:443#节点-a',
+        'trojan://pw@b.example.test:443#节点-b',
+        'ss://YWVzLTI1Ni1nY206cHc@1.1.1.1:8388#节点-c',
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            subscription = Subscription(name='airport', subscription_token='airport-token')
+            db.session.add(subscription)
+            db.session.commit()
+            self.subscription_id = subscription.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _import(self, links, **options):
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            with patch.object(app_module._http_session, 'get', return_value=FakeResponse('\n'.join(links))):
+                response = client.post('/api/nodes/batch-import', json={
+                    'url': 'https://airport.example.test/sub',
+                    'subscription_id': self.subscription_id,
+                    **options
+                })
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()
+
+    def _nodes(self):
+        with app.app_context():
+            return {node.original_name: node.get_config() for node in Node.query.all()}
+
+    def test_reimport_skips_identical_nodes(self):
+        first = self._import(self.FEED)
+        second = self._import(self.FEED + self.FEED[:1])
+
+        self.assertEqual((first['added'], first['skipped']), (3, 0))
+        self.assertEqual((second['added'], second['updated'], second['skipped']), (0, 0, 4))
+        with app.app_context():
+            self.assertEqual(Node.query.count(), 3)
+            self.assertEqual(len(Subscription.query.get(self.subscription_id).nodes), 3)
+
+    def test_changed_node_is_updated_and_manual_name_kept(self):
+        self._import(self.FEED)
+        with app.app_context():
+            node = Node.query.filter_by(original_name='节点-a').first()
+            node.name = '香港 01'
+            db.session.commit()
+
+        # 同一服务器和凭据，传输参数与名称变化视为更新
+        result = self._import([
+            'trojan://pw@a.example.test:443?sni=cdn.example.test#节点-a2',
+            'trojan://pw@b.example.test:443#节点-b2',
+        ] + self.FEED[2:])
+
+        self.assertEqual((result['added'], result['updated'], result['skipped']), (0, 2, 1))
+        with app.app_context():
+            names = {node.original_name: node.name for node in Node.query.all()}
+        self.assertEqual(names, {'节点-a2': '香港 01', '节点-b2': '节点-b2', '节点-c': '节点-c'})
+        self.assertEqual(self._nodes()['节点-a2']['sni'], 'cdn.example.test')
+
+    def test_reimport_keeps_renamed_node_in_subscription(self):
+        self._import(self.FEED)
+        with app.app_context():
+            node_id = Node.query.filter_by(original_name='节点-a').first().id
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            response = client.put(f'/api/nodes/{node_id}', json={'name': '香港 01'})
+            self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+
+        result = self._import(self.FEED)
+
+        self.assertEqual((result['added'], result['updated'], result['skipped']), (0, 0, 3))
+        with app.app_context():
+            node = db.session.get(Node, node_id)
+            self.assertEqual((node.name, node.get_config()['name']), ('香港 01', '香港 01'))
+        with app.test_client() as client:
+            body = client.get('/sub/subscription/airport-token').get_data(as_text=True)
+        self.assertIn('香港 01', body)
+        self.assertNotIn('节点-a', body)
+
+    def test_prune_removes_vanished_nodes_from_group(self):
+        self._import(self.FEED)
+        with app.app_context():
+            manual = Node(name='manual', original_name='manual', protocol='ss', order=99)
+            manual.set_config({'name': 'manual', 'type': 'ss', 'server': '9.9.9.9', 'port': 1,
+                               'cipher': 'aes-128-gcm', 'password': 'p'})
+            manual.subscriptions.append(Subscription.query.get(self.subscription_id))
+            db.session.add(manual)
+            db.session.commit()
+
+        result = self._import(self.FEED[1:], prune=True)
+
+        self.assertEqual(result['pruned'], 1)
+        self.assertEqual(set(self._nodes()), {'节点-b', '节点-c', 'manual'})
+
+    def test_multiple_urls_merge_in_request_order(self):
+        feeds = {
+            'https://a.example.test/sub': self.FEED[:2],
+            'https://b.example.test/sub': self.FEED[1:],
+            'https://down.example.test/sub': None,
+        }
+
+        def fake_get(url, **kwargs):
+            if feeds[url] is None:
+                raise requests.ConnectionError('connection refused')
+            return FakeResponse('\n'.join(feeds[url]))
+
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            with patch.object(app_module._http_session, 'get', side_effect=fake_get):
+                response = client.post('/api/nodes/batch-import', json={
+                    'urls': list(feeds), 'subscription_id': self.subscription_id, 'prune': True
+                })
+
+        result = response.get_json()
+        self.assertEqual(response.status_code, 200, result)
+        self.assertEqual((result['added'], result['skipped']), (3, 1))
+        # 有订阅拉取失败时不执行清理
+        self.assertTrue(result['prune_skipped'])
+        self.assertEqual([source['url'] for source in result['sources']], list(feeds))
+        self.assertEqual([source['count'] for source in result['sources']], [2, 2, 0])
+        self.assertIn('connection refused', result['sources'][2]['error'])
+        with app.app_context():
+            names = [node.original_name for node in Node.query.order_by(Node.order)]
+        self.assertEqual(names, ['节点-a', '节点-b', '节点-c'])
+
+    def test_prune_requires_subscription(self):
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            response = client.post('/api/nodes/batch-import', json={
+                'url': 'https://airport.example.test/sub', 'prune': True
+            })
+
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import shutil
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app, db
+from models import Node, Subscription, User, UserStats
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content.encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for index in range(0, len(self.content), chunk_size):
+            yield self.content[index:index + chunk_size]
+
+    def close(self):
+        pass
+
+
+class BulkInsertTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            subscription = Subscription(name='airport', subscription_token='airport-token')
+            user = User(username='alice', subscription_token='alice-token')
+            user.subscriptions.append(subscription)
+            back = Node(name='back', original_name='back', protocol='vless', order=5)
+            back.set_config({'name': 'back', 'type': 'vless', 'server': 'back.example.test',
+                             'port': 443, 'uuid': 'u', 'udp': True})
+            db.session.add_all([subscription, user, back])
+            db.session.commit()
+            self.subscription_id = subscription.id
+            self.user_id = user.id
+            self.back_id = back.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _post(self, path, payload, statements=None):
+        def count(*args):
+            statements.append(args[2])
+
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            if statements is not None:
+                with app.app_context():
+                    event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                response = client.post(path, json=payload)
+            finally:
+                if statements is not None:
+                    with app.app_context():
+                        event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()
+
+    def _group(self):
+        with app.app_context():
+            nodes = Subscription.query.get(self.subscription_id).nodes
+            return sorted((node.order, node.name) for node in nodes)
+
+    def test_relay_nodes_get_sequential_orders_and_group_links(self):
+        configs = [{'name': f'relay-{index}', 'type': 'relay', 'proxies': ['front', 'back']} for index in range(3)]
+        configs.append({'name': 'broken', 'type': 'relay', 'proxies': ['front']})
+
+        result = self._post('/api/nodes/batch-relay', {'configs': configs, 'subscription_id': self.subscription_id})
+
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(self._group(), [(1024, 'relay-0'), (2048, 'relay-1'), (3072, 'relay-2')])
+        with app.app_context():
+            node = Node.query.filter_by(name='relay-1').first()
+            self.assertEqual((node.protocol, node.config_version, node.subscription_id),
+                             ('relay', 1, self.subscription_id))
+            self.assertEqual(node.get_config()['proxies'], ['front', 'back'])
+            self.assertEqual(db.session.get(UserStats, self.user_id).subscription_node_count, 3)
+
+    def test_dialer_proxy_nodes_copy_back_node(self):
+        configs = [
+            {'name': 'hk-via-front', 'backNodeId': self.back_id, 'frontNodeName': 'front'},
+            {'name': 'missing', 'backNodeId': self.back_id + 100, 'frontNodeName': 'front'},
+        ]
+
+        result = self._post('/api/nodes/batch-dialer-proxy', {
+            'configs': configs, 'subscription_id': self.subscription_id
+        })
+
+        self.assertEqual(result['count'], 1)
+        with app.app_context():
+            node = Node.query.filter_by(name='hk-via-front').first()
+            config = node.get_config()
+            self.assertEqual((node.protocol, node.dialer_proxy, node.server), ('vless', 'front', 'back.example.test'))
+            self.assertEqual(node.chain_dependency_names, ['front', 'back'])
+            self.assertEqual((config['disable-udp'], 'udp' in config), (True, False))
+
+    def test_ids_come_from_inserted_rows_not_matching_orders(self):
+        configs = [{'name': f'relay-{index}', 'type': 'relay', 'proxies': ['front', 'back']} for index in range(3)]
+        payload = {'configs': configs, 'subscription_id': self.subscription_id}
+        self._post('/api/nodes/batch-relay', payload)
+        with app.app_context():
+            # 下一批第二个节点将分配到的排序值上已有一个同名节点
+            decoy = Node(name='relay-1', original_name='relay-1', protocol='relay', order=5 * 1024)
+            decoy.set_config({'name': 'relay-1', 'type': 'relay', 'proxies': ['front', 'back']})
+            db.session.add(decoy)
+            db.session.commit()
+            decoy_id = decoy.id
+
+        for supports_returning in (True, False):
+            with self.subTest(supports_returning=supports_returning):
+                with app.app_context():
+                    dialect = db.engine.dialect
+                # 关闭 RETURNING 时模拟 MySQL：只能逐行插入读取自增 ID
+                with patch.object(dialect, 'insert_executemany_returning', supports_returning), \
+                        patch.object(dialect, 'insert_returning', supports_returning):
+                    self._post('/api/nodes/batch-relay', payload)
+
+                with app.app_context():
+                    linked = {node.id for node in Subscription.query.get(self.subscription_id).nodes}
+                self.assertNotIn(decoy_id, linked)
+        self.assertEqual(len(self._group()), 9)
+
+    def test_import_inserts_in_batches(self):
+        links = [f'trojan://pw@{index}.example.test:443#node-{index}' for index in range(1200)]
+        statements = []
+        with patch.object(app_module._http_session, 'get', return_value=FakeResponse('\n'.join(links))):
+            result = self._post('/api/nodes/batch-import', {
+                'url': 'https://airport.example.test/sub',
+                'subscription_id': self.subscription_id,
+                'save_source': True,
+            }, statements)
+
+        self.assertEqual(result['added'], 1200)
+        node_inserts = [sql for sql in statements if sql.startswith('INSERT INTO nodes ')]
+        link_inserts = [sql for sql in statements if sql.startswith('INSERT INTO subscription_node ')]
+        self.assertTrue(1 <= len(node_inserts) <= 3)
+        self.assertLessEqual(len(link_inserts), 3)
+        with app.app_context():
+            orders = [order for order, in db.session.query(Node.order).filter(Node.id != self.back_id).order_by(Node.id)]
+            self.assertEqual(orders, [index * 1024 for index in range(1, 1201)])
+            self.assertEqual(Node.query.filter(Node.upstream_source_id.isnot(None)).count(), 1200)
+            self.assertEqual(db.session.get(UserStats, self.user_id).subscription_node_count, 1200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from app import _dump_clash_config, _dump_json_yaml_bytes, _dump_yaml_bytes
+from generator import ClashConfigGenerator
+
+
+def proxies(count=3):
+    return [
+        {
+            'name': f'node-{index}', 'type': 'ss', 'server': f'10.0.0.{index}', 'port': 8388,
+            'cipher': 'aes-256-gcm', 'password': f'pw-{index}'
+        }
+        for index in range(count)
+    ] + [{
+        'name': 'hidden-front', 'type': 'trojan', 'server': 'front.example.test', 'port': 443,
+        'password': 'front', '__hidden': True
+    }]
+
+
+class ClashConfigGeneratorStaticSectionsTest(unittest.TestCase):
+    def test_default_sections_are_built_once_per_group_name(self):
+        first = ClashConfigGenerator().generate(proxies(), '🚀 A')
+        second = ClashConfigGenerator().generate(proxies(5), '🚀 A')
+        other = ClashConfigGenerator().generate(proxies(), '🚀 B')
+
+        self.assertIs(first['dns'], second['dns'])
+        self.assertIs(first['rules'], second['rules'])
+        self.assertIsNot(first['rules'], other['rules'])
+        self.assertIn('MATCH,🐟 漏网之鱼', first['rules'])
+        self.assertIn('DOMAIN-KEYWORD,google,🚀 B', other['rules'])
+        self.assertEqual(first['proxy-groups'][0]['proxies'][2:], ['node-0', 'node-1', 'node-2'])
+
+    def test_spliced_output_matches_full_dump(self):
+        for style, dump in (('block', _dump_yaml_bytes), ('json', _dump_json_yaml_bytes)):
+            with self.subTest(style=style):
+                # 第二次调用命中静态段字节缓存，同样需要与整体序列化一致。
+                for count in (3, 7):
+                    generator = ClashConfigGenerator()
+                    config = generator.generate(proxies(count), '🚀 splice')
+                    self.assertEqual(_dump_clash_config(generator, config, style), dump(config))
+
+    def test_modified_or_template_config_falls_back_to_full_dump(self):
+        generator = ClashConfigGenerator()
+        config = generator.generate(proxies(), '🚀 modified')
+        config['mode'] = 'global'
+        self.assertIsNone(generator.split_static_sections(config))
+        self.assertEqual(_dump_clash_config(generator, config), _dump_yaml_bytes(config))
+
+        template_generator = ClashConfigGenerator()
+        template_config = template_generator.generate(
+            proxies(),
+            '🚀 template',
+            'proxies: []\nproxy-groups:\n  - name: g\n    type: select\n    proxies: [PROXY_NODES]\n'
+        )
+        self.assertIsNone(template_generator.split_static_sections(template_config))
+
+
+if __name__ == '__main__':
+    unittest.main()
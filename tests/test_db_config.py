@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+
+from app import app, db
+from db_config import get_database_uri, get_engine_options, install_sqlite_pragmas
+
+
+class DatabaseConfigTest(unittest.TestCase):
+    def test_uri_and_pool_options_come_from_environment(self):
+        env = {'DATABASE_URL': 'postgres://user:pw@db.example.test/clash', 'DB_POOL_SIZE': '20', 'DB_POOL_RECYCLE': '1800'}
+        with patch.dict(os.environ, env):
+            uri = get_database_uri()
+            options = get_engine_options(uri)
+
+        self.assertEqual(uri, 'postgresql://user:pw@db.example.test/clash')
+        self.assertEqual(options, {'pool_pre_ping': True, 'pool_size': 20, 'pool_recycle': 1800})
+        self.assertEqual(get_engine_options('sqlite://'), {})
+
+    def test_invalid_pragma_setting_is_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{Path(tmp) / 'bad.db'}")
+            install_sqlite_pragmas(engine)
+            with patch.dict(os.environ, {'SQLITE_JOURNAL_MODE': 'wal; DROP TABLE nodes'}):
+                with self.assertRaises(ValueError):
+                    engine.connect()
+            engine.dispose()
+
+    def test_sqlite_connections_use_wal_and_do_not_block_readers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            uri = f"sqlite:///{Path(tmp) / 'wal.db'}"
+            engine = create_engine(uri, **get_engine_options(uri))
+            install_sqlite_pragmas(engine)
+            with engine.begin() as conn:
+                conn.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY)'))
+                conn.execute(text('INSERT INTO items VALUES (1)'))
+
+            writer = engine.connect()
+            writer.begin()
+            writer.execute(text('INSERT INTO items VALUES (2)'))
+            try:
+                # 写事务未提交时，另一个线程的读取立即返回已提交的数据
+                counts = []
+                reader = threading.Thread(
+                    target=lambda: counts.append(engine.connect().execute(text('SELECT COUNT(*) FROM items')).scalar())
+                )
+                reader.start()
+                reader.join(timeout=2)
+                with engine.connect() as conn:
+                    pragmas = {
+                        name: conn.execute(text(f'PRAGMA {name}')).scalar()
+                        for name in ('journal_mode', 'synchronous', 'busy_timeout')
+                    }
+            finally:
+                writer.rollback()
+                writer.close()
+                engine.dispose()
+
+        self.assertEqual(counts, [1])
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000})
+
+    @unittest.skipUnless(get_database_uri().startswith('sqlite'), '仅 SQLite 使用连接 PRAGMA')
+    def test_app_engine_has_pragmas_installed(self):
+        with app.app_context():
+            self.assertTrue(install_sqlite_pragmas(db.engine))
+            self.assertEqual(db.session.execute(text('PRAGMA synchronous')).scalar(), 1)
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    unittest.main()
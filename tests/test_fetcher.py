@@ -0,0 +1,109 @@
+import concurrent.futures
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from fetcher import SourceResult, fetch_and_parse_many, merge_source_results
+from parsers import ProxyParser
+
+
+class FakeResponse:
+    def __init__(self, content, delay=0.0):
+        self.content = content.encode('utf-8')
+        self.delay = delay
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        # 按行分块，模拟上游缓慢逐段返回
+        for line in self.content.splitlines(keepends=True):
+            time.sleep(self.delay)
+            yield line
+
+    def close(self):
+        pass
+
+
+class ConcurrentFetchTest(unittest.TestCase):
+    def test_results_follow_input_order_and_run_concurrently(self):
+        delays = {'https://slow.example.test': 0.3, 'https://fast.example.test': 0.0}
+        session = MagicMock()
+        session.get.side_effect = lambda url, **kwargs: FakeResponse(
+            f'trojan://pw@{url[8:]}:443#{url[8:12]}', delays[url]
+        )
+        completed = []
+
+        started = time.monotonic()
+        results = fetch_and_parse_many(list(delays), session=session, on_result=completed.append)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual([result.url for result in completed], ['https://fast.example.test', 'https://slow.example.test'])
+        self.assertEqual([result.proxies[0]['name'] for result in results], ['slow', 'fast'])
+        self.assertLess(elapsed, 0.55)
+
+    def test_timeout_bounds_whole_download(self):
+        session = MagicMock()
+        session.get.return_value = FakeResponse('trojan://pw@a.example.test:443#a\n' * 20, delay=0.05)
+
+        result, = fetch_and_parse_many(['https://drip.example.test'], session=session, timeout=0.1)
+
+        self.assertFalse(result.ok)
+        self.assertEqual(result.proxies, [])
+
+    def test_failed_source_is_reported(self):
+        session = MagicMock()
+        session.get.side_effect = requests.ConnectionError('refused')
+
+        result, = fetch_and_parse_many(['https://down.example.test'], session=session)
+
+        self.assertEqual(result.error, 'refused')
+
+    def test_parse_error_is_reported_per_source(self):
+        session = MagicMock()
+        session.get.side_effect = lambda url, **kwargs: FakeResponse(f'trojan://pw@{url[8:]}:443#{url[8:12]}')
+        iter_subscription = ProxyParser.iter_subscription
+
+        def flaky(chunks, *args, **kwargs):
+            chunks = list(chunks)
+            if b'broken' in b''.join(chunks):
+                raise ValueError('bad port')
+            return iter_subscription(chunks, *args, **kwargs)
+
+        with patch.object(ProxyParser, 'iter_subscription', side_effect=flaky):
+            broken, good = fetch_and_parse_many(['https://broken.example.test', 'https://good.example.test'],
+                                                session=session)
+
+        self.assertEqual((broken.ok, broken.proxies), (False, []))
+        self.assertIn('bad port', broken.error)
+        self.assertEqual([proxy['name'] for proxy in good.proxies], ['good'])
+
+    def test_sources_share_one_parse_pool(self):
+        urls = [f'https://{name}.example.test' for name in ('aaaa', 'bbbb', 'cccc')]
+        session = MagicMock()
+        session.get.side_effect = lambda url, **kwargs: FakeResponse(
+            '\n'.join(f'trojan://pw@{url[8:]}:{443 + index}#{url[8:12]}-{index}' for index in range(3))
+        )
+        pool_class = concurrent.futures.ProcessPoolExecutor
+
+        with patch('fetcher.ProcessPoolExecutor', wraps=pool_class) as shared_pool, \
+                patch.object(concurrent.futures, 'ProcessPoolExecutor', side_effect=AssertionError('per-source pool')):
+            results = fetch_and_parse_many(urls, session=session, max_workers=3, workers=2)
+
+        self.assertEqual(shared_pool.call_count, 1)
+        self.assertEqual([[proxy['name'] for proxy in result.proxies] for result in results],
+                         [[f'{url[8:12]}-{index}' for index in range(3)] for url in urls])
+
+    def test_merge_renames_duplicate_names(self):
+        results = [
+            SourceResult(0, 'a', [{'name': 'hk'}, {'name': 'hk 2'}]),
+            SourceResult(1, 'b', [{'name': 'hk'}, {'name': 'jp'}]),
+        ]
+
+        self.assertEqual([proxy['name'] for proxy in merge_source_results(results)], ['hk', 'hk 2', 'hk 3', 'jp'])
+
+
+if __name__ == '__main__':
+    unittest.main()
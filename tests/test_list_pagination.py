@@ -0,0 +1,152 @@
+import shutil
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import app as app_module
+from app import app, db
+from models import Node, Subscription, User, UserNode
+from pagination import decode_cursor, encode_cursor
+
+
+class CursorTest(unittest.TestCase):
+    def test_cursor_round_trip(self):
+        created = datetime(2026, 1, 2, 3, 4, 5)
+        for value in ('香港 01', 7, created, None):
+            self.assertEqual(decode_cursor(encode_cursor(value, 42)), (value, 42))
+
+    def test_invalid_cursor_is_rejected(self):
+        for cursor in ('not-base64!', encode_cursor('x', 'id'), 'W10'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class ListPaginationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            airport = Subscription(name='airport', subscription_token='airport-token')
+            nodes = []
+            for index in range(25):
+                node = Node(name=f'node-{index:02d}', original_name=f'node-{index:02d}',
+                            protocol='vless' if index % 3 else 'trojan', order=index % 5)
+                node.set_config({'name': node.name, 'type': node.protocol, 'server': f'{index}.example.test',
+                                 'port': 443, 'uuid': 'u'})
+                if index < 10:
+                    node.subscriptions.append(airport)
+                nodes.append(node)
+            db.session.add_all(nodes)
+            for index in range(23):
+                user = User(username=f'user-{index:02d}', subscription_token=f'token-{index}',
+                            enabled=index % 4 != 0, remark='vip' if index % 5 == 0 else None)
+                if index % 2 == 0:
+                    user.subscriptions.append(airport)
+                db.session.add(user)
+            db.session.flush()
+
+            user = User.query.filter_by(username='user-00').first()
+            expired_ms = int(time.time() * 1000) - 1000
+            db.session.add_all([
+                # 与订阅节点重复的直分节点只计一次
+                UserNode(user_id=user.id, node_id=nodes[0].id, traffic_used=100),
+                UserNode(user_id=user.id, node_id=nodes[20].id, traffic_used=50),
+                UserNode(user_id=user.id, node_id=nodes[21].id, expiry_time=expired_ms),
+                UserNode(user_id=user.id, node_id=nodes[22].id, traffic_limit=10, traffic_used=10),
+            ])
+            db.session.commit()
+            self.airport_id = airport.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _get(self, path):
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            return client.get(path)
+
+    def _walk(self, path):
+        items, cursor, pages = [], '', 0
+        while cursor is not None:
+            separator = '&' if '?' in path else '?'
+            data = self._get(f'{path}{separator}limit=7&cursor={cursor}').get_json()
+            items.extend(data['items'])
+            cursor = data['next_cursor']
+            pages += 1
+        return items, pages
+
+    def test_users_cursor_walks_every_row_once(self):
+        users, pages = self._walk('/api/users?sort=username&direction=desc')
+
+        names = [user['username'] for user in users]
+        self.assertEqual(pages, 4)
+        self.assertEqual(names, sorted((f'user-{index:02d}' for index in range(23)), reverse=True))
+
+    def test_users_filters(self):
+        enabled = self._get('/api/users?limit=100&enabled=0').get_json()['items']
+        keyword = self._get('/api/users?limit=100&q=VIP').get_json()['items']
+        grouped = self._get(f'/api/users?limit=100&subscription_id={self.airport_id}&enabled=1').get_json()['items']
+        invalid = self._get('/api/users?limit=100&enabled=maybe')
+
+        self.assertEqual([user['username'] for user in enabled],
+                         ['user-00', 'user-04', 'user-08', 'user-12', 'user-16', 'user-20'])
+        self.assertEqual(len(keyword), 5)
+        self.assertEqual(len(grouped), 6)
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_user_counters_match_relationships(self):
+        user = self._get('/api/users?limit=1').get_json()['items'][0]
+        with app.app_context():
+            expected = app_module._serialize_users([User.query.get(user['id'])])[0]
+
+        self.assertEqual(user, expected)
+        self.assertEqual(user['username'], 'user-00')
+        self.assertEqual(user['subscription_count'], 1)
+        self.assertEqual(user['subscription_node_count'], 10)
+        self.assertEqual((user['direct_node_count'], user['direct_node_total_count']), (2, 4))
+        self.assertEqual(user['node_count'], 11)
+        self.assertEqual(user['traffic_used'], 160)
+
+        single = self._get(f"/api/users/{user['id']}").get_json()
+        self.assertEqual(single, user)
+
+    def test_nodes_cursor_with_filters(self):
+        nodes, _ = self._walk('/api/nodes?protocol=vless')
+        ordered, _ = self._walk('/api/nodes')
+        bad_cursor = self._get('/api/nodes?cursor=abc')
+
+        self.assertEqual(len(nodes), 16)
+        self.assertTrue(all(node['protocol'] == 'vless' for node in nodes))
+        keys = [(node['order'], node['id']) for node in ordered]
+        self.assertEqual(len(keys), 25)
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(bad_cursor.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, event, inspect, text
+
+import migrations
+from models import db
+
+LEGACY_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY, username VARCHAR(80) UNIQUE NOT NULL, password_hash VARCHAR(128) NOT NULL,
+        subscription_token VARCHAR(64) UNIQUE NOT NULL, custom_slug VARCHAR(100), enabled BOOLEAN DEFAULT 1,
+        template_id INTEGER, created_at DATETIME
+    )""",
+    "CREATE TABLE subscriptions (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, subscription_token VARCHAR(64))",
+    """CREATE TABLE nodes (
+        id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, original_name VARCHAR(100), protocol VARCHAR(20),
+        config TEXT NOT NULL, subscription_id INTEGER, "order" INTEGER DEFAULT 0, created_at DATETIME
+    )""",
+    """CREATE TABLE xui_configs (
+        id INTEGER PRIMARY KEY, base_url VARCHAR(255) NOT NULL, auth_mode VARCHAR(20), username VARCHAR(120),
+        password VARCHAR(255), api_token TEXT, verify_ssl BOOLEAN, timeout INTEGER, updated_at DATETIME
+    )""",
+]
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{Path(self.tmp.name) / 'migrate.db'}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def _columns(self, table):
+        return {column['name'] for column in inspect(self.engine).get_columns(table)}
+
+    def _versions(self):
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(text('SELECT version FROM schema_version ORDER BY version'))]
+
+    def test_fresh_database_is_stamped_and_boot_checks_one_version(self):
+        self.assertEqual(migrations.upgrade(self.engine, db.metadata), [])
+        self.assertEqual(self._versions(), [number for number, _, _ in migrations.MIGRATIONS])
+        self.assertIn('server', self._columns('nodes'))
+
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        self.assertEqual(migrations.upgrade(self.engine, db.metadata), [])
+
+        self.assertEqual(len(statements), 1)
+        self.assertIn('FROM schema_version', statements[0])
+
+    def test_legacy_database_runs_every_migration_once(self):
+        config = {'name': 'hk', 'type': 'vless', 'server': 'hk.example.test', 'port': 443, 'uuid': 'u',
+                  'dialer-proxy': 'front'}
+        with self.engine.begin() as conn:
+            for ddl in LEGACY_SCHEMA:
+                conn.execute(text(ddl))
+            conn.execute(text("INSERT INTO users (username, password_hash, subscription_token) VALUES ('a', 'x', 't')"))
+            conn.execute(text("INSERT INTO nodes (name, protocol, config) VALUES ('hk', 'vless', :config)"),
+                         {'config': json.dumps(config)})
+            conn.execute(text("INSERT INTO xui_configs (base_url) VALUES ('https://panel.example.test/panel')"))
+
+        applied = migrations.upgrade(self.engine, db.metadata)
+
+        self.assertEqual(applied, [number for number, _, _ in migrations.MIGRATIONS])
+        self.assertNotIn('password_hash', self._columns('users'))
+        self.assertTrue({'remark', 'traffic_limit', 'output_style'} <= self._columns('users'))
+        self.assertIn('user_stats', inspect(self.engine).get_table_names())
+        with self.engine.connect() as conn:
+            node = conn.execute(text('SELECT fingerprint, dialer_proxy, server, port FROM nodes')).one()
+            xui = conn.execute(text('SELECT name, public_host FROM xui_configs')).one()
+        identity = ['vless', 'hk.example.test', '443', 'u', '', '', 'front']
+        self.assertEqual(node.fingerprint, hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest())
+        self.assertEqual((node.dialer_proxy, node.server, node.port), ('front', 'hk.example.test', 443))
+        self.assertEqual(tuple(xui), ('默认后端 1', 'panel.example.test'))
+        self.assertEqual(migrations.upgrade(self.engine, db.metadata), [])
+
+    def test_backfill_does_not_depend_on_models(self):
+        # 回填算法固定在迁移里，模型的指纹算法变化不影响已发布迁移的结果
+        with patch('models.Node.compute_fingerprint', return_value='changed'):
+            self.test_legacy_database_runs_every_migration_once()
+
+    def test_only_newer_migrations_run(self):
+        migrations.upgrade(self.engine, db.metadata)
+        calls = []
+
+        def add_column(conn):
+            calls.append(conn)
+            conn.execute(text('ALTER TABLE nodes ADD COLUMN note TEXT'))
+
+        extra = (migrations.latest_version() + 1, '测试字段', add_column)
+        with patch.object(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [extra]):
+            self.assertEqual(migrations.upgrade(self.engine, db.metadata), [extra[0]])
+            self.assertEqual(migrations.upgrade(self.engine, db.metadata), [])
+
+        self.assertEqual(len(calls), 1)
+        self.assertIn('note', self._columns('nodes'))
+
+    def test_failed_migration_is_not_recorded(self):
+        migrations.upgrade(self.engine, db.metadata)
+
+        def broken(conn):
+            conn.execute(text('ALTER TABLE nodes ADD COLUMN note TEXT'))
+            raise RuntimeError('boom')
+
+        extra = (migrations.latest_version() + 1, '失败的迁移', broken)
+        with patch.object(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [extra]):
+            with self.assertRaises(RuntimeError):
+                migrations.upgrade(self.engine, db.metadata)
+
+        self.assertNotIn(extra[0], self._versions())
+        self.assertNotIn('note', self._columns('nodes'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import shutil
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import models
+from app import app, db
+from models import Node
+
+
+class NodeConfigCacheTest(unittest.TestCase):
+    CONFIG = {
+        'name': 'chain', 'type': 'vless', 'server': 'hk.example.test', 'port': '443', 'uuid': 'u',
+        'ws-opts': {'path': '/ray', 'headers': {'Host': 'cdn.example.test'}},
+        'dialer-proxy': 'front', '__chain_dependencies': ['front', 'back', 'front'],
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        models._config_cache.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            node = Node(name='chain', original_name='chain', protocol='vless')
+            node.set_config(self.CONFIG)
+            db.session.add(node)
+            db.session.commit()
+            self.node_id = node.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def test_hot_columns_are_extracted(self):
+        with app.app_context():
+            node = db.session.get(Node, self.node_id)
+            self.assertEqual((node.server, node.port, node.dialer_proxy), ('hk.example.test', 443, 'front'))
+            self.assertEqual(node.chain_dependency_names, ['front', 'back'])
+            self.assertEqual(node.config_version, 1)
+            self.assertNotIn(', ', node.config)
+            self.assertEqual(Node.query.filter_by(server='hk.example.test').count(), 1)
+
+    def test_cached_config_is_parsed_once_and_copied(self):
+        with app.app_context():
+            node = db.session.get(Node, self.node_id)
+            with patch.object(models.json, 'loads', wraps=models.json.loads) as loads:
+                first = node.get_config()
+                first['ws-opts']['headers']['Host'] = 'changed'
+                second = node.get_config()
+
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(second, self.CONFIG)
+
+    def test_update_counter_invalidates_cache(self):
+        with app.app_context():
+            node = db.session.get(Node, self.node_id)
+            node.get_config()
+            node.set_config(dict(self.CONFIG, server='sg.example.test'))
+            db.session.commit()
+            self.assertEqual(node.get_config()['server'], 'sg.example.test')
+            self.assertEqual((node.server, node.config_version), ('sg.example.test', 2))
+
+    def test_reused_id_does_not_hit_stale_entry(self):
+        with app.app_context():
+            node = db.session.get(Node, self.node_id)
+            node.get_config()
+            db.session.delete(node)
+            db.session.commit()
+
+            reused = Node(id=self.node_id, name='other', original_name='other', protocol='ss')
+            reused.set_config({'name': 'other', 'type': 'ss', 'server': '1.1.1.1', 'port': 1})
+            db.session.add(reused)
+            db.session.commit()
+            self.assertEqual(db.session.get(Node, self.node_id).get_config()['name'], 'other')
+
+    def test_cache_is_bounded(self):
+        with patch.object(models, 'NODE_CONFIG_CACHE_SIZE', 2):
+            for node_id in range(1, 6):
+                node = Node(id=node_id, name='n', protocol='ss', config='{"name":"n"}', config_version=1)
+                node.get_config()
+
+        self.assertEqual(list(models._config_cache), [(4, 1), (5, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import shutil
+import unittest
+from pathlib import Path
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app, db
+from models import Node, Subscription, User, UserNode
+
+
+class NodeListingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            airport = Subscription(name='airport', subscription_token='airport-token')
+            backup = Subscription(name='backup', subscription_token='backup-token')
+            alice = User(username='alice', subscription_token='alice-token')
+            bob = User(username='bob', subscription_token='bob-token')
+            alice.subscriptions.append(airport)
+            db.session.add_all([airport, backup, alice, bob])
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _create_nodes(self, count, prefix='node'):
+        with app.app_context():
+            airport = Subscription.query.filter_by(name='airport').first()
+            backup = Subscription.query.filter_by(name='backup').first()
+            for index in range(count):
+                protocol = 'ss' if index % 2 else 'trojan'
+                config = {'name': f'{prefix}-{index:03d}', 'type': protocol,
+                          'server': f'{prefix}-{index}.example.test', 'port': 443, 'password': 'pw'}
+                if index % 5 == 4:
+                    config['dialer-proxy'] = f'{prefix}-000'
+                node = Node(name=config['name'], original_name=config['name'], protocol=protocol, order=count - index)
+                node.set_config(config)
+                if index % 3 == 0:
+                    node.subscriptions.append(airport)
+                if index % 4 == 0:
+                    node.subscriptions.append(backup)
+                db.session.add(node)
+            db.session.flush()
+            bob = User.query.filter_by(username='bob').first()
+            db.session.add(UserNode(user_id=bob.id, node_id=Node.query.filter_by(name=f'{prefix}-000').first().id))
+            db.session.commit()
+
+    def _get(self, query=''):
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            with app.test_client() as client:
+                with client.session_transaction() as session:
+                    session['admin_id'] = 1
+                response = client.get(f'/api/nodes{query}')
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', count)
+        return response, len(statements)
+
+    def test_listing_matches_relationships(self):
+        self._create_nodes(12)
+
+        response, _ = self._get()
+
+        nodes = {node['name']: node for node in response.get_json()}
+        self.assertEqual(len(nodes), 12)
+        self.assertEqual(nodes['node-000']['subscription_names'], ['airport', 'backup'])
+        self.assertEqual(nodes['node-000']['user_names'], ['alice', 'bob'])
+        self.assertEqual(nodes['node-004']['subscription_name'], 'backup')
+        self.assertEqual(nodes['node-004']['dialer_proxy'], 'node-000')
+        self.assertEqual(nodes['node-001']['subscription_name'], '手动添加')
+        self.assertEqual(nodes['node-001']['user_names'], [])
+        # 默认按 order 升序
+        self.assertEqual(next(iter(nodes)), 'node-011')
+
+    def test_query_count_does_not_grow_with_nodes(self):
+        self._create_nodes(10)
+        _, small = self._get('?page=1&per_page=10')
+        self._create_nodes(60, prefix='more')
+        _, large = self._get('?page=1&per_page=70')
+
+        self.assertEqual(small, large)
+
+    def test_pagination_filter_and_sort(self):
+        self._create_nodes(30)
+        with app.app_context():
+            airport_id = Subscription.query.filter_by(name='airport').first().id
+
+        page, _ = self._get('?page=2&per_page=4&sort=name')
+        trojan, _ = self._get('?page=1&per_page=100&protocol=trojan&q=NODE-01')
+        grouped, _ = self._get(f'?page=1&per_page=100&subscription_id={airport_id}')
+        manual, _ = self._get('?page=1&per_page=100&subscription_id=none')
+        chained, _ = self._get('?chain=1')
+        invalid, _ = self._get('?page=0')
+
+        data = page.get_json()
+        self.assertEqual((data['total'], data['pages'], data['page']), (30, 8, 2))
+        self.assertEqual([node['name'] for node in data['items']], ['node-004', 'node-005', 'node-006', 'node-007'])
+        self.assertEqual({node['name'] for node in trojan.get_json()['items']},
+                         {'node-010', 'node-012', 'node-014', 'node-016', 'node-018'})
+        self.assertEqual(grouped.get_json()['total'], 10)
+        self.assertTrue(all(node['subscription_name'] == '手动添加' for node in manual.get_json()['items']))
+        self.assertEqual(len(chained.get_json()), 6)
+        self.assertEqual(invalid.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import shutil
+import threading
+import unittest
+from pathlib import Path
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app, db
+from models import Node, Sequence
+
+
+class NodeOrderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            # 旧数据的排序值是连续的小整数
+            for index in range(1, 4):
+                node = Node(name=f'legacy-{index}', original_name=f'legacy-{index}', protocol='ss', order=index)
+                node.set_config({'name': node.name, 'type': 'ss', 'server': f'{index}.example.test', 'port': 1,
+                                 'cipher': 'aes-128-gcm', 'password': 'p'})
+                db.session.add(node)
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _client(self):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['admin_id'] = 1
+        return client
+
+    def _create(self, client, name):
+        response = client.post('/api/nodes', json={'url': f'trojan://pw@{name}.example.test:443#{name}'})
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()['id']
+
+    def _listing(self):
+        with app.app_context():
+            return [node.name for node in Node.query.order_by(db.func.coalesce(Node.order, 0), Node.id)]
+
+    def _capture(self, action):
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            result = action()
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', count)
+        return result, statements
+
+    def test_new_nodes_follow_existing_without_max_scan(self):
+        client = self._client()
+        self._create(client, 'first')
+        _, statements = self._capture(lambda: self._create(client, 'second'))
+
+        self.assertFalse([sql for sql in statements if 'max(' in sql.lower()])
+        with app.app_context():
+            orders = {node.name: node.order for node in Node.query.all()}
+            self.assertEqual(db.session.get(Sequence, app_module.NODE_ORDER_SEQUENCE).value, 2)
+        self.assertEqual((orders['first'], orders['second']), (1024, 2048))
+        self.assertEqual(self._listing()[-2:], ['first', 'second'])
+
+    def test_concurrent_allocations_do_not_overlap(self):
+        ranges = []
+        errors = []
+        barrier = threading.Barrier(4)
+
+        def allocate():
+            try:
+                with app.app_context():
+                    barrier.wait()
+                    for _ in range(5):
+                        first = app_module._allocate_node_orders(10)
+                        db.session.commit()
+                        ranges.append(first)
+                    db.session.remove()
+            except Exception as e:  # pragma: no cover - 失败时在主线程报告
+                errors.append(e)
+
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        step = app_module.NODE_ORDER_STEP
+        self.assertEqual(sorted(ranges), [(index * 10 + 1) * step for index in range(20)])
+
+    def test_move_between_sparse_neighbours_updates_one_row(self):
+        client = self._client()
+        ids = [self._create(client, name) for name in ('a', 'b', 'c')]
+
+        response, statements = self._capture(
+            lambda: client.put(f'/api/nodes/{ids[2]}', json={'after_id': ids[0]})
+        )
+
+        self.assertEqual(response.get_json()['order'], 1536)
+        self.assertEqual(len([sql for sql in statements if sql.startswith('UPDATE nodes')]), 1)
+        self.assertEqual(self._listing()[3:], ['a', 'c', 'b'])
+
+    def test_move_without_gap_pushes_dense_run_only(self):
+        client = self._client()
+        with app.app_context():
+            legacy_ids = [node.id for node in Node.query.order_by(Node.order)]
+        tail = self._create(client, 'tail')
+
+        client.put(f'/api/nodes/{tail}', json={'before_id': legacy_ids[1]})
+        front = client.put(f'/api/nodes/{legacy_ids[2]}', json={'after_id': None})
+
+        self.assertEqual(self._listing(), ['legacy-3', 'legacy-1', 'tail', 'legacy-2'])
+        self.assertEqual(front.get_json()['order'], 1 - app_module.NODE_ORDER_STEP)
+        with app.app_context():
+            orders = {node.name: node.order for node in Node.query.all()}
+        self.assertEqual((orders['legacy-1'], orders['tail'], orders['legacy-2']), (1, 2, 3))
+
+    def test_move_rejects_unknown_anchor(self):
+        client = self._client()
+        node_id = self._create(client, 'a')
+
+        missing = client.put(f'/api/nodes/{node_id}', json={'after_id': 999})
+        itself = client.put(f'/api/nodes/{node_id}', json={'before_id': node_id})
+        raw_order = client.put(f'/api/nodes/{node_id}', json={'order': 1024})
+
+        self.assertEqual((missing.status_code, itself.status_code, raw_order.status_code), (400, 400, 400))
+
+
+if __name__ == '__main__':
+    unittest.main()
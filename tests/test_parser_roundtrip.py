@@ -0,0 +1,45 @@
+import unittest
+
+from bench_parsers import PROXY_GENERATORS, generate_proxies
+from parsers import ProxyParser
+
+
+class ShareLinkRoundTripTest(unittest.TestCase):
+    CASES_PER_PROTOCOL = 200
+
+    def test_generated_configs_survive_export_and_parse(self):
+        for protocol in PROXY_GENERATORS:
+            for proxy in generate_proxies(protocol, self.CASES_PER_PROTOCOL, seed=2024):
+                link = ProxyParser.to_share_url(proxy)
+                parsed = ProxyParser.parse_proxy(link)
+                if parsed != proxy:
+                    # 只在失败时进入 subTest，避免成功用例刷屏
+                    with self.subTest(protocol=protocol, link=link):
+                        self.assertEqual(parsed, proxy)
+
+    def test_reality_and_ss2022_edge_cases(self):
+        cases = [
+            {
+                'name': 'reality', 'type': 'vless', 'server': 'reality.example.test', 'port': 443,
+                'uuid': '00000000-0000-4000-8000-000000000001', 'network': 'tcp', 'tls': True,
+                'flow': 'xtls-rprx-vision', 'servername': 'www.microsoft.com', 'client-fingerprint': 'chrome',
+                'reality-opts': {'public-key': 'jNXHt1yRo0vDuchQlIP6Z0ZvjT3KtzVI-T4E7RoLJS0', 'short-id': '0123abcd'},
+            },
+            {
+                'name': 'ss2022 多用户', 'type': 'ss', 'server': '2001:db8::1', 'port': 8443,
+                'cipher': '2022-blake3-aes-256-gcm',
+                'password': 'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=:BBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBB=',
+            },
+            {
+                'name': 'ssr 备注', 'type': 'ssr', 'server': 'ssr.example.test', 'port': 443,
+                'cipher': 'aes-256-cfb', 'password': 'p+w/d', 'protocol': 'auth_aes128_md5',
+                'obfs': 'tls1.2_ticket_auth', 'protocol-param': '1:abc', 'obfs-param': 'cdn.example.test',
+            },
+        ]
+        for proxy in cases:
+            with self.subTest(name=proxy['name']):
+                self.assertEqual(ProxyParser.parse_proxy(ProxyParser.to_share_url(proxy)), proxy)
+
+
+if __name__ == '__main__':
+    unittest.main()
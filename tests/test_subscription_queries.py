@@ -0,0 +1,105 @@
+import re
+import shutil
+import unittest
+from pathlib import Path
+
+import yaml
+
+import app as app_module
+from app import app, db
+from models import Node, Subscription, User, UserNode
+
+
+class UserSubscriptionQueryCountTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _create_user(self, token, subscription_count, custom_slug=None):
+        with app.app_context():
+            user = User(username=token, subscription_token=token, custom_slug=custom_slug, enabled=True)
+            for index in range(subscription_count):
+                subscription = Subscription(name=f'{token}-{index}', subscription_token=f'{token}-sub-{index}')
+                for position in range(3):
+                    local = index * 3 + position
+                    config = {
+                        'name': f'{token}-node-{local}', 'type': 'trojan',
+                        'server': f'{token}-{local}.example.test', 'port': 443, 'password': 'pw'
+                    }
+                    # 越晚创建的节点 order 越小，输出顺序与订阅、主键顺序相反
+                    node = Node(name=config['name'], original_name=config['name'], protocol='trojan',
+                                order=subscription_count * 3 - local)
+                    node.set_config(config)
+                    subscription.nodes.append(node)
+                user.subscriptions.append(subscription)
+            if subscription_count > 1:
+                # 同一节点同时出现在两个订阅里，输出时只保留一次
+                user.subscriptions[-1].nodes.append(user.subscriptions[0].nodes[0])
+            direct = Node(name=f'{token}-direct', original_name=f'{token}-direct', protocol='trojan', order=-1)
+            direct.set_config({'name': direct.name, 'type': 'trojan', 'server': f'{token}.example.test',
+                               'port': 443, 'password': 'pw'})
+            db.session.add_all([user, direct])
+            db.session.flush()
+            db.session.add(UserNode(user_id=user.id, node_id=direct.id))
+            db.session.commit()
+
+    def _fetch(self, path):
+        with self.assertLogs(app.logger, level='INFO') as logs:
+            with app.test_client() as client:
+                response = client.get(path)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        timing = [line for line in logs.output if 'subscription cache=' in line][-1]
+        return response, int(re.search(r'queries=(\d+)', timing).group(1))
+
+    def test_query_count_does_not_grow_with_subscriptions(self):
+        self._create_user('small', 2)
+        self._create_user('large', 10)
+
+        small_response, small_queries = self._fetch('/sub/user/small')
+        large_response, large_queries = self._fetch('/sub/user/large')
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertLessEqual(large_queries, 8)
+        names = [proxy['name'] for proxy in yaml.safe_load(large_response.data.decode('utf-8'))['proxies']]
+        # 直接分配的节点 order 最小排在最前，订阅节点合并去重后整体按 order 排序
+        self.assertEqual(names, ['large-direct'] + [f'large-node-{local}' for local in range(29, -1, -1)])
+
+    def test_custom_slug_takes_precedence_over_token(self):
+        self._create_user('owner', 1, custom_slug='shared')
+        self._create_user('shared', 1)
+
+        response, _ = self._fetch('/sub/user/shared')
+
+        names = [proxy['name'] for proxy in yaml.safe_load(response.data.decode('utf-8'))['proxies']]
+        self.assertIn('owner-direct', names)
+
+
+if __name__ == '__main__':
+    unittest.main()
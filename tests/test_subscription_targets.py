@@ -0,0 +1,288 @@
+import base64
+import json
+import shutil
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import yaml
+from flask import Flask
+
+import app as app_module
+from app import app, db
+from models import Node, Sequence, Subscription, Template, User
+
+
+class SubscriptionTargetsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+
+            configs = [
+                {
+                    'name': 'ss-node', 'type': 'ss', 'server': '1.1.1.1', 'port': 8388,
+                    'cipher': 'aes-256-gcm', 'password': 'secret'
+                },
+                {
+                    'name': 'vless-node', 'type': 'vless', 'server': 'vless.example.test', 'port': 443,
+                    'uuid': '00000000-0000-4000-8000-000000000001', 'network': 'ws', 'tls': True,
+                    'servername': 'vless.example.test',
+                    'ws-opts': {'path': '/ws', 'headers': {'Host': 'cdn.example.test'}}
+                },
+                {
+                    'name': 'front-node', 'type': 'trojan', 'server': 'front.example.test', 'port': 443,
+                    'password': 'front'
+                },
+                {
+                    'name': 'chain-node', 'type': 'ss', 'server': '2.2.2.2', 'port': 8388,
+                    'cipher': 'aes-256-gcm', 'password': 'chain', 'dialer-proxy': 'front-node',
+                    '__chain_dependencies': ['front-node']
+                },
+            ]
+            nodes = []
+            for order, config in enumerate(configs):
+                node = Node(name=config['name'], original_name=config['name'], protocol=config['type'], order=order)
+                node.set_config(config)
+                nodes.append(node)
+
+            subscription = Subscription(name='group', subscription_token='group-token')
+            # front-node 不在订阅内，只能作为链式依赖隐藏输出。
+            subscription.nodes = [nodes[0], nodes[1], nodes[3]]
+            user = User(username='tester', subscription_token='user-token', enabled=True)
+            user.subscriptions = [subscription]
+            db.session.add_all(nodes + [subscription, user])
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def test_base64_target_lists_share_links_for_visible_nodes(self):
+        with app.test_client() as client:
+            response = client.get('/sub/user/user-token?target=base64')
+
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+        links = base64.b64decode(response.data).decode('utf-8').split('\n')
+        self.assertEqual(len(links), 2)
+        self.assertTrue(links[0].startswith('ss://'))
+        self.assertTrue(links[1].startswith('vless://'))
+
+    def test_singbox_target_maps_chain_to_detour(self):
+        with app.test_client() as client:
+            response = client.get('/sub/user/user-token?target=sing-box')
+
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        config = json.loads(response.data.decode('utf-8'))
+        outbounds = {outbound['tag']: outbound for outbound in config['outbounds']}
+        selector = config['outbounds'][0]
+        self.assertEqual(selector['type'], 'selector')
+        self.assertEqual(config['route']['final'], selector['tag'])
+        self.assertIn('chain-node', selector['outbounds'])
+        self.assertNotIn('front-node', selector['outbounds'])
+        self.assertEqual(outbounds['chain-node']['detour'], 'front-node')
+        self.assertEqual(outbounds['front-node']['type'], 'trojan')
+        self.assertEqual(outbounds['vless-node']['transport'], {
+            'type': 'ws', 'path': '/ws', 'headers': {'Host': 'cdn.example.test'}
+        })
+
+    def test_targets_share_cached_proxy_list(self):
+        with patch(
+            'app._build_proxy_entries_with_chain_dependencies',
+            wraps=app_module._build_proxy_entries_with_chain_dependencies
+        ) as build_proxies:
+            with app.test_client() as client:
+                clash_response = client.get('/sub/user/user-token')
+                base64_response = client.get('/sub/user/user-token?target=base64')
+                repeat_response = client.get('/sub/user/user-token?target=base64')
+
+        self.assertEqual(build_proxies.call_count, 1)
+        self.assertEqual(clash_response.headers['X-Subscription-Cache'], 'MISS')
+        self.assertEqual(base64_response.headers['X-Subscription-Cache'], 'PARTIAL')
+        self.assertEqual(repeat_response.headers['X-Subscription-Cache'], 'HIT')
+        self.assertNotEqual(clash_response.headers['ETag'], base64_response.headers['ETag'])
+        config = yaml.safe_load(clash_response.data.decode('utf-8'))
+        self.assertEqual([proxy['name'] for proxy in config['proxies']],
+                         ['ss-node', 'vless-node', 'chain-node', 'front-node'])
+
+    def test_json_output_style_is_valid_yaml_with_stable_etag(self):
+        with app.app_context():
+            template = Template(
+                name='json-template',
+                content='mode: rule\nproxies: []\nproxy-groups:\n  - name: 节点\n    type: select\n    proxies: [PROXY_NODES]\n',
+                output_style='json'
+            )
+            db.session.add(template)
+            db.session.commit()
+            user = User.query.filter_by(subscription_token='user-token').first()
+            user.template_id = template.id
+            db.session.commit()
+
+        with app.test_client() as client:
+            first = client.get('/sub/user/user-token')
+            app_module._invalidate_subscription_cache('test-rerender')
+            second = client.get('/sub/user/user-token')
+
+        self.assertEqual(first.status_code, 200, first.get_data(as_text=True))
+        self.assertEqual(second.headers['X-Subscription-Cache'], 'MISS')
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        body = first.data.decode('utf-8')
+        self.assertEqual(json.loads(body), yaml.safe_load(body))
+        self.assertEqual(json.loads(body)['proxy-groups'][0]['proxies'], ['ss-node', 'vless-node', 'chain-node'])
+
+    def test_user_output_style_overrides_template(self):
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            with app.app_context():
+                user_id = User.query.filter_by(subscription_token='user-token').first().id
+            invalid = client.put(f'/api/users/{user_id}', json={'output_style': 'xml'})
+            invalid_template = client.post('/api/templates', json={
+                'name': 'xml', 'content': 'proxies: []', 'output_style': 'xml'
+            })
+            updated = client.put(f'/api/users/{user_id}', json={'output_style': 'json'})
+            response = client.get('/sub/user/user-token')
+
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(invalid_template.get_json()['message'], '输出风格只能是 block 或 json')
+        self.assertEqual(updated.status_code, 200)
+        self.assertIsInstance(json.loads(response.data.decode('utf-8')), dict)
+
+    def _node_id(self, name):
+        with app.app_context():
+            return Node.query.filter_by(name=name).first().id
+
+    def _fresh_body(self, client, url):
+        app_module._invalidate_subscription_cache('test-fresh')
+        response = client.get(url)
+        self.assertEqual(response.headers['X-Subscription-Cache'], 'MISS')
+        return response.data
+
+    def test_node_config_edit_patches_cached_subscriptions(self):
+        node_id = self._node_id('ss-node')
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            before = client.get('/sub/user/user-token')
+            client.get('/sub/user/user-token?target=base64')
+            with app.app_context():
+                config = Node.query.get(node_id).get_config()
+            config['password'] = 'rotated'
+            updated = client.put(f'/api/nodes/{node_id}/config', json={'config': config})
+            after = client.get('/sub/user/user-token')
+            base64_after = client.get('/sub/user/user-token?target=base64')
+            fresh = self._fresh_body(client, '/sub/user/user-token')
+
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(after.headers['X-Subscription-Cache'], 'HIT')
+        self.assertEqual(base64_after.headers['X-Subscription-Cache'], 'PARTIAL')
+        self.assertNotEqual(before.headers['ETag'], after.headers['ETag'])
+        self.assertEqual(after.data, fresh)
+        proxies = {proxy['name']: proxy for proxy in yaml.safe_load(after.data.decode('utf-8'))['proxies']}
+        self.assertEqual(proxies['ss-node']['password'], 'rotated')
+
+    def test_write_from_another_instance_invalidates_local_cache(self):
+        with app.test_client() as client:
+            client.get('/sub/user/user-token')
+            cached = client.get('/sub/user/user-token')
+            # 另一个实例修改数据后递增共享缓存代数
+            with app.app_context():
+                node = Node.query.filter_by(name='ss-node').first()
+                config = node.get_config()
+                config['password'] = 'from-other-instance'
+                node.set_config(config)
+                db.session.commit()
+                with db.engine.begin() as conn:
+                    app_module._advance_sequence(app_module.SUBSCRIPTION_CACHE_SEQUENCE, 1, executor=conn)
+            after = client.get('/sub/user/user-token')
+
+        self.assertEqual(cached.headers['X-Subscription-Cache'], 'HIT')
+        self.assertEqual(after.headers['X-Subscription-Cache'], 'MISS')
+        proxies = {proxy['name']: proxy for proxy in yaml.safe_load(after.data.decode('utf-8'))['proxies']}
+        self.assertEqual(proxies['ss-node']['password'], 'from-other-instance')
+
+    def test_publish_uses_active_app_database(self):
+        other = Flask('other-instance')
+        other.config.update(SQLALCHEMY_DATABASE_URI='sqlite://')
+        db.init_app(other)
+        with other.app_context():
+            db.create_all()
+            app_module._invalidate_subscription_cache('other-app')
+            other_generation = db.session.get(Sequence, app_module.SUBSCRIPTION_CACHE_SEQUENCE).value
+        with app.app_context():
+            shared = db.session.get(Sequence, app_module.SUBSCRIPTION_CACHE_SEQUENCE)
+
+        self.assertEqual(other_generation, 1)
+        self.assertIsNone(shared)
+
+    def test_node_rename_updates_proxy_groups(self):
+        node_id = self._node_id('vless-node')
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            client.get('/sub/user/user-token')
+            updated = client.put(f'/api/nodes/{node_id}', json={'name': 'vless-renamed'})
+            after = client.get('/sub/user/user-token')
+            fresh = self._fresh_body(client, '/sub/user/user-token')
+
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(after.headers['X-Subscription-Cache'], 'HIT')
+        self.assertEqual(after.data, fresh)
+        config = yaml.safe_load(after.data.decode('utf-8'))
+        self.assertEqual(config['proxy-groups'][0]['proxies'][2:], ['ss-node', 'vless-renamed', 'chain-node'])
+
+    def test_chain_dependency_change_rebuilds_subscription(self):
+        chain_id = self._node_id('chain-node')
+        front_id = self._node_id('front-node')
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            client.get('/sub/user/user-token')
+            # 隐藏依赖节点按名称解析，改名后依赖关系可能变化，需要完整重建。
+            client.put(f'/api/nodes/{front_id}', json={'name': 'front-renamed'})
+            after_front_rename = client.get('/sub/user/user-token')
+
+            with app.app_context():
+                config = Node.query.get(chain_id).get_config()
+            config['dialer-proxy'] = 'ss-node'
+            config['__chain_dependencies'] = ['ss-node']
+            client.put(f'/api/nodes/{chain_id}/config', json={'config': config})
+            after_chain_edit = client.get('/sub/user/user-token')
+
+        self.assertEqual(after_front_rename.headers['X-Subscription-Cache'], 'MISS')
+        self.assertEqual(after_chain_edit.headers['X-Subscription-Cache'], 'MISS')
+        names = [proxy['name'] for proxy in yaml.safe_load(after_chain_edit.data.decode('utf-8'))['proxies']]
+        self.assertEqual(names, ['ss-node', 'vless-node', 'chain-node'])
+
+    def test_unknown_target_is_rejected(self):
+        with app.test_client() as client:
+            response = client.get('/sub/subscription/group-token?target=quantumult')
+
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import shutil
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import app as app_module
+from app import app, db
+from models import Node, Subscription, UpstreamSource
+from parsers import ProxyParser
+
+
+class FakeResponse:
+    def __init__(self, content='', status_code=200, headers=None):
+        self.content = content.encode('utf-8')
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for index in range(0, len(self.content), chunk_size):
+            yield self.content[index:index + chunk_size]
+
+    def close(self):
+        pass
+
+
+class UpstreamSourceRefreshTest(unittest.TestCase):
+    FEED = '\n'.join([
+        'trojan://pw@a.example.test:443#节点-a',
+        'trojan://pw@b.example.test:443#节点-b',
+    ])
+
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            subscription = Subscription(name='airport', subscription_token='airport-token')
+            source = UpstreamSource(name='airport', url='https://airport.example.test/sub', subscription=subscription)
+            db.session.add_all([subscription, source])
+            db.session.commit()
+            self.source_id = source.id
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _refresh(self, response, force=False):
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            with patch.object(app_module._http_session, 'get', return_value=response) as get:
+                result = client.post(f'/api/upstream-sources/{self.source_id}/refresh', json={'force': force})
+        return result.get_json(), get.call_args.kwargs['headers']
+
+    def _node_names(self):
+        with app.app_context():
+            return sorted(node.original_name for node in UpstreamSource.query.get(self.source_id).nodes)
+
+    def test_conditional_refresh_skips_unchanged_feeds(self):
+        first, first_headers = self._refresh(FakeResponse(self.FEED, headers={'ETag': '"v1"'}))
+        self.assertEqual((first['status'], first['added']), ('changed', 2))
+        self.assertEqual(first_headers, {})
+
+        with patch.object(ProxyParser, 'iter_subscription') as parse:
+            not_modified, headers = self._refresh(FakeResponse(status_code=304))
+            # 服务端不支持条件请求时，靠内容哈希识别未变化
+            unchanged, _ = self._refresh(FakeResponse(self.FEED))
+        parse.assert_not_called()
+        self.assertEqual(headers, {'If-None-Match': '"v1"'})
+        self.assertEqual(not_modified['status'], 'not_modified')
+        self.assertEqual(unchanged['status'], 'unchanged')
+
+        with app.app_context():
+            source = UpstreamSource.query.get(self.source_id)
+            self.assertEqual(source.last_status, 'unchanged')
+            self.assertEqual(len(source.subscription.nodes), 2)
+
+    def test_changed_feed_applies_diff_to_source_nodes(self):
+        self._refresh(FakeResponse(self.FEED))
+        with app.app_context():
+            node_a = Node.query.filter_by(original_name='节点-a').first().id
+
+        changed, _ = self._refresh(FakeResponse('\n'.join([
+            'trojan://pw@a.example.test:443?sni=a.example.test#节点-a',
+            'trojan://pw@c.example.test:443#节点-c',
+        ])))
+
+        self.assertEqual((changed['added'], changed['updated'], changed['pruned']), (1, 1, 1))
+        self.assertEqual(self._node_names(), ['节点-a', '节点-c'])
+        with app.app_context():
+            self.assertEqual(Node.query.filter_by(original_name='节点-a').first().id, node_a)
+
+    def test_empty_feed_keeps_nodes(self):
+        self._refresh(FakeResponse(self.FEED))
+
+        result, _ = self._refresh(FakeResponse('<html>maintenance</html>'))
+
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(self._node_names(), ['节点-a', '节点-b'])
+        with app.app_context():
+            self.assertIsNone(UpstreamSource.query.get(self.source_id).content_hash)
+
+    def test_batch_import_can_save_source(self):
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session['admin_id'] = 1
+            with patch.object(app_module._http_session, 'get', return_value=FakeResponse(self.FEED)):
+                response = client.post('/api/nodes/batch-import', json={
+                    'url': 'https://other.example.test/sub', 'save_source': True, 'refresh_interval': 600
+                })
+            invalid = client.post('/api/nodes/batch-import', json={
+                'url': 'https://other.example.test/sub', 'save_source': True, 'refresh_interval': 5
+            })
+            sources = client.get('/api/upstream-sources').get_json()
+
+        self.assertEqual(invalid.status_code, 400)
+        saved = next(source for source in sources if source['id'] == response.get_json()['source_id'])
+        self.assertEqual((saved['refresh_interval'], saved['node_count']), (600, 2))
+
+    def test_refresh_due_only_touches_due_sources(self):
+        with app.app_context():
+            recent = UpstreamSource(
+                name='recent', url='https://recent.example.test/sub',
+                last_checked_at=datetime.utcnow() - timedelta(seconds=10)
+            )
+            db.session.add(recent)
+            db.session.commit()
+
+            with patch.object(app_module._http_session, 'get', return_value=FakeResponse(self.FEED)) as get:
+                results = app_module.refresh_due_upstream_sources()
+
+        self.assertEqual(list(results), [self.source_id])
+        self.assertEqual(get.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import shutil
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app, db
+from models import Node, Subscription, User, UserNode, UserStats
+
+
+class UserStatsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config.update(TESTING=True)
+        cls.db_path = Path(app.instance_path) / 'clash_manager.db'
+        cls.backup_path = cls.db_path.with_suffix('.db.test-backup')
+        cls.db_existed = cls.db_path.exists()
+        if cls.db_existed:
+            shutil.copy2(cls.db_path, cls.backup_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if cls.db_existed:
+            shutil.copy2(cls.backup_path, cls.db_path)
+            cls.backup_path.unlink(missing_ok=True)
+        else:
+            cls.db_path.unlink(missing_ok=True)
+
+    def setUp(self):
+        app_module._invalidate_subscription_cache('test-setup')
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            airport = Subscription(name='airport', subscription_token='airport-token')
+            backup = Subscription(name='backup', subscription_token='backup-token')
+            nodes = []
+            for index in range(4):
+                node = Node(name=f'node-{index}', original_name=f'node-{index}', protocol='trojan', order=index)
+                node.set_config({'name': node.name, 'type': 'trojan', 'server': f'{index}.example.test',
+                                 'port': 443, 'password': 'pw'})
+                nodes.append(node)
+            airport.nodes.extend(nodes[:2])
+            backup.nodes.extend(nodes[1:3])
+            user = User(username='alice', subscription_token='alice-token')
+            db.session.add_all([airport, backup, user] + nodes)
+            db.session.commit()
+            self.user_id = user.id
+            self.airport_id = airport.id
+            self.backup_id = backup.id
+            self.node_ids = [node.id for node in nodes]
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+
+    def _client(self):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['admin_id'] = 1
+        return client
+
+    def _stats(self):
+        with app.app_context():
+            stats = db.session.get(UserStats, self.user_id)
+            return None if stats is None else {
+                'subscription_count': stats.subscription_count,
+                'subscription_node_count': stats.subscription_node_count,
+                'direct_node_count': stats.direct_node_count,
+                'node_count': stats.node_count,
+                'traffic_used': stats.traffic_used,
+            }
+
+    def test_counters_follow_assignment_changes(self):
+        client = self._client()
+        self.assertEqual(self._stats()['node_count'], 0)
+
+        client.post(f'/api/users/{self.user_id}/subscriptions', json={
+            'subscription_ids': [self.airport_id, self.backup_id]
+        })
+        self.assertEqual(self._stats(), {
+            'subscription_count': 2, 'subscription_node_count': 3, 'direct_node_count': 0,
+            'node_count': 3, 'traffic_used': 0
+        })
+
+        # 分组节点变化只修改分组一侧，也要更新分组内用户的统计
+        client.post(f'/api/subscriptions/{self.backup_id}/nodes', json={'node_ids': [self.node_ids[3]]})
+        self.assertEqual(self._stats()['subscription_node_count'], 3)
+        client.post(f'/api/subscriptions/{self.airport_id}/nodes', json={'node_ids': []})
+        self.assertEqual(self._stats()['subscription_node_count'], 1)
+
+        # 直分节点通过批量删除重建，重复节点只计一次
+        client.post(f'/api/users/{self.user_id}/nodes', json={'assignments': [
+            {'node_id': self.node_ids[3], 'traffic_used': 30},
+            {'node_id': self.node_ids[0], 'traffic_used': 12},
+        ]})
+        self.assertEqual(self._stats(), {
+            'subscription_count': 2, 'subscription_node_count': 1, 'direct_node_count': 2,
+            'node_count': 2, 'traffic_used': 42
+        })
+
+        client.delete(f'/api/nodes/{self.node_ids[3]}')
+        self.assertEqual(self._stats()['node_count'], 1)
+
+        client.delete(f'/api/subscriptions/{self.backup_id}')
+        self.assertEqual(self._stats()['subscription_count'], 1)
+
+    def test_deleting_user_removes_stats(self):
+        self._client().delete(f'/api/users/{self.user_id}')
+
+        self.assertIsNone(self._stats())
+
+    def test_rollback_discards_pending_changes(self):
+        with app.app_context():
+            user = db.session.get(User, self.user_id)
+            user.subscriptions.append(db.session.get(Subscription, self.airport_id))
+            db.session.flush()
+            db.session.rollback()
+
+        self.assertEqual(self._stats()['subscription_count'], 0)
+
+    def test_expired_assignment_is_recounted_on_listing(self):
+        now_ms = int(time.time() * 1000)
+        with app.app_context():
+            db.session.add(UserNode(user_id=self.user_id, node_id=self.node_ids[0], expiry_time=now_ms + 60000))
+            db.session.commit()
+            self.assertEqual(db.session.get(UserStats, self.user_id).valid_until, now_ms + 60000)
+
+        client = self._client()
+        self.assertEqual(client.get('/api/users').get_json()[0]['direct_node_count'], 1)
+        with patch.object(app_module.time, 'time', return_value=now_ms / 1000 + 120):
+            listed = client.get('/api/users').get_json()[0]
+            # 读请求不写库，过期的统计由后台补齐
+            self.assertEqual(self._stats()['direct_node_count'], 1)
+            with app.app_context():
+                self.assertEqual(app_module.backfill_user_stats(), 1)
+
+        self.assertEqual((listed['direct_node_count'], listed['node_count']), (0, 0))
+        self.assertEqual(self._stats()['direct_node_count'], 0)
+
+    def test_missing_rows_are_backfilled_at_startup_not_on_listing(self):
+        with app.app_context():
+            db.session.query(UserStats).delete()
+            db.session.commit()
+
+        listed = self._client().get('/api/users').get_json()[0]
+        self.assertEqual(listed['node_count'], 0)
+        self.assertIsNone(self._stats())
+
+        with patch('builtins.print'):
+            app_module.init_db()
+        self.assertEqual(self._stats()['node_count'], 0)
+
+    def test_listing_reads_one_row_per_user(self):
+        with app.app_context():
+            for index in range(30):
+                user = User(username=f'user-{index}', subscription_token=f'token-{index}')
+                user.subscriptions.append(db.session.get(Subscription, self.airport_id))
+                db.session.add(user)
+            db.session.commit()
+
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        client = self._client()
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            users = client.get('/api/users?limit=100').get_json()['items']
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(len(users), 31)
+        self.assertEqual(users[-1]['node_count'], 2)
+        self.assertLessEqual(len(statements), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()